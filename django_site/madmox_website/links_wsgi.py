@@ -0,0 +1,17 @@
+"""
+WSGI config of the share download links server.
+
+It exposes the WSGI callable as a module-level variable named ``application``,
+to be mounted under DJANGO_SHARE_LINK_URL apart from the site itself (see
+share.linkserver).
+"""
+
+import os
+from core.tools import set_env_vars
+
+projdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+set_env_vars(projdir)
+
+import django
+django.setup()
+from share.linkserver import application
@@ -9,7 +9,6 @@ https://docs.djangoproject.com/en/1.6/ref/settings/
 """
 
 import os
-import sys
 from django.conf.global_settings import TEMPLATE_CONTEXT_PROCESSORS as TCP
 from core.tools import get_env_var
 
@@ -25,7 +24,6 @@ ALLOWED_HOSTS = get_env_var('DJANGO_ALLOWED_HOSTS').splitlines()
 TEMPLATE_DIRS = [os.path.join(BASE_DIR, 'templates')]
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = '/'
-RUNNING_DEVSERVER = (len(sys.argv) > 1 and sys.argv[1] == 'runserver')
 
 # Emailing
 
@@ -14,4 +14,5 @@ projdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 set_env_vars(projdir)
 
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
+from share.serving import use_file_wrapper
+application = use_file_wrapper(get_wsgi_application())
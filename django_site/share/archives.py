@@ -0,0 +1,275 @@
+"""
+On the fly ZIP archives of shared directories.
+
+The directory tree is walked once, while the archive is sent: each file is
+stated when its turn comes, its local header sent at once, then its content
+(stored without compression), then its CRC in a data descriptor. Only the
+central directory, written at the end, is kept in memory: the first byte is
+sent right away, whatever the number and size of the files. Entries bigger
+than 4 Go, or located beyond, use ZIP64 extensions.
+
+The layout of the archive is only known once it is sent: archives have no
+length, validators nor byte ranges. Symbolic links to directories are not
+followed, so that loops and links out of the directory are left out.
+"""
+
+import logging
+import posixpath
+import stat
+import struct
+import time
+import zlib
+
+from django.http import StreamingHttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks read from files
+BLOCK_SIZE = 64 * 1024
+
+# Sizes, offsets and entries count from which ZIP64 records are needed
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_ENTRIES_LIMIT = 0xFFFF
+
+# Value of 32 bits fields whose actual value is in a ZIP64 record
+ZIP32_MAX = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+# Bit 3: CRC and sizes in a data descriptor, bit 11: UTF-8 names
+FLAGS = 0x0808
+VERSION_ZIP32 = 20
+VERSION_ZIP64 = 45
+# Upper byte: Unix attributes
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR_32 = struct.Struct('<IIII')
+DATA_DESCRIPTOR_64 = struct.Struct('<IIQQ')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+ZIP64_END = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+END = struct.Struct('<IHHHHIIH')
+
+
+def dos_date_time(mtime):
+    """
+    Converts a timestamp in nanoseconds to MS-DOS date and time, clamped to
+    the years it can hold (1980 to 2107)
+    """
+    try:
+        t = time.localtime(mtime // 10 ** 9)
+    except (OverflowError, ValueError, OSError):
+        # Out of the range of the platform
+        t = None
+    if t is None and mtime > 0 or t is not None and t.tm_year > 2107:
+        return (127 << 9) | (12 << 5) | 31, (23 << 11) | (59 << 5) | 29
+    if t is None or t.tm_year < 1980:
+        return (1 << 5) | 1, 0
+    date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return date, dos_time
+
+
+class ZipEntry:
+    """A file or directory of the archive, and its offset in it"""
+
+    def __init__(self, node, arcname, offset):
+        self.path = node.path
+        self.isdir = node.isdir
+        self.size = 0 if node.isdir else node.size
+        self.mtime = node.mtime
+        self.name = arcname.encode('utf-8')
+        if self.isdir:
+            self.name += b'/'
+        self.offset = offset
+        self.zip64 = self.size >= ZIP64_LIMIT or offset >= ZIP64_LIMIT
+        self.crc = 0
+
+    @property
+    def flags(self):
+        return 0x0800 if self.isdir else FLAGS
+
+    @property
+    def version(self):
+        return VERSION_ZIP64 if self.zip64 else VERSION_ZIP32
+
+    @property
+    def external_attributes(self):
+        if self.isdir:
+            # Unix mode, and MS-DOS directory flag
+            return ((stat.S_IFDIR | 0o755) << 16) | 0x10
+        return (stat.S_IFREG | 0o644) << 16
+
+    def local_header(self):
+        date, dos_time = dos_date_time(self.mtime)
+        if self.zip64:
+            # Sizes are given by the data descriptor, but the extra field
+            # tells readers they are 64 bits long
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            sizes = ZIP32_MAX
+        else:
+            extra = b''
+            sizes = 0
+        return LOCAL_HEADER.pack(
+            0x04034b50, self.version, self.flags, 0, dos_time, date,
+            0, sizes, sizes, len(self.name), len(extra)
+        ) + self.name + extra
+
+    @property
+    def descriptor_size(self):
+        if self.isdir:
+            return 0
+        if self.zip64:
+            return DATA_DESCRIPTOR_64.size
+        return DATA_DESCRIPTOR_32.size
+
+    def data_descriptor(self):
+        if self.zip64:
+            return DATA_DESCRIPTOR_64.pack(
+                0x08074b50, self.crc, self.size, self.size
+            )
+        return DATA_DESCRIPTOR_32.pack(
+            0x08074b50, self.crc, self.size, self.size
+        )
+
+    def central_header(self):
+        date, dos_time = dos_date_time(self.mtime)
+        if self.zip64:
+            extra = struct.pack(
+                '<HHQQQ', 0x0001, 24, self.size, self.size, self.offset
+            )
+            size = offset = ZIP32_MAX
+        else:
+            extra = b''
+            size, offset = self.size, self.offset
+        return CENTRAL_HEADER.pack(
+            0x02014b50, VERSION_MADE_BY, self.version, self.flags, 0,
+            dos_time, date, self.crc, size, size, len(self.name), len(extra),
+            0, 0, 0, self.external_attributes, offset
+        ) + self.name + extra
+
+    def iter_data(self, f):
+        """Yields the file content read from f, updating its CRC"""
+        self.crc = 0
+        remaining = self.size
+        with f:
+            while remaining > 0:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    # Truncated since its header was sent: pad it to keep the
+                    # archive readable
+                    logger.warning('%s was truncated', self.path)
+                    data = bytes(min(BLOCK_SIZE, remaining))
+                remaining -= len(data)
+                self.crc = zlib.crc32(data, self.crc)
+                yield data
+
+
+class ZipStream:
+    """
+    A ZIP archive of a directory node and all its descendants, produced by
+    blocks while the tree is walked
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.entries_count = 0
+        self.central_directory = []
+        self.central_directory_offset = 0
+        self.central_directory_size = 0
+
+    def walk(self):
+        """
+        Yields the archive name and node of the directory and its descendants,
+        depth first. Symbolic links to directories are skipped.
+        """
+        stack = [(self.node.name, self.node)]
+        while stack:
+            arcname, node = stack.pop()
+            yield arcname, node
+            if not node.isdir:
+                continue
+            try:
+                node_children = node.children
+            except OSError:
+                logger.warning('%s skipped from the archive', node.path)
+                continue
+            children = []
+            for child in node_children:
+                if child.isdir and posixpath.islink(child.path):
+                    continue
+                children.append(
+                    (posixpath.join(arcname, child.name), child)
+                )
+            # Popped in listing order
+            stack.extend(reversed(children))
+
+    @property
+    def zip64(self):
+        return (
+            self.entries_count >= ZIP64_ENTRIES_LIMIT or
+            self.central_directory_offset >= ZIP64_LIMIT or
+            self.central_directory_size >= ZIP64_LIMIT
+        )
+
+    def end(self):
+        records = b''
+        if self.zip64:
+            zip64_end_offset = (
+                self.central_directory_offset + self.central_directory_size
+            )
+            records += ZIP64_END.pack(
+                0x06064b50, ZIP64_END.size - 12, VERSION_MADE_BY,
+                VERSION_ZIP64, 0, 0, self.entries_count, self.entries_count,
+                self.central_directory_size, self.central_directory_offset
+            )
+            records += ZIP64_LOCATOR.pack(0x07064b50, 0, zip64_end_offset, 1)
+        return records + END.pack(
+            0x06054b50, 0, 0,
+            min(self.entries_count, ZIP32_MAX_ENTRIES),
+            min(self.entries_count, ZIP32_MAX_ENTRIES),
+            min(self.central_directory_size, ZIP32_MAX),
+            min(self.central_directory_offset, ZIP32_MAX),
+            0
+        )
+
+    def iter_blocks(self):
+        offset = 0
+        for arcname, node in self.walk():
+            try:
+                entry = ZipEntry(node, arcname, offset)
+                f = None if entry.isdir else open(entry.path, 'rb')
+            except OSError:
+                # Removed or unreadable since it was listed
+                logger.warning('%s skipped from the archive', node.path)
+                continue
+            header = entry.local_header()
+            yield header
+            offset += len(header)
+            if not entry.isdir:
+                for data in entry.iter_data(f):
+                    yield data
+                descriptor = entry.data_descriptor()
+                yield descriptor
+                offset += entry.size + len(descriptor)
+            central_header = entry.central_header()
+            self.central_directory.append(central_header)
+            self.central_directory_size += len(central_header)
+            self.entries_count += 1
+
+        self.central_directory_offset = offset
+        for central_header in self.central_directory:
+            yield central_header
+        yield self.end()
+
+
+def serve_archive(request, node):
+    """Returns a response streaming the ZIP archive of a directory node"""
+    response = StreamingHttpResponse(
+        ZipStream(node).iter_blocks(), content_type='application/zip'
+    )
+    response['Content-Disposition'] = (
+        'attachment; filename="{0}.zip"'
+    ).format(node.name)
+    return response
@@ -0,0 +1,364 @@
+"""
+asyncio download server of the shared files.
+
+With the 'async' download backend, Django only checks a download request and
+redirects the client to this server, which sends the file. A download then
+costs a coroutine and a few buffers instead of a WSGI worker, so that slow
+clients can't starve the site.
+
+The server runs in its own process (see the 'runsharedownloads' management
+command), behind the front web server forwarding SHARE_ASYNC_URL to it. Paths
+are resolved like in the views, and clients are authenticated with their
+Django session cookie: only users with the share.can_browse permission are
+served. Conditional and single range requests are honored like in
+share.serving.
+
+Files are read by a small thread pool, and each block is only read once the
+previous one was handed to the client: writes wait for the transport buffer
+to drain below its high-water mark, so a slow client never makes the server
+buffer more than a few blocks.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+from importlib import import_module
+import logging
+import os
+import time
+from urllib.parse import unquote
+
+from django.conf import settings as django_settings
+from django.contrib.auth import get_user
+from django.core.urlresolvers import reverse
+from django.db import close_old_connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.http import http_date
+
+from share.mime import mime_type_cache
+from share.serving import (
+    get_etag,
+    is_not_modified,
+    is_range_fresh,
+    parse_range_header
+)
+from share.settings import SHARE_ASYNC_URL
+from share.utils import path_resolver
+
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+
+# Bytes buffered for a client before writes wait for it
+WRITE_BUFFER_LIMIT = 4 * BLOCK_SIZE
+
+# Longest request line or header line, and most headers per request
+MAX_LINE_SIZE = 8 * 1024
+MAX_HEADERS = 100
+
+# Seconds a client has to send its request (or the next one on a kept alive
+# connection), and to read the data already sent
+REQUEST_TIMEOUT = 30
+SEND_TIMEOUT = 300
+
+# Seconds a session permission check is cached
+PERMISSION_CACHE_DURATION = 60
+PERMISSION_CACHE_SIZE = 10000
+
+# Threads reading files and checking sessions
+WORKERS = 8
+
+
+class BadRequest(Exception):
+    """Raised when a request can't be parsed"""
+    pass
+
+
+class Request:
+    """
+    An HTTP request, with the META dict of Django requests so that the
+    share.serving helpers apply
+    """
+
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.path = target.partition('?')[0]
+        self.version = version
+        self.META = dict(
+            ('HTTP_' + name.upper().replace('-', '_'), value)
+            for name, value in headers.items()
+        )
+
+    @property
+    def keep_alive(self):
+        connection = self.META.get('HTTP_CONNECTION', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+def check_permission(session_key):
+    """
+    Returns whether the user of a session may browse the share, None if the
+    session is anonymous. Blocking: the session and the user come from the
+    database.
+    """
+    close_old_connections()
+    try:
+        engine = import_module(django_settings.SESSION_ENGINE)
+        request = HttpRequest()
+        request.session = engine.SessionStore(session_key)
+        user = get_user(request)
+        if not user.is_authenticated():
+            return None
+        return user.has_perm('share.can_browse')
+    finally:
+        close_old_connections()
+
+
+def open_file(path):
+    """
+    Returns the open file, stat result, content type and name of the shared
+    file at a URL path, or None if there is none. Blocking.
+    """
+    node = path_resolver.get_node(path)
+    if node is None or node.isdir:
+        return None
+    f = open(node.path, 'rb')
+    st = os.fstat(f.fileno())
+    return f, st, mime_type_cache.get(node.path, st), node.name
+
+
+class DownloadServer:
+    """
+    Serves the shared files below a URL prefix, to the clients allowed to
+    browse the share
+    """
+
+    def __init__(self, prefix=SHARE_ASYNC_URL, workers=WORKERS, loop=None):
+        self.prefix = prefix
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(workers)
+        self._permissions = {}
+
+    def run_in_executor(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    @asyncio.coroutine
+    def start(self, host, port):
+        """Starts listening, returns the asyncio server"""
+        return (yield from asyncio.start_server(
+            self.handle, host, port, limit=MAX_LINE_SIZE
+        ))
+
+    @asyncio.coroutine
+    def handle(self, reader, writer):
+        """Serves the requests of a connection until it is closed"""
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_LIMIT)
+        try:
+            while True:
+                try:
+                    request = yield from asyncio.wait_for(
+                        self.read_request(reader), REQUEST_TIMEOUT
+                    )
+                except BadRequest:
+                    yield from self.respond(writer, None, 400)
+                    break
+                if request is None:
+                    break
+                yield from self.serve(request, writer)
+                if not request.keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            # Gone or stalled client
+            pass
+        except Exception:
+            logger.exception('Download failed')
+        finally:
+            writer.close()
+
+    @asyncio.coroutine
+    def read_request(self, reader):
+        """Returns the next request, or None if the connection was closed"""
+        try:
+            line = yield from reader.readline()
+            if not line:
+                return None
+            try:
+                method, target, version = line.decode('latin-1').split()
+            except ValueError:
+                raise BadRequest()
+            headers = {}
+            for i in range(MAX_HEADERS + 1):
+                line = yield from reader.readline()
+                if not line:
+                    return None
+                if line in (b'\r\n', b'\n'):
+                    break
+                name, sep, value = line.decode('latin-1').partition(':')
+                if not sep:
+                    raise BadRequest()
+                name = name.strip().lower()
+                if name in headers:
+                    headers[name] += ', ' + value.strip()
+                else:
+                    headers[name] = value.strip()
+            else:
+                raise BadRequest()
+        except ValueError:
+            # Line too long
+            raise BadRequest()
+        return Request(method, target, version, headers)
+
+    @asyncio.coroutine
+    def serve(self, request, writer):
+        if request.method not in ('GET', 'HEAD'):
+            yield from self.respond(
+                writer, request, 405, {'Allow': 'GET, HEAD'}
+            )
+            return
+        if not request.path.startswith(self.prefix):
+            yield from self.respond(writer, request, 404)
+            return
+        try:
+            path = unquote(request.path[len(self.prefix):], errors='strict')
+        except UnicodeDecodeError:
+            yield from self.respond(writer, request, 404)
+            return
+
+        allowed = yield from self.is_allowed(request)
+        if allowed is None:
+            # Anonymous user, like the share views
+            location = '{0}?next={1}'.format(
+                reverse('accounts:login'),
+                reverse('share:browse', args=(path,))
+            )
+            yield from self.respond(writer, request, 302, {
+                'Location': location
+            })
+            return
+        if not allowed:
+            yield from self.respond(writer, request, 403)
+            return
+
+        opened = yield from self.run_in_executor(open_file, path)
+        if opened is None:
+            yield from self.respond(writer, request, 404)
+            return
+        f, st, content_type, name = opened
+        try:
+            yield from self.send_file(
+                request, writer, f, st, content_type, name
+            )
+        finally:
+            f.close()
+
+    @asyncio.coroutine
+    def send_file(self, request, writer, f, st, content_type, name):
+        size = st.st_size
+        etag = get_etag(st)
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(st.st_mtime),
+        }
+        if is_not_modified(request, etag, st.st_mtime):
+            yield from self.respond(writer, request, 304, headers)
+            return
+
+        ranges = None
+        if 'HTTP_RANGE' in request.META and request.method == 'GET' and (
+                is_range_fresh(request, etag, st.st_mtime)):
+            ranges = parse_range_header(request.META['HTTP_RANGE'], size)
+            if ranges is not None and len(ranges) > 1:
+                # Multipart ranges are left to share.serving: whole file
+                ranges = None
+
+        headers['Accept-Ranges'] = 'bytes'
+        if ranges is not None and not ranges:
+            headers['Content-Range'] = 'bytes */{0}'.format(size)
+            yield from self.respond(writer, request, 416, headers)
+            return
+        if ranges:
+            status = 206
+            start, end = ranges[0]
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end, size
+            )
+        else:
+            status = 200
+            start, end = 0, size - 1
+        headers['Content-Type'] = content_type
+        headers['Content-Disposition'] = (
+            'attachment; filename="{0}"'
+        ).format(name)
+        length = end - start + 1
+        yield from self.write_head(writer, request, status, headers, length)
+        if request.method == 'HEAD':
+            return
+
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = yield from self.run_in_executor(
+                f.read, min(BLOCK_SIZE, remaining)
+            )
+            if not data:
+                # Truncated meanwhile: the client will notice the length
+                raise ConnectionError('{0} was truncated'.format(name))
+            remaining -= len(data)
+            writer.write(data)
+            # Backpressure: wait for the client to read what was sent
+            yield from asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+
+    @asyncio.coroutine
+    def is_allowed(self, request):
+        """
+        Returns whether the request session may browse the share, None for
+        anonymous clients
+        """
+        cookies = SimpleCookie()
+        try:
+            cookies.load(request.META.get('HTTP_COOKIE', ''))
+        except CookieError:
+            return None
+        morsel = cookies.get(django_settings.SESSION_COOKIE_NAME)
+        if morsel is None:
+            return None
+        session_key = morsel.value
+
+        now = time.time()
+        checked_at, allowed = self._permissions.get(session_key, (0, None))
+        if now - checked_at > PERMISSION_CACHE_DURATION:
+            allowed = yield from self.run_in_executor(
+                check_permission, session_key
+            )
+            if len(self._permissions) >= PERMISSION_CACHE_SIZE:
+                self._permissions.clear()
+            self._permissions[session_key] = (now, allowed)
+        return allowed
+
+    @asyncio.coroutine
+    def respond(self, writer, request, status, headers=None):
+        """Sends a response without content"""
+        yield from self.write_head(writer, request, status, headers or {}, 0)
+
+    @asyncio.coroutine
+    def write_head(self, writer, request, status, headers, length):
+        # Header values are encoded the way Django does it
+        response = HttpResponse(status=status)
+        del response['Content-Type']
+        for name, value in headers.items():
+            response[name] = value
+        response['Date'] = http_date()
+        if status != 304:
+            response['Content-Length'] = str(length)
+        if request is None or not request.keep_alive:
+            response['Connection'] = 'close'
+        writer.write(
+            'HTTP/1.1 {0} {1}\r\n'.format(
+                status, response.reason_phrase
+            ).encode('latin-1') +
+            response.serialize_headers() + b'\r\n\r\n'
+        )
+        yield from asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
@@ -0,0 +1,290 @@
+"""
+Benchmarks of share browsing on synthetic trees.
+
+Trees of a few typical shapes are generated in a temporary directory below
+SHARE_ROOT: a wide directory, a deep chain of directories, many small files
+and a few huge sparse files. Names, sizes and mtimes only depend on the
+scale, so that results can be compared between commits.
+
+Each operation is run once to warm the caches up (unless cold runs are
+asked for, the caches are then cleared before every run), then timed over a
+number of runs. It is run once more with its filesystem calls counted, and
+once more with its peak memory traced (Python 3.4+, tracemalloc).
+
+Results are returned as a dict ready to be dumped as JSON, see the
+'benchmarkshare' management command. Cold runs empty the share caches: they
+are meant for a development setup, with its own SHARE_ROOT and
+SHARE_CACHE_ROOT.
+"""
+
+from collections import OrderedDict
+import os
+import platform
+import posixpath
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4
+    pass
+
+import django
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test.client import RequestFactory
+
+from share import views
+from share.index import share_index
+from share.instrumentation import count_syscalls
+from share.mime import mime_type_cache
+from share.settings import SHARE_ROOT
+from share.templatetags.share_navigation import set_share_navigation
+from share.utils import FileSystemNode, path_resolver
+
+
+TREES = ('wide', 'deep', 'small_files', 'sparse')
+OPERATIONS = ('node', 'children', 'navigation', 'browse')
+
+# mtime of the generated entries, the nth one being n seconds older
+BASE_MTIME = 1400000000
+
+# Size of the huge sparse files
+SPARSE_SIZE = 64 * 1024 ** 3
+
+
+class BenchmarkUser(AnonymousUser):
+    """A user allowed to browse the share, without database"""
+
+    username = 'benchmark'
+
+    def is_authenticated(self):
+        return True
+
+    def has_perm(self, perm, obj=None):
+        return True
+
+
+class TreeBuilder:
+    """Creates the entries of a synthetic tree, in a reproducible way"""
+
+    def __init__(self, name):
+        self.random = random.Random(name)
+        self.count = 0
+
+    def touch(self, path):
+        self.count += 1
+        mtime = (BASE_MTIME - self.count) * 10 ** 9
+        os.utime(path, ns=(mtime, mtime))
+
+    def add_dir(self, path):
+        os.mkdir(path)
+        return path
+
+    def add_file(self, path, size=None):
+        """Creates a file of size bytes, a random small size by default"""
+        if size is None:
+            size = self.random.randint(0, 4096)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        self.touch(path)
+        return path
+
+    def add_sparse_file(self, path, size):
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        self.touch(path)
+        return path
+
+
+def build_tree(name, path, scale=1.0):
+    """
+    Creates the tree of a shape in the path directory, returns the directory
+    a user would browse
+    """
+    builder = TreeBuilder(name)
+
+    def count(n):
+        return max(1, int(n * scale))
+
+    if name == 'wide':
+        # A single huge directory
+        for i in range(count(100)):
+            builder.add_dir(posixpath.join(path, 'dir_{0:05d}'.format(i)))
+        for i in range(count(10000)):
+            builder.add_file(posixpath.join(path, 'file_{0:05d}'.format(i)))
+        target = path
+    elif name == 'deep':
+        # Browsing the deepest directory
+        target = path
+        for i in range(count(100)):
+            target = builder.add_dir(posixpath.join(target, 'dir'))
+            for j in range(5):
+                builder.add_file(
+                    posixpath.join(target, 'file_{0}'.format(j))
+                )
+    elif name == 'small_files':
+        # Directory sizes sum many files
+        for i in range(count(50)):
+            dirname = builder.add_dir(
+                posixpath.join(path, 'dir_{0:03d}'.format(i))
+            )
+            for j in range(count(200)):
+                builder.add_file(
+                    posixpath.join(dirname, 'file_{0:03d}'.format(j)),
+                    builder.random.randint(0, 512)
+                )
+        target = path
+    elif name == 'sparse':
+        for i in range(4):
+            builder.add_sparse_file(
+                posixpath.join(path, 'huge_{0}.iso'.format(i)), SPARSE_SIZE
+            )
+        target = path
+    else:
+        raise ValueError('Unknown tree {0}'.format(name))
+
+    # Directory mtimes were changed by the creation of their children
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        builder.touch(dirpath)
+    return target
+
+
+def get_paths(path):
+    """Returns the paths of all the files and directories of a tree"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        paths += [posixpath.join(dirpath, name) for name in dirnames]
+        paths += [posixpath.join(dirpath, name) for name in filenames]
+    return sorted(paths)
+
+
+def clear_caches():
+    """Forgets everything known about the share, as after a restart"""
+    share_index.clear()
+    mime_type_cache.clear()
+    path_resolver.clear()
+    cache.clear()
+
+
+def get_operations(tree_path, target):
+    """Returns the benchmarked functions of a tree, by operation name"""
+    node = FileSystemNode(target)
+    url = node.url
+    browse_url = reverse('share:browse', args=(url,))
+    paths = get_paths(tree_path)
+    factory = RequestFactory()
+
+    def build_nodes():
+        [FileSystemNode(path).isdir for path in paths]
+
+    def list_children():
+        node = FileSystemNode(target)
+        [(child.name, child.url, child.size) for child in node.children]
+
+    def navigation():
+        set_share_navigation({}, browse_url)
+
+    def browse():
+        request = factory.get(browse_url)
+        request.user = BenchmarkUser()
+        response = views.browse(request, url)
+        if response.status_code != 200:
+            raise RuntimeError('browse returned {0}'.format(
+                response.status_code
+            ))
+
+    return {
+        'node': build_nodes,
+        'children': list_children,
+        'navigation': navigation,
+        'browse': browse,
+    }
+
+
+def measure(func, runs, cold=False):
+    """
+    Runs func and returns its wall times (in seconds), filesystem calls and
+    peak memory (in bytes, None without tracemalloc)
+    """
+    if not cold:
+        func()
+    times = []
+    for i in range(runs):
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+
+    if cold:
+        clear_caches()
+    with count_syscalls() as counts:
+        func()
+
+    peak_memory = None
+    if 'tracemalloc' in sys.modules:
+        if cold:
+            clear_caches()
+        tracemalloc.start()
+        try:
+            func()
+            current, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return OrderedDict([
+        ('min_time', times[0]),
+        ('median_time', times[len(times) // 2]),
+        ('max_time', times[-1]),
+        ('syscalls', dict(counts)),
+        ('peak_memory', peak_memory),
+    ])
+
+
+def get_commit():
+    """Returns the current git commit, None if unknown"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=posixpath.dirname(posixpath.abspath(__file__))
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(trees=TREES, operations=OPERATIONS, scale=1.0, runs=5, cold=False):
+    """Benchmarks operations on trees, returns the results"""
+    results = OrderedDict()
+    for name in trees:
+        tree_path = tempfile.mkdtemp(dir=SHARE_ROOT, prefix='benchmark_')
+        try:
+            target = build_tree(name, tree_path, scale)
+            functions = get_operations(tree_path, target)
+            tree_results = OrderedDict()
+            tree_results['entries'] = len(get_paths(tree_path))
+            for operation in operations:
+                tree_results[operation] = measure(
+                    functions[operation], runs, cold
+                )
+            results[name] = tree_results
+        finally:
+            shutil.rmtree(tree_path)
+            # Forget the removed tree
+            share_index.apply_change(tree_path)
+
+    return OrderedDict([
+        ('commit', get_commit()),
+        ('python', platform.python_version()),
+        ('django', django.get_version()),
+        ('scale', scale),
+        ('runs', runs),
+        ('cold', cold),
+        ('results', results),
+    ])
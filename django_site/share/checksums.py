@@ -0,0 +1,212 @@
+"""
+SHA-256 checksums of the shared files.
+
+Files are hashed through a memory map, block by block, by a bounded pool of
+threads: requests never wait for a checksum, they get the ones already known
+and the others are computed meanwhile. Checksums are persisted in a SQLite
+database under SHARE_CACHE_ROOT, keyed by (device, inode, mtime, size), so
+they are only computed again when files change. Files that can't be hashed
+are not tried again for FAILURE_RETRY_DELAY, and at most MAX_PENDING
+checksums wait for a thread: others are scheduled by later requests.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import mmap
+import os
+import posixpath
+import stat
+import threading
+import time
+try:
+    from os import scandir
+except ImportError:
+    # Python < 3.5
+    from scandir import scandir
+
+from share.settings import SHARE_CACHE_ROOT, SHARE_CHECKSUM_WORKERS
+from share.storage import SQLiteStorage
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checksums (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE TABLE IF NOT EXISTS failures (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    failed_at REAL NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+"""
+
+# Size of the blocks given to the hash function
+BLOCK_SIZE = 1024 * 1024
+
+# Checksums waiting at most to be computed
+MAX_PENDING = 100
+
+# Seconds before hashing again a file that could not be hashed
+FAILURE_RETRY_DELAY = 3600
+
+# Checksum of the files that could not be hashed lately
+FAILED = ''
+
+
+def compute_sha256(path):
+    """Hashes a file through a memory map, without loading it in memory"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # Empty files can't be mapped
+        if size > 0:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, BLOCK_SIZE):
+                        sha256.update(view[offset:offset + BLOCK_SIZE])
+                finally:
+                    view.release()
+            finally:
+                mapped.close()
+    return sha256.hexdigest()
+
+
+class ChecksumCache(SQLiteStorage):
+    """
+    SHA-256 checksums of files, computed in the background and persisted in
+    a SQLite database
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, db_path, workers=SHARE_CHECKSUM_WORKERS):
+        super().__init__(db_path)
+        self.workers = workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, st=None):
+        """
+        Returns the checksum of a file if known, FAILED if it could not be
+        hashed lately, None otherwise: it is then computed in the background.
+        The file stat result can be given if already known.
+        """
+        if st is None:
+            st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        row = self.connection.execute(
+            'SELECT sha256 FROM checksums'
+            ' WHERE dev = ? AND ino = ? AND mtime = ? AND size = ?', key
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        if self.connection.execute(
+                'SELECT 1 FROM failures'
+                ' WHERE dev = ? AND ino = ? AND mtime = ? AND size = ?'
+                ' AND failed_at > ?',
+                key + (time.time() - FAILURE_RETRY_DELAY,)).fetchone():
+            return FAILED
+        self.schedule(path, st)
+        return None
+
+    def get_dir(self, path):
+        """
+        Returns the known checksums of the files of a directory by file name,
+        and the number of checksums still being computed (files that could
+        not be hashed are left out of both)
+        """
+        checksums = {}
+        pending = 0
+        for dir_entry in scandir(path):
+            try:
+                st = dir_entry.stat()
+            except OSError:
+                # Broken symbolic link
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            checksum = self.get(posixpath.join(path, dir_entry.name), st)
+            if checksum is None:
+                pending += 1
+            elif checksum != FAILED:
+                checksums[dir_entry.name] = checksum
+        return checksums, pending
+
+    def schedule(self, path, st):
+        """
+        Queues the computation of a checksum, unless already queued. Returns
+        False if it was dropped, MAX_PENDING checksums being queued.
+        """
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key in self._pending:
+                return True
+            if len(self._pending) >= MAX_PENDING:
+                logger.debug('Checksums queue full, %s dropped', path)
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers)
+            self._pending[key] = self._executor.submit(
+                self._compute, path, key
+            )
+        return True
+
+    def wait(self):
+        """Waits for the checksums being computed"""
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            future.exception()
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM checksums')
+            self.connection.execute('DELETE FROM failures')
+
+    def _compute(self, path, key):
+        try:
+            sha256 = compute_sha256(path)
+            st = os.stat(path)
+            # Modified while being hashed: it will be scheduled again
+            if (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size) != key:
+                return
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO checksums'
+                    ' (dev, ino, mtime, size, sha256) VALUES (?, ?, ?, ?, ?)',
+                    key + (sha256,)
+                )
+                self.connection.execute(
+                    'DELETE FROM failures WHERE dev = ? AND ino = ?', key[:2]
+                )
+        except Exception:
+            logger.exception('Could not compute the checksum of %s', path)
+            # Not tried again by every request
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO failures'
+                    ' (dev, ino, mtime, size, failed_at)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    key + (time.time(),)
+                )
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+
+checksum_cache = ChecksumCache(
+    posixpath.join(SHARE_CACHE_ROOT, 'checksums.sqlite3')
+)
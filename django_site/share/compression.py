@@ -0,0 +1,181 @@
+"""
+Precompressed copies of the compressible shared files.
+
+Clients accepting gzip (or brotli, when the brotli module is installed) are
+sent a compressed copy of text-like files. Copies are generated in a
+background thread the first time a file is requested, the original being
+sent meanwhile, and cached per (path, mtime, size) in a bounded disk cache:
+a modified file is compressed again, and its old copies end up evicted.
+Files requested while the thread is busy with many others are compressed
+at a later request (see share.tasks).
+
+Types which are already compressed (images, audio, video, archives...) are
+never compressed, nor are small files. Files compressing poorly are
+remembered as such and always sent as is.
+"""
+
+import gzip
+import os
+import posixpath
+import re
+import sys
+try:
+    import brotli
+except ImportError:
+    pass
+
+from share.settings import SHARE_CACHE_ROOT, SHARE_COMPRESSION_CACHE_SIZE
+from share.storage import DiskCache
+from share.tasks import BackgroundTasks
+
+
+# Supported encodings, in order of preference
+ENCODINGS = ('br', 'gzip')
+
+# Files smaller than this (in bytes) are not worth compressing
+MIN_SIZE = 1024
+
+# Copies bigger than this ratio of the original are not kept
+MAX_RATIO = 0.9
+
+BLOCK_SIZE = 64 * 1024
+
+INCOMPRESSIBLE_PREFIXES = (
+    'image/', 'audio/', 'video/', 'application/vnd.oasis.opendocument.',
+    'application/vnd.openxmlformats-officedocument.'
+)
+INCOMPRESSIBLE_TYPES = (
+    'application/epub+zip', 'application/gzip', 'application/java-archive',
+    'application/pdf', 'application/vnd.android.package-archive',
+    'application/vnd.rar', 'application/x-7z-compressed',
+    'application/x-bzip2', 'application/x-compress', 'application/x-gzip',
+    'application/x-lzma', 'application/x-rar',
+    'application/x-rar-compressed', 'application/x-xz', 'application/zip',
+    'application/zstd'
+)
+# Exceptions to the prefixes above
+COMPRESSIBLE_TYPES = ('image/bmp', 'image/svg+xml', 'image/x-ms-bmp')
+
+CODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def is_compressible(mime_type):
+    if mime_type in COMPRESSIBLE_TYPES:
+        return True
+    return not (
+        mime_type.startswith(INCOMPRESSIBLE_PREFIXES) or
+        mime_type in INCOMPRESSIBLE_TYPES
+    )
+
+
+def get_available_encodings():
+    if 'brotli' in sys.modules:
+        return ENCODINGS
+    return tuple(encoding for encoding in ENCODINGS if encoding != 'br')
+
+
+def negotiate_encoding(header):
+    """
+    Returns the preferred encoding accepted by an Accept-Encoding header, or
+    None if none is
+    """
+    qvalues = {}
+    for coding in header.split(','):
+        match = CODING_RE.match(coding)
+        if match is None:
+            continue
+        name, qvalue = match.groups()
+        try:
+            qvalues[name.lower()] = float(qvalue) if qvalue else 1.0
+        except ValueError:
+            continue
+    for encoding in get_available_encodings():
+        if qvalues.get(encoding, qvalues.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(path, encoding, f):
+    """Writes the content of a file compressed with encoding to f"""
+    with open(path, 'rb') as source:
+        if encoding == 'gzip':
+            # No name nor timestamp: copies of a same file are identical
+            with gzip.GzipFile('', 'wb', fileobj=f, mtime=0) as target:
+                for data in iter(lambda: source.read(BLOCK_SIZE), b''):
+                    target.write(data)
+        else:
+            compressor = brotli.Compressor()
+            for data in iter(lambda: source.read(BLOCK_SIZE), b''):
+                f.write(compressor.process(data))
+            f.write(compressor.finish())
+
+
+class CompressedCache(DiskCache):
+    """
+    Least recently used compressed copies of the shared files, stored in a
+    directory
+    """
+
+    def __init__(self, root,
+                 max_size=SHARE_COMPRESSION_CACHE_SIZE * 1000 ** 2):
+        super().__init__(root, max_size)
+        self.background_tasks = BackgroundTasks('compression')
+
+    def get(self, path, encoding, st=None):
+        """
+        Returns the path of the copy of a file compressed with encoding, or
+        None if it is not available (yet). Missing copies are generated in
+        the background.
+        """
+        if st is None:
+            st = os.stat(path)
+        key = self.get_key(path, st.st_mtime_ns, st.st_size, encoding)
+        cached, compressed_path = self.lookup(key)
+        if not cached:
+            self.background_tasks.add(self.generate, path, encoding, key)
+        return compressed_path
+
+    def generate(self, path, encoding, key):
+        """Compresses a file, unless it was modified since key was built"""
+        st = os.stat(path)
+        if self.get_key(path, st.st_mtime_ns, st.st_size, encoding) != key:
+            return None
+
+        def write(f):
+            compress(path, encoding, f)
+            if f.tell() > st.st_size * MAX_RATIO:
+                return False
+            # Modified while being compressed: the copy is mixed up
+            new_st = os.stat(path)
+            if (new_st.st_mtime_ns, new_st.st_size) != (
+                    st.st_mtime_ns, st.st_size):
+                return False
+
+        return self.write(key, write)
+
+
+compressed_cache = CompressedCache(
+    posixpath.join(SHARE_CACHE_ROOT, 'compressed')
+)
+
+
+def get_compressed_file(request, path, content_type):
+    """
+    Returns the path of the best compressed copy of a file accepted by the
+    client, and its encoding, or (None, None) if the file must be sent as
+    is
+    """
+    if not is_compressible(content_type):
+        return None, None
+    encoding = negotiate_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    if encoding is None:
+        return None, None
+    st = os.stat(path)
+    if st.st_size < MIN_SIZE:
+        return None, None
+    compressed_path = compressed_cache.get(path, encoding, st)
+    if compressed_path is None:
+        return None, None
+    return compressed_path, encoding
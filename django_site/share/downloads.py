@@ -0,0 +1,101 @@
+"""
+Download backends of the shared files.
+
+Apart from 'python', backends only tell the front web server which file to
+send through a response header: the transfer itself never goes through the
+Django workers. The backend is chosen per deployment with the
+SHARE_DOWNLOAD_BACKEND setting.
+
+Compressible files are sent compressed to the clients accepting it, through
+the same backend (see share.compression).
+"""
+
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlquote
+
+import os
+import posixpath
+
+from share import settings
+from share.compression import get_compressed_file, is_compressible
+from share.serving import serve_file
+
+
+def send_file_python(request, path, content_type):
+    """Django sends the file itself"""
+    return serve_file(request, path, content_type)
+
+
+def send_file_apache(request, path, content_type):
+    """Apache mod_xsendfile intercepts the X-SendFile header and sends the
+    file itself"""
+    response = HttpResponse(content_type=content_type)
+    response['X-SendFile'] = urlquote(path)
+    return response
+
+
+def send_file_nginx(request, path, content_type):
+    """nginx intercepts the X-Accel-Redirect header and sends the file from
+    an internal location mapped to SHARE_ROOT (or SHARE_CACHE_ROOT for
+    compressed copies)"""
+    cache_root = settings.SHARE_CACHE_ROOT.rstrip('/') + '/'
+    if path.startswith(cache_root):
+        location = settings.SHARE_ACCEL_CACHE_URL
+        relative_path = posixpath.relpath(path, cache_root)
+    else:
+        location = settings.SHARE_ACCEL_REDIRECT_URL
+        relative_path = posixpath.relpath(path, settings.SHARE_ROOT)
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = urlquote(
+        posixpath.join(location, relative_path)
+    )
+    return response
+
+
+def send_file_lighttpd(request, path, content_type):
+    """lighttpd intercepts the X-LIGHTTPD-send-file header and sends the
+    file itself"""
+    response = HttpResponse(content_type=content_type)
+    # lighttpd does not decode the header: the raw path bytes are sent, as
+    # latin-1 maps each byte to a single character
+    response['X-LIGHTTPD-send-file'] = os.fsencode(path).decode('latin-1')
+    return response
+
+
+def send_file_async(request, path, content_type):
+    """The client is redirected to the asyncio download server, which sends
+    the file without tying up a Django worker"""
+    relative_path = posixpath.relpath(path, settings.SHARE_ROOT)
+    return HttpResponseRedirect(
+        settings.SHARE_ASYNC_URL + urlquote(relative_path)
+    )
+
+
+BACKENDS = {
+    'python': send_file_python,
+    'apache': send_file_apache,
+    'nginx': send_file_nginx,
+    'lighttpd': send_file_lighttpd,
+    'async': send_file_async,
+}
+
+
+def send_file(request, path, content_type):
+    """Returns a response sending a shared file with the configured backend"""
+    backend = BACKENDS[settings.SHARE_DOWNLOAD_BACKEND]
+    if backend is send_file_async:
+        # Only the redirection goes through Django
+        return backend(request, path, content_type)
+    compressed_path, encoding = get_compressed_file(
+        request, path, content_type
+    )
+    if compressed_path is None:
+        response = backend(request, path, content_type)
+    else:
+        response = backend(request, compressed_path, content_type)
+        response['Content-Encoding'] = encoding
+    if is_compressible(content_type):
+        # The response depends on the encodings accepted by the client
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,286 @@
+"""
+In-memory cache of small, frequently downloaded shared files.
+
+The contents of small files (installers, PDFs, scripts...) are kept in a
+memory-mapped file shared by all the web processes of the host, so that a
+popular file is read from disk once instead of once per download. Entries
+are keyed by the device, inode, mtime and size of the files: the stat call
+validating a download is the only filesystem call of a cache hit.
+
+The mapped file starts with a header (counters), then a table of entries,
+then the contents. The table is set-associative: an entry can only be in
+one of ASSOCIATIVITY slots, found from the hash of its key, so that a
+lookup reads a handful of slots. Contents are placed at the first gap large
+enough for them, and the least recently used entries are evicted until
+there is one. Processes take an exclusive lock of the file (flock) around
+every access: lookups copy the content out before releasing it.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import mmap
+import os
+import posixpath
+import struct
+import threading
+import zlib
+
+from share.settings import (
+    SHARE_HOT_CACHE_ROOT,
+    SHARE_HOT_CACHE_SIZE,
+    SHARE_HOT_FILE_SIZE
+)
+
+
+MAGIC = b'SHAREHOT'
+
+# Magic, number of slots, clock, hits, misses and evictions
+HEADER = struct.Struct('<8sIQQQQ')
+HEADER_SIZE = 64
+
+# Device, inode, mtime (in nanoseconds), size, offset of the content, and
+# clock value when last used (0 for empty slots)
+SLOT = struct.Struct('<QQqQQQ')
+EMPTY_SLOT = (0, 0, 0, 0, 0, 0)
+
+# Slots an entry may be in
+ASSOCIATIVITY = 8
+
+# Expected average size of the cached files, setting the number of slots
+AVERAGE_FILE_SIZE = 16 * 1024
+
+
+def get_key(st):
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def find_gap(slots, size, max_size):
+    """
+    Returns the offset of the first gap of size bytes between the contents
+    of slots, None if there is none
+    """
+    position = 0
+    extents = sorted(
+        (slot[4], slot[3]) for slot in slots if slot[5]
+    )
+    for offset, length in extents:
+        if offset - position >= size:
+            return position
+        position = max(position, offset + length)
+    if max_size - position >= size:
+        return position
+    return None
+
+
+class HotFileCache:
+    """
+    Least recently used contents of small files, in a memory-mapped file
+    shared by processes. The file is created in root on first use.
+    """
+
+    def __init__(self, root, max_size, max_file_size):
+        self.max_size = max_size
+        self.max_file_size = min(max_file_size, max_size)
+        sets = max(1, max_size // AVERAGE_FILE_SIZE // ASSOCIATIVITY)
+        self.slots = sets * ASSOCIATIVITY
+        self.data_offset = HEADER_SIZE + self.slots * SLOT.size
+        # Caches of another geometry use another file
+        self.path = posixpath.join(root, 'hotfiles-{0}-{1}.mmap'.format(
+            self.slots, self.max_size
+        ))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def accepts(self, st):
+        """Checks whether a file is small enough to be cached"""
+        return self.enabled and 0 < st.st_size <= self.max_file_size
+
+    def get(self, st):
+        """
+        Returns the content of the file of a stat result, None if it is not
+        cached
+        """
+        if not self.accepts(st):
+            return None
+        key = get_key(st)
+        with self._locked() as mapped:
+            magic, slots, clock, hits, misses, evictions = (
+                HEADER.unpack_from(mapped)
+            )
+            clock += 1
+            for index in self._get_ways(key):
+                slot = SLOT.unpack_from(mapped, self._get_slot_offset(index))
+                if slot[5] and slot[:4] == key:
+                    start = self.data_offset + slot[4]
+                    data = mapped[start:start + slot[3]]
+                    SLOT.pack_into(
+                        mapped, self._get_slot_offset(index),
+                        *(slot[:5] + (clock,))
+                    )
+                    HEADER.pack_into(
+                        mapped, 0, magic, slots, clock, hits + 1, misses,
+                        evictions
+                    )
+                    return data
+            HEADER.pack_into(
+                mapped, 0, magic, slots, clock, hits, misses + 1, evictions
+            )
+        return None
+
+    def put(self, st, data):
+        """
+        Caches the content of the file of a stat result, evicting the least
+        recently used ones to make room. Returns whether it was cached.
+        """
+        if not self.accepts(st) or len(data) != st.st_size:
+            return False
+        key = get_key(st)
+        with self._locked() as mapped:
+            magic, slots, clock, hits, misses, evictions = (
+                HEADER.unpack_from(mapped)
+            )
+            table = self._read_table(mapped)
+            ways = self._get_ways(key)
+            if any(table[index][:4] == key and table[index][5]
+                   for index in ways):
+                # Cached by another process meanwhile
+                return True
+
+            # A slot in the set of the key
+            target = min(ways, key=lambda index: table[index][5])
+            if table[target][5]:
+                self._evict(mapped, table, target)
+                evictions += 1
+
+            # Then room for the content
+            offset = find_gap(table, len(data), self.max_size)
+            if offset is None:
+                victims = sorted(
+                    (slot[5], index) for index, slot in enumerate(table)
+                    if slot[5]
+                )
+                for last_used, index in victims:
+                    self._evict(mapped, table, index)
+                    evictions += 1
+                    offset = find_gap(table, len(data), self.max_size)
+                    if offset is not None:
+                        break
+
+            # Published once the content is written
+            start = self.data_offset + offset
+            mapped[start:start + len(data)] = data
+            clock += 1
+            SLOT.pack_into(
+                mapped, self._get_slot_offset(target),
+                *(key + (offset, clock))
+            )
+            HEADER.pack_into(
+                mapped, 0, magic, slots, clock, hits, misses, evictions
+            )
+        return True
+
+    def _read_table(self, mapped):
+        """Returns the slots of the table, without copying it"""
+        # Struct.iter_unpack is Python 3.4+
+        return [
+            SLOT.unpack_from(mapped, HEADER_SIZE + index * SLOT.size)
+            for index in range(self.slots)
+        ]
+
+    def get_stats(self):
+        """Returns the counters of the cache, shared by all processes"""
+        if not self.enabled:
+            return {'enabled': False}
+        with self._locked() as mapped:
+            magic, slots, clock, hits, misses, evictions = (
+                HEADER.unpack_from(mapped)
+            )
+            table = self._read_table(mapped)
+        used = [slot for slot in table if slot[5]]
+        return {
+            'enabled': True,
+            'entries': len(used),
+            'size': sum(slot[3] for slot in used),
+            'max_size': self.max_size,
+            'max_file_size': self.max_file_size,
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+        }
+
+    def clear(self):
+        """Forgets all the contents and resets the counters"""
+        if not self.enabled:
+            return
+        with self._locked() as mapped:
+            self._initialize(mapped)
+
+    def _get_ways(self, key):
+        """Returns the slots the entry of key may be in"""
+        # Same hash in every process, unlike hash()
+        digest = zlib.crc32(struct.pack('<QQqQ', *key))
+        first = digest % (self.slots // ASSOCIATIVITY) * ASSOCIATIVITY
+        return range(first, first + ASSOCIATIVITY)
+
+    def _get_slot_offset(self, index):
+        return HEADER_SIZE + index * SLOT.size
+
+    def _evict(self, mapped, table, index):
+        table[index] = EMPTY_SLOT
+        SLOT.pack_into(mapped, self._get_slot_offset(index), *EMPTY_SLOT)
+
+    def _initialize(self, mapped):
+        mapped[:self.data_offset] = bytes(self.data_offset)
+        HEADER.pack_into(mapped, 0, MAGIC, self.slots, 0, 0, 0, 0)
+
+    def _open(self):
+        """Maps the file, again in a forked process: locks are per process"""
+        if self._pid == os.getpid():
+            return
+        if self._map is not None:
+            # Inherited from the parent process
+            self._map.close()
+            os.close(self._fd)
+            self._fd = self._map = None
+        os.makedirs(posixpath.dirname(self.path), exist_ok=True)
+        length = self.data_offset + self.max_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != length:
+                    # Sparse: memory is only used for the cached contents
+                    os.ftruncate(fd, length)
+                mapped = mmap.mmap(fd, length)
+                if HEADER.unpack_from(mapped)[:2] != (MAGIC, self.slots):
+                    self._initialize(mapped)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd, self._map, self._pid = fd, mapped, os.getpid()
+
+    @contextmanager
+    def _locked(self):
+        # Threads share the lock of their process
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+hot_file_cache = HotFileCache(
+    SHARE_HOT_CACHE_ROOT,
+    SHARE_HOT_CACHE_SIZE * 1000 ** 2,
+    SHARE_HOT_FILE_SIZE * 1000
+)
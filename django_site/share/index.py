@@ -0,0 +1,698 @@
+"""
+Persistent index of the shared directory tree.
+
+Entries are stored in a SQLite database under SHARE_CACHE_ROOT and keyed by
+their path relative to SHARE_ROOT ('' being the root itself). Directory
+entries hold their total size (including sub dirs and files) and the mtime
+they had when they were last scanned: a directory whose mtime did not change
+is not read again, only its indexed sub directories are checked.
+
+Since a file rewritten in place does not change its parent's mtime, such
+modifications are only picked up by a full update of the index (see the
+'updateshareindex' management command), or by the filesystem watcher (see
+share.watcher). While the watcher runs, the index is trusted as is and
+lookups do not touch the filesystem at all.
+
+Symbolic links to directories are listed, but not followed (their target
+could be anywhere, or contain the link itself): they are not part of the
+size of their parent, and their own size and content are looked up on the
+filesystem.
+
+Entry names are also indexed for search (see ShareIndex.search): being part
+of the same tables, the search index follows every scan and watcher event.
+
+Likewise, triggers log every added, modified or removed entry with an
+increasing sequence number, persisted with the index. Mirrors of the share
+fetch the changes since the last sequence number they saw (see
+ShareIndex.get_changes) instead of walking the whole tree. Removals are only
+logged for CHANGES_RETENTION: mirrors older than that start over.
+"""
+
+from collections import namedtuple
+import binascii
+import logging
+import os
+import posixpath
+import sqlite3
+import stat
+import time
+try:
+    from os import scandir
+except ImportError:
+    # Python < 3.5
+    from scandir import scandir
+
+from share.settings import SHARE_ROOT, SHARE_CACHE_ROOT
+from share.storage import SQLiteStorage
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    parent TEXT,
+    name TEXT NOT NULL,
+    isdir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    islink INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS entries_links ON entries (path) WHERE islink;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    deleted INTEGER NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_deleted ON changes (deleted, changed_at);
+CREATE TRIGGER IF NOT EXISTS changes_insert AFTER INSERT ON entries
+WHEN new.path != '' BEGIN
+    INSERT OR REPLACE INTO changes (path, deleted, changed_at)
+    VALUES (new.path, 0, (julianday('now') - 2440587.5) * 86400);
+END;
+CREATE TRIGGER IF NOT EXISTS changes_update AFTER UPDATE ON entries
+WHEN new.path != '' AND (
+    new.isdir != old.isdir OR new.size != old.size OR new.mtime != old.mtime
+) BEGIN
+    INSERT OR REPLACE INTO changes (path, deleted, changed_at)
+    VALUES (new.path, 0, (julianday('now') - 2440587.5) * 86400);
+END;
+CREATE TRIGGER IF NOT EXISTS changes_delete AFTER DELETE ON entries
+WHEN old.path != '' BEGIN
+    INSERT OR REPLACE INTO changes (path, deleted, changed_at)
+    VALUES (old.path, 1, (julianday('now') - 2440587.5) * 86400);
+END;
+"""
+
+# Trigram full-text index of the entry names, kept in sync by triggers.
+# Requires SQLite 3.34 or later, substring searches scan the names otherwise.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO names (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO names (names, rowid, name)
+    VALUES ('delete', old.id, old.name);
+END;
+INSERT INTO names (names) VALUES ('rebuild');
+"""
+
+# Condition on a path column, true for the entries below links to
+# directories: those are only indexed when looked up through the link (see
+# ShareIndex._store_link), search and changes leave them out
+BELOW_LINK = (
+    'EXISTS (SELECT 1 FROM entries AS links WHERE links.islink'
+    " AND {0} > links.path || '/' AND {0} < links.path || '0')"
+)
+
+# Maximum number of search results
+SEARCH_LIMIT = 100
+
+# Number of changes per page of the change feed
+CHANGES_LIMIT = 1000
+MAX_CHANGES_LIMIT = 10000
+
+# Seconds removals are kept in the change feed
+CHANGES_RETENTION = 30 * 24 * 3600
+
+# Seconds between two heartbeats of the filesystem watcher
+WATCHER_HEARTBEAT = 30
+
+# Seconds the watcher liveness is cached by web processes
+LIVENESS_CACHE_DURATION = 1
+
+
+IndexEntry = namedtuple('IndexEntry', 'name isdir size mtime')
+
+
+def make_entry(name, isdir, size, mtime, islink):
+    """Returns the IndexEntry of a row of the entries table"""
+    if islink:
+        # Links to directories are not watched: their target is
+        return IndexEntry(name, True, None, None)
+    return IndexEntry(name, bool(isdir), size, mtime)
+
+
+class ShareIndex(SQLiteStorage):
+    """
+    Sizes of the files and directories below a root directory, persisted in a
+    SQLite database so they survive process restarts.
+    """
+
+    schema = SCHEMA
+
+    # Version 2 logs changes: older indexes are rebuilt so that every entry
+    # is in the log. Version 3 lists symbolic links to directories.
+    version = 3
+
+    def __init__(self, db_path, root=SHARE_ROOT):
+        super().__init__(db_path)
+        self.root = root
+        self.searchable = False
+        self._live = False
+        self._live_checked_at = None
+        # Last heartbeat of an update keeping the index live (see update)
+        self._kept_alive_at = None
+
+    def setup(self, connection):
+        """Creates the names full-text index, if SQLite supports it"""
+        if connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'names'").fetchone():
+            self.searchable = True
+            return
+        try:
+            connection.executescript(
+                'BEGIN IMMEDIATE;' + SEARCH_SCHEMA + 'COMMIT;'
+            )
+        except sqlite3.OperationalError as e:
+            if connection.in_transaction:
+                connection.rollback()
+            logger.warning('Names are not indexed for search (%s)', e)
+        else:
+            self.searchable = True
+
+    def relpath(self, path):
+        """Converts a physical path below the root to an index key"""
+        if path == self.root:
+            return ''
+        return posixpath.relpath(path, start=self.root)
+
+    def get_size(self, path, st=None):
+        """
+        Gets the file or folder total size (including sub dirs and files),
+        only scanning the directories modified since the last lookup. The
+        path stat result can be given if already known.
+        """
+        if st is None:
+            if self.is_live():
+                size = self._get_size(self.relpath(path))
+                if size is not None:
+                    return size
+            st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            return st.st_size
+        return self.get_dir_size(path, st.st_mtime_ns)
+
+    def get_dir_size(self, path, mtime):
+        """
+        Gets a folder total size, given its current mtime (in nanoseconds)
+        """
+        if self.is_live():
+            size = self._get_size(self.relpath(path))
+            if size is not None:
+                return size
+        # Without the watcher, changes below unmodified directories are only
+        # found by checking every indexed sub directory: only the modified
+        # ones are read again
+        return self._lookup(path, mtime, deep=True)
+
+    def list_dir(self, path):
+        """
+        Returns the IndexEntry children of a directory if the watcher keeps
+        the index live, None otherwise (the filesystem must be read)
+        """
+        if not self.is_live():
+            return None
+        rel = self.relpath(path)
+        if self._get_size(rel) is None:
+            return None
+        return [
+            make_entry(name, isdir, size, mtime, islink)
+            for name, isdir, size, mtime, islink in self.connection.execute(
+                'SELECT name, isdir, size, mtime, islink FROM entries'
+                ' WHERE parent = ?', (rel,)
+            )
+        ]
+
+    def search(self, query, path=None, prefix=False, limit=SEARCH_LIMIT):
+        """
+        Returns the (path, IndexEntry) of at most limit indexed files and
+        directories whose name contains the query, or starts with it if
+        prefix is True, ignoring case. Paths are relative to the root, and
+        only the entries below path are searched if given.
+        """
+        conditions = ["path != ''", 'NOT ' + BELOW_LINK.format('entries.path')]
+        params = []
+        rel = self.relpath(path) if path is not None else ''
+        if rel:
+            conditions.append('path > ? AND path < ?')
+            params += [rel + '/', rel + '0']
+        if prefix:
+            # Range scan of the names index
+            conditions.append(
+                'name COLLATE NOCASE >= ? AND name COLLATE NOCASE < ?'
+            )
+            params += [query, query + '\U0010ffff']
+        elif self.searchable and len(query) >= 3:
+            # Trigram lookup, the query must be quoted as a phrase
+            conditions.append(
+                'id IN (SELECT rowid FROM names WHERE names MATCH ?)'
+            )
+            params.append('"{0}"'.format(query.replace('"', '""')))
+        else:
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append('%{0}%'.format(
+                query.replace('\\', '\\\\').replace('%', '\\%')
+                .replace('_', '\\_')
+            ))
+        rows = self.connection.execute(
+            'SELECT path, name, isdir, size, mtime, islink FROM entries'
+            ' WHERE {0} LIMIT ?'.format(' AND '.join(conditions)),
+            params + [limit]
+        )
+        return sorted(
+            (path, make_entry(name, isdir, size, mtime, islink))
+            for path, name, isdir, size, mtime, islink in rows
+        )
+
+    def get_changes(self, token=None, path=None, limit=CHANGES_LIMIT):
+        """
+        Returns the changes of the entries below path (the whole index by
+        default) since token, as a (changes, token, reset, more) tuple.
+
+        changes is a list of at most limit (path, IndexEntry) tuples in the
+        order the changes were made, the entry being None for removed paths.
+        The returned token is the one to give next time. reset is True if
+        token is None or can't tell what changed (unknown, or older than
+        the removals still logged): changes then only list the current
+        entries, all the others must be forgotten. more is True if changes
+        were left out, to be fetched with the returned token.
+        """
+        with self.connection:
+            # A single snapshot of the log
+            self.connection.execute('BEGIN')
+            epoch = self._get_epoch()
+            last_seq = self._get_last_seq()
+            horizon = self._get_meta('changes_horizon') or 0
+
+            since = None
+            if token is not None:
+                token_epoch, sep, seq = token.partition('-')
+                if token_epoch == epoch and seq.isdigit():
+                    since = int(seq)
+            reset = since is None or not horizon <= since <= last_seq
+
+            conditions = [
+                'seq > ? AND seq <= ?', 'NOT ' + BELOW_LINK.format(
+                    'changes.path'
+                )
+            ]
+            params = []
+            params += [0 if reset else since, last_seq]
+            if reset:
+                conditions.append('NOT deleted')
+            rel = self.relpath(path) if path is not None else ''
+            if rel:
+                conditions.append('changes.path > ? AND changes.path < ?')
+                params += [rel + '/', rel + '0']
+            rows = self.connection.execute(
+                'SELECT seq, changes.path, deleted, name, isdir, size, mtime,'
+                ' islink FROM changes LEFT JOIN entries USING (path)'
+                ' WHERE {0} ORDER BY seq LIMIT ?'.format(
+                    ' AND '.join(conditions)
+                ),
+                params + [limit + 1]
+            ).fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        changes = []
+        for seq, path, deleted, name, isdir, size, mtime, islink in rows:
+            entry = None
+            if not deleted and name is not None:
+                entry = make_entry(name, isdir, size, mtime, islink)
+            changes.append((path, entry))
+        next_seq = rows[-1][0] if more else last_seq
+        return changes, '{0}-{1}'.format(epoch, next_seq), reset, more
+
+    def get_generation(self):
+        """
+        Returns a string changing whenever an entry of the index changes,
+        None unless a watcher keeps the index up to date: files could then
+        change without the index knowing
+        """
+        if not self.is_live():
+            return None
+        with self.connection:
+            self.connection.execute('BEGIN')
+            return '{0}-{1}'.format(self._get_epoch(), self._get_last_seq())
+
+    def prune_changes(self, max_age=CHANGES_RETENTION):
+        """
+        Forgets the removals logged more than max_age seconds ago: older
+        tokens then get a reset
+        """
+        with self.connection:
+            horizon, = self.connection.execute(
+                'SELECT MAX(seq) FROM changes'
+                ' WHERE deleted AND changed_at < ?',
+                (time.time() - max_age,)
+            ).fetchone()
+            if horizon is None:
+                return
+            self.connection.execute(
+                'DELETE FROM changes WHERE deleted AND seq <= ?', (horizon,)
+            )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('changes_horizon', horizon)
+            )
+
+    def update(self, path=None, full=False, keep_alive=False):
+        """
+        Validates the whole index below path (the root by default) and
+        returns its total size. Unmodified directories are not read again,
+        unless full is True.
+
+        If keep_alive is True, the watcher heartbeat is renewed while the
+        update runs, so the index stays live during a long rescan: the
+        directories indexed so far are then committed at each heartbeat,
+        before the sizes of their ancestors are updated.
+        """
+        if path is None:
+            path = self.root
+        self._kept_alive_at = time.time() if keep_alive else None
+        try:
+            size = self._lookup(
+                path, os.stat(path).st_mtime_ns, deep=True, full=full
+            )
+        finally:
+            self._kept_alive_at = None
+        if full and path == self.root:
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                    ('full_update_at', time.time())
+                )
+        self.prune_changes()
+        return size
+
+    def get_full_update_time(self):
+        """Returns when the whole index was last fully updated, or None"""
+        return self._get_meta('full_update_at')
+
+    def apply_change(self, path):
+        """
+        Re-indexes a single path after it was created, modified or removed,
+        and adds the size difference to its ancestors
+        """
+        rel = self.relpath(path)
+        with self.connection:
+            row = self.connection.execute(
+                'SELECT isdir, size, islink FROM entries WHERE path = ?',
+                (rel,)
+            ).fetchone()
+            # Links to directories are not part of the size of their parent
+            old_size = row[1] if row is not None and not row[2] else 0
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            isdir = st is not None and stat.S_ISDIR(st.st_mode)
+            islink = isdir and os.path.islink(path)
+            if row is not None and (st is None or (
+                    bool(row[0]), bool(row[2])) != (isdir, islink)):
+                self._delete(rel)
+            if st is None:
+                size = 0
+            elif islink:
+                size = 0
+                self._store_link(rel)
+            elif isdir:
+                size = self._sync_dir(rel, path, st.st_mtime_ns, deep=False)
+            elif stat.S_ISREG(st.st_mode):
+                size = st.st_size
+                self._store(rel, False, size, st.st_mtime_ns)
+            else:
+                size = 0
+            if size != old_size:
+                self._add_to_ancestors(rel, size - old_size)
+            # The parent listing is up to date, no need to scan it again
+            parent_path = posixpath.dirname(path)
+            try:
+                parent_mtime = os.stat(parent_path).st_mtime_ns
+            except OSError:
+                pass
+            else:
+                self.connection.execute(
+                    'UPDATE entries SET mtime = ?'
+                    ' WHERE path = ? AND isdir = 1',
+                    (parent_mtime, self.relpath(parent_path))
+                )
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM entries')
+
+    def heartbeat(self):
+        """Called periodically by the watcher while it keeps the index live"""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('watcher_heartbeat', time.time())
+            )
+        self.prune_changes()
+
+    def stop_heartbeat(self):
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM meta WHERE key = ?', ('watcher_heartbeat',)
+            )
+
+    def is_live(self):
+        """Checks whether a watcher currently keeps the index up to date"""
+        now = time.time()
+        if (self._live_checked_at is None or
+                now - self._live_checked_at > LIVENESS_CACHE_DURATION):
+            row = self.connection.execute(
+                'SELECT value FROM meta WHERE key = ?', ('watcher_heartbeat',)
+            ).fetchone()
+            self._live = (
+                row is not None and now - row[0] < 2 * WATCHER_HEARTBEAT
+            )
+            self._live_checked_at = now
+        return self._live
+
+    def _lookup(self, path, mtime, deep, full=False):
+        rel = self.relpath(path)
+        with self.connection:
+            old_size = self._get_size(rel)
+            size = self._sync_dir(rel, path, mtime, deep, full)
+            # Parent directories were not modified, but their total size was
+            if old_size is not None and size != old_size:
+                self._add_to_ancestors(rel, size - old_size)
+        return size
+
+    def _sync_dir(self, rel, path, mtime, deep, full=False):
+        """
+        Returns the total size of a directory, rescanning its content if its
+        mtime changed (or always if full is True). If deep is True, indexed
+        sub directories are checked even if the directory itself is
+        unmodified.
+        """
+        row = self.connection.execute(
+            'SELECT size, mtime FROM entries WHERE path = ? AND isdir = 1',
+            (rel,)
+        ).fetchone()
+        if row is not None and row[1] == mtime and not full:
+            if not deep:
+                return row[0]
+            size = self._sync_indexed_children(rel, path)
+        else:
+            size = self._scan_dir(rel, path, deep, full)
+        self._store(rel, True, size, mtime)
+        self._keep_alive()
+        return size
+
+    def _keep_alive(self):
+        """Sends a heartbeat if one is due during an update (see update)"""
+        if self._kept_alive_at is None or (
+                time.time() - self._kept_alive_at < WATCHER_HEARTBEAT / 2):
+            return
+        # Other processes only see a committed heartbeat
+        self.connection.commit()
+        self.heartbeat()
+        self._kept_alive_at = time.time()
+
+    def _sync_indexed_children(self, rel, path):
+        """Sums the indexed children sizes, checking sub directories"""
+        total_size = 0
+        children = self.connection.execute(
+            'SELECT name, isdir, size, islink FROM entries WHERE parent = ?',
+            (rel,)
+        ).fetchall()
+        for name, isdir, size, islink in children:
+            if islink:
+                continue
+            if isdir:
+                child_path = posixpath.join(path, name)
+                try:
+                    st = os.stat(child_path)
+                except OSError:
+                    # Removed since the listing, next lookup will fix it
+                    continue
+                size = self._sync_dir(
+                    posixpath.join(rel, name), child_path, st.st_mtime_ns,
+                    deep=True
+                )
+            total_size += size
+        return total_size
+
+    def _scan_dir(self, rel, path, deep, full=False):
+        """Lists a directory and indexes its children"""
+        indexed = {
+            name: (bool(isdir), bool(islink))
+            for name, isdir, islink in self.connection.execute(
+                'SELECT name, isdir, islink FROM entries WHERE parent = ?',
+                (rel,)
+            )
+        }
+        total_size = 0
+        for dir_entry in scandir(path):
+            name = dir_entry.name
+            child_path = posixpath.join(path, name)
+            child_rel = posixpath.join(rel, name)
+            try:
+                st = dir_entry.stat()
+            except OSError:
+                # Broken symbolic link
+                continue
+            isdir = stat.S_ISDIR(st.st_mode)
+            islink = isdir and dir_entry.is_symlink()
+            old_type = indexed.pop(name, None)
+            if old_type is not None and old_type != (isdir, islink):
+                self._delete(child_rel)
+                old_type = None
+            if islink:
+                # Like os.walk, do not follow symbolic links to directories
+                # to avoid infinite loops, only list them
+                if old_type is None:
+                    self._store_link(child_rel)
+            elif isdir:
+                total_size += self._sync_dir(
+                    child_rel, child_path, st.st_mtime_ns, deep, full
+                )
+            elif stat.S_ISREG(st.st_mode):
+                self._store(child_rel, False, st.st_size, st.st_mtime_ns)
+                total_size += st.st_size
+
+        # Entries left were removed from the directory
+        for name in indexed:
+            self._delete(posixpath.join(rel, name))
+
+        return total_size
+
+    def _get_epoch(self):
+        """
+        Returns the random epoch of the change log, telling its sequence
+        numbers apart from those of a log created again
+        """
+        epoch = self._get_meta('changes_epoch')
+        if epoch is None:
+            # Another process may be creating it too
+            self.connection.execute(
+                'INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)',
+                ('changes_epoch', binascii.hexlify(os.urandom(4)).decode(
+                    'ascii'
+                ))
+            )
+            epoch = self._get_meta('changes_epoch')
+        return epoch
+
+    def _get_last_seq(self):
+        row = self.connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def _get_meta(self, key):
+        row = self.connection.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def _get_size(self, rel):
+        """
+        Returns the indexed size of an entry, None if it is not indexed, or
+        if it is a link to a directory or below one: the watcher does not
+        follow them, and they are not part of the size of their parents
+        """
+        paths = [rel]
+        while rel:
+            rel = posixpath.dirname(rel)
+            paths.append(rel)
+        rows = {
+            path: (size, islink)
+            for path, size, islink in self.connection.execute(
+                'SELECT path, size, islink FROM entries'
+                ' WHERE path IN ({0})'.format(', '.join('?' * len(paths))),
+                paths
+            )
+        }
+        if paths[0] not in rows or any(
+                islink for size, islink in rows.values()):
+            return None
+        return rows[paths[0]][0]
+
+    def _add_to_ancestors(self, rel, delta):
+        while rel:
+            rel = posixpath.dirname(rel)
+            self.connection.execute(
+                'UPDATE entries SET size = size + ? WHERE path = ?',
+                (delta, rel)
+            )
+
+    def _store(self, rel, isdir, size, mtime):
+        # Existing entries are updated in place: replacing them would change
+        # their id, hence their row in the names index
+        cursor = self.connection.execute(
+            'UPDATE entries SET isdir = ?, size = ?, mtime = ? WHERE path = ?',
+            (int(isdir), size, mtime, rel)
+        )
+        if cursor.rowcount:
+            return
+        # The root has no parent, it must not be listed among its children
+        parent, name = posixpath.split(rel) if rel else (None, '')
+        self.connection.execute(
+            'INSERT INTO entries (path, parent, name, isdir, size, mtime)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (rel, parent, name, int(isdir), size, mtime)
+        )
+
+    def _store_link(self, rel):
+        """
+        Lists a symbolic link to a directory, without following it. Looking
+        up the link path itself (see get_size) then stores the size and mtime
+        of its target on the link entry, and indexes the target content
+        below the link path. These entries only spare the scans of later
+        lookups: their sizes are never served (see _get_size), and search
+        and get_changes leave them out (see BELOW_LINK).
+        """
+        parent, name = posixpath.split(rel)
+        self.connection.execute(
+            'INSERT INTO entries (path, parent, name, isdir, size, mtime,'
+            ' islink) VALUES (?, ?, ?, 1, 0, 0, 1)',
+            (rel, parent, name)
+        )
+
+    def _delete(self, rel):
+        """Removes an entry and all the entries below it"""
+        # '0' is the character following '/': selects the 'rel/...' range
+        self.connection.execute(
+            'DELETE FROM entries WHERE path = ? OR (path > ? AND path < ?)',
+            (rel, rel + '/', rel + '0')
+        )
+
+
+share_index = ShareIndex(posixpath.join(SHARE_CACHE_ROOT, 'index.sqlite3'))
@@ -0,0 +1,70 @@
+"""
+Counting of the filesystem calls made by share browsing.
+
+Used by the benchmarks (see share.benchmarks) and by the tests asserting how
+many calls listings cost.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import os
+from unittest import mock
+
+from share import index, utils
+
+
+class CountingDirEntry:
+    """
+    Wraps an os.DirEntry to count the stat calls it really makes (results
+    are cached by the entry)
+    """
+
+    def __init__(self, dir_entry, counts):
+        self._dir_entry = dir_entry
+        self._counts = counts
+        self._stat_calls = set()
+        self.name = dir_entry.name
+        self.path = dir_entry.path
+
+    def is_dir(self, follow_symlinks=True):
+        return self._dir_entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self._dir_entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self._dir_entry.is_symlink()
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks not in self._stat_calls:
+            self._stat_calls.add(follow_symlinks)
+            self._counts['stat'] += 1
+        return self._dir_entry.stat(follow_symlinks=follow_symlinks)
+
+
+@contextmanager
+def count_syscalls():
+    """
+    Counts the filesystem metadata calls (stat, lstat, listdir, scandir) made
+    within the block, including those of os.path and directory entries
+    """
+    counts = Counter()
+    real_scandir = index.scandir
+
+    def counting(name, func):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def counting_scandir(path):
+        counts['scandir'] += 1
+        for dir_entry in real_scandir(path):
+            yield CountingDirEntry(dir_entry, counts)
+
+    with mock.patch('os.stat', counting('stat', os.stat)), \
+            mock.patch('os.lstat', counting('lstat', os.lstat)), \
+            mock.patch('os.listdir', counting('listdir', os.listdir)), \
+            mock.patch.object(index, 'scandir', counting_scandir), \
+            mock.patch.object(utils, 'scandir', counting_scandir):
+        yield counts
@@ -0,0 +1,74 @@
+"""
+Signed, expiring download links of the shared files.
+
+A link holds the path of a file relative to SHARE_ROOT, its expiration time
+and an HMAC-SHA256 signature of both, keyed with SHARE_LINK_KEY. Anyone
+holding a link can download the file until it expires, without an account:
+links are checked by the link server (see share.linkserver), without
+database nor session. Changing the key revokes all the links.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.http import urlencode, urlquote
+
+from share.settings import SHARE_LINK_KEY, SHARE_LINK_URL
+
+
+# Default lifetime of the links, in seconds
+LINK_AGE = 24 * 3600
+
+
+class InvalidLink(Exception):
+    """Raised when a link was not signed with the key"""
+    pass
+
+
+class ExpiredLink(InvalidLink):
+    """Raised when a link is past its expiration time"""
+    pass
+
+
+def get_signature(path, expires, key=SHARE_LINK_KEY):
+    if not key:
+        raise ImproperlyConfigured("'DJANGO_SHARE_LINK_KEY' setting is empty")
+    # Not the secret key itself, should it be the Django one
+    key = hashlib.sha256(b'share.links\0' + key.encode('utf-8')).digest()
+    message = '{0}\0{1:d}'.format(path, expires)
+    digest = hmac.new(
+        key, message.encode('utf-8', 'surrogateescape'), hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+
+def make_link(path, age=LINK_AGE, key=SHARE_LINK_KEY):
+    """
+    Returns the URL (without host) downloading a file for age seconds, and
+    its expiration time. path is relative to SHARE_ROOT.
+    """
+    expires = int(time.time()) + age
+    query = urlencode({
+        'expires': expires,
+        'signature': get_signature(path, expires, key)
+    })
+    return '{0}{1}?{2}'.format(SHARE_LINK_URL, urlquote(path), query), expires
+
+
+def check_link(path, expires, signature, key=SHARE_LINK_KEY):
+    """
+    Raises InvalidLink unless the expiration time and signature of a link
+    are valid for path, ExpiredLink if the link is past its expiration
+    """
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        raise InvalidLink(path)
+    if not hmac.compare_digest(
+            get_signature(path, expires, key), signature or ''):
+        raise InvalidLink(path)
+    if time.time() > expires:
+        raise ExpiredLink(path)
@@ -0,0 +1,74 @@
+"""
+WSGI application serving the signed download links (see share.links).
+
+It is mounted by the front web server under SHARE_LINK_URL, apart from the
+site: requests go through none of the Django middlewares, and neither the
+database nor the sessions are ever touched. Only the link signature is
+checked, then the file is sent with the configured download backend, like
+share downloads (X-SendFile, X-Accel-Redirect...).
+
+See madmox_website/links_wsgi.py for the WSGI entry point.
+"""
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed
+)
+
+from share import settings
+from share.downloads import send_file
+from share.links import ExpiredLink, InvalidLink, check_link
+from share.serving import serve_file, use_file_wrapper
+from share.utils import path_resolver
+
+
+def serve_link(request):
+    """Returns the response to a download link request"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    # Relative to the mount point
+    path = request.path_info.lstrip('/')
+    try:
+        check_link(
+            path, request.GET.get('expires'), request.GET.get('signature')
+        )
+    except ExpiredLink:
+        return HttpResponse(status=410)
+    except InvalidLink:
+        return HttpResponseForbidden()
+
+    node = path_resolver.get_node(path)
+    if node is None or node.isdir:
+        raise Http404()
+
+    if settings.SHARE_DOWNLOAD_BACKEND == 'async':
+        # The asyncio download server requires a session
+        response = serve_file(request, node.path, node.mime_type)
+    else:
+        response = send_file(request, node.path, node.mime_type)
+    response['Content-Disposition'] = (
+        'attachment; filename="{0}"'
+    ).format(node.name)
+    # Only the link holder may keep a copy
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def handle(environ, start_response):
+    request = WSGIRequest(environ)
+    try:
+        response = serve_link(request)
+    except Http404:
+        response = HttpResponse(status=404)
+    status = '{0} {1}'.format(response.status_code, response.reason_phrase)
+    start_response(status, [
+        (str(name), str(value)) for name, value in response.items()
+    ])
+    return response
+
+
+application = use_file_wrapper(handle)
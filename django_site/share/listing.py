@@ -0,0 +1,139 @@
+"""
+Paginated listings of shared directories.
+
+Directories come first, then files, each sorted by name, size or mtime (the
+name breaking ties). Pages are cut with keyset cursors: a cursor holds the
+sort key of the last entry of a page, and the next page starts right after
+it. Entries added or removed between two requests thus never shift the
+following pages, and no entry is listed twice.
+
+Only the entries of the requested page are fully built: a page of a huge
+directory sorted by name costs the directory listing and the stat calls of
+its own entries, nothing more. Their metadata are read in parallel (see
+share.metadata): entries whose size is still being computed when the
+deadline of the request expires sort as if it were -1.
+"""
+
+import base64
+import binascii
+import heapq
+import json
+from operator import itemgetter
+
+from share.metadata import metadata_fetcher
+
+
+SORT_FIELDS = ('name', 'size', 'mtime')
+ORDERS = ('asc', 'desc')
+
+# Number of entries per page
+PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor can't be decoded or does not match the sort"""
+    pass
+
+
+def sort_key(node, sort):
+    """
+    Returns the key of a node in a listing sorted by the given field. The
+    first item puts directories first, whatever the order.
+    """
+    key = (node.name.lower(), node.name)
+    if sort != 'name':
+        value = getattr(node, sort)
+        # Still being computed
+        key = (-1 if value is None else value,) + key
+    return (0 if node.isdir else 1,) + key
+
+
+def encode_cursor(sort, order, key):
+    data = json.dumps([sort, order] + list(key), separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort, order):
+    """Returns the sort key held by a cursor"""
+    try:
+        data = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        )
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor(cursor)
+    # Group, sort value for sizes and mtimes, lowercased name, name
+    types = (int,) + ((int,) if sort != 'name' else ()) + (str, str)
+    if not isinstance(data, list) or data[:2] != [sort, order] or (
+            len(data) != 2 + len(types)):
+        raise InvalidCursor(cursor)
+    key = tuple(data[2:])
+    # A wrongly typed key would fail the comparisons of list_page
+    if key[0] not in (0, 1) or any(
+            isinstance(value, bool) or not isinstance(value, value_type)
+            for value, value_type in zip(key, types)):
+        raise InvalidCursor(cursor)
+    return key
+
+
+def list_page(node, sort='name', order='asc', cursor=None, limit=PAGE_SIZE,
+              deadline=None):
+    """
+    Returns the children of a directory node following the cursor (from the
+    first one if cursor is None), at most limit of them, and the cursor of
+    the next page (None for the last page). Metadata are waited for until
+    deadline (see share.metadata.MetadataFetcher.fetch).
+    """
+    after = None if cursor is None else decode_cursor(cursor, sort, order)
+    descending = order == 'desc'
+    select = heapq.nlargest if descending else heapq.nsmallest
+
+    groups = ([], [])
+    for child in node.iter_children():
+        groups[0 if child.isdir else 1].append(child)
+    if sort != 'name':
+        # Sort keys of all the children
+        metadata_fetcher.fetch(groups[0] + groups[1], deadline)
+
+    # One more entry tells whether there is a next page
+    wanted = limit + 1
+    page = []
+    for group, children in enumerate(groups):
+        if after is not None and group < after[0]:
+            continue
+        candidates = []
+        for child in children:
+            key = sort_key(child, sort)
+            if after is not None and group == after[0] and not (
+                    key < after if descending else key > after):
+                continue
+            candidates.append((key, child))
+        page.extend(select(wanted - len(page), candidates, key=itemgetter(0)))
+        if len(page) == wanted:
+            break
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(sort, order, page[-1][0])
+    children = [child for key, child in page]
+    metadata_fetcher.fetch(children, deadline)
+    return children, next_cursor
+
+
+def parse_query(query):
+    """
+    Returns the sort, order, cursor and limit of a listing from a query dict.
+    Raises ValueError if one of them is invalid.
+    """
+    sort = query.get('sort', 'name')
+    order = query.get('order', 'asc')
+    if sort not in SORT_FIELDS or order not in ORDERS:
+        raise ValueError('Invalid sort')
+    cursor = query.get('cursor') or None
+    if cursor is not None:
+        decode_cursor(cursor, sort, order)
+    limit = int(query.get('limit', PAGE_SIZE))
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError('Invalid limit')
+    return sort, order, cursor, limit
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from share import benchmarks
+
+import json
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    args = '[tree ...]'
+    help = (
+        'Benchmarks share browsing on synthetic trees ({0}) and prints the '
+        'results as JSON'.format(', '.join(benchmarks.TREES))
+    )
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--scale', type='float', default=1.0,
+            help='Multiplies the number of entries of the trees'
+        ),
+        make_option(
+            '--runs', type='int', default=5,
+            help='Number of timed runs of each operation'
+        ),
+        make_option(
+            '--cold', action='store_true', default=False,
+            help='Clears the share caches before each run'
+        ),
+        make_option(
+            '--output', default=None,
+            help='Writes the results to this file instead of stdout'
+        ),
+    )
+    
+    def handle(self, *args, **options):
+        for tree in args:
+            if tree not in benchmarks.TREES:
+                raise CommandError('{0} is not a valid tree'.format(tree))
+        if options['runs'] < 1 or options['scale'] <= 0:
+            raise CommandError('--runs and --scale must be positive')
+        
+        results = benchmarks.run(
+            args or benchmarks.TREES,
+            scale=options['scale'],
+            runs=options['runs'],
+            cold=options['cold']
+        )
+        data = json.dumps(results, indent=2)
+        if options['output'] is None:
+            self.stdout.write(data)
+        else:
+            with open(options['output'], 'w') as f:
+                f.write(data + '\n')
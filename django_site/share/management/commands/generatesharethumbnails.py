@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from share.thumbnails import thumbnail_cache
+from share.utils import get_physical_path
+
+
+class Command(BaseCommand):
+    args = '[path ...]'
+    help = 'Generates the missing thumbnails of the share images'
+    
+    def handle(self, *args, **options):
+        for path in args or ('',):
+            filepath = get_physical_path(path)
+            if filepath is None:
+                raise CommandError('{0} does not exist'.format(path))
+            thumbnail_cache.generate_dir(filepath, recursive=True)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import asyncio
+except ImportError:
+    # Python 3.3 without the asyncio package
+    asyncio = None
+
+
+class Command(BaseCommand):
+    args = '[[host:]port]'
+    help = 'Runs the asyncio download server of the share'
+    
+    def handle(self, addrport='127.0.0.1:8001', *args, **options):
+        if asyncio is None:
+            raise CommandError(
+                'The download server requires Python 3.4 or later, or the '
+                'asyncio package'
+            )
+        from share.asyncserver import DownloadServer
+
+        host, sep, port = addrport.rpartition(':')
+        if not port.isdigit():
+            raise CommandError('{0} is not a valid port'.format(port))
+        
+        loop = asyncio.get_event_loop()
+        server = DownloadServer(loop=loop)
+        loop.run_until_complete(server.start(host or '127.0.0.1', int(port)))
+        self.stdout.write('Serving share downloads on {0}:{1}'.format(
+            host or '127.0.0.1', port
+        ))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.close()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from share.hotcache import hot_file_cache
+
+import json
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints the statistics of the hot file cache (hits, misses, '
+        'evictions...) as JSON'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--clear', action='store_true', default=False,
+            help='Empties the cache and resets its statistics afterwards'
+        ),
+    )
+    
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(hot_file_cache.get_stats(), indent=2))
+        if options['clear']:
+            hot_file_cache.clear()
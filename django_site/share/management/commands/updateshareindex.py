@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from share.index import share_index
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = 'Rescans the modified directories of the share and updates sizes'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--full', action='store_true', default=False,
+            help=(
+                'Rescans all the directories, finding the files rewritten in '
+                'place'
+            )
+        ),
+    )
+    
+    def handle(self, *args, **options):
+        share_index.update(full=options['full'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from share.watcher import ShareWatcher
+
+
+class Command(BaseCommand):
+    help = 'Keeps the share index live by watching filesystem events'
+    
+    def handle(self, *args, **options):
+        try:
+            ShareWatcher().run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,479 @@
+"""
+Browsing of the zip and tar archives of the share, as directories.
+
+The URL of an archive followed by a slash ('dir/archive.zip/') lists the
+archive as a directory, and the URLs below it list its directories or
+download its members. Listings only read the central directory of zip
+archives, and the headers of tar archives (seeking over the data of their
+members). They are kept in memory by archive, as long as its device, inode,
+mtime and size do not change.
+
+Members are streamed out of the archive from their offset, nothing is ever
+extracted to disk: stored zip members and members of uncompressed tar
+archives are sent like files (with sendfile(2) if the WSGI server can, see
+share.serving.use_file_wrapper), deflated zip members are inflated on the
+fly. Compressed tar archives can't be seeked: listing them, or reaching one
+of their members, decompresses them up to there. Those larger than
+MAX_COMPRESSED_SIZE are thus not browsed.
+"""
+
+from collections import OrderedDict, defaultdict, namedtuple
+import hashlib
+import mimetypes
+import os
+import posixpath
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+from django.core.urlresolvers import reverse
+from django.http import (
+    FileResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse
+)
+from django.utils.http import http_date, quote_etag
+
+from share.serving import BLOCK_SIZE, FileRange, is_not_modified
+from share.settings import SHARE_ROOT
+from share.utils import path_resolver
+
+
+# Total number of archive members kept in memory, by process
+ARCHIVE_CACHE_MEMBERS = 200000
+
+# Archives with more members are not browsed
+MAX_MEMBERS = 100000
+
+# Compressed tar archives larger than this (in bytes) are not browsed: they
+# are decompressed by the requests listing them
+MAX_COMPRESSED_SIZE = 64 * 1024 * 1024
+
+# Archive types by file name suffix, with their tarfile compression
+ARCHIVE_SUFFIXES = (
+    ('.zip', 'zip', None),
+    ('.tar', 'tar', ''),
+    ('.tar.gz', 'tar', 'gz'),
+    ('.tgz', 'tar', 'gz'),
+)
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+ZIP_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+class InvalidArchive(Exception):
+    """Raised when an archive can't be read"""
+    pass
+
+
+Member = namedtuple('Member', 'isdir size mtime info')
+
+
+def get_archive_type(name):
+    """
+    Returns the type ('zip' or 'tar') and tarfile compression of an archive
+    from its file name, (None, None) if it is not a browsable archive
+    """
+    name = name.lower()
+    for suffix, archive_type, compression in ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            return archive_type, compression
+    return None, None
+
+
+def is_browsable(name, size):
+    """
+    Checks whether a file of the given name and size (None if unknown) can
+    be browsed as an archive
+    """
+    archive_type, compression = get_archive_type(name)
+    if archive_type is None:
+        return False
+    return not compression or size is None or size <= MAX_COMPRESSED_SIZE
+
+
+def clean_member_path(path):
+    """
+    Returns the normalized path of a member, None if it goes up the archive
+    """
+    segments = [
+        segment for segment in path.split('/') if segment not in ('', '.')
+    ]
+    if '..' in segments:
+        return None
+    return '/'.join(segments)
+
+
+def get_zip_mtime(info):
+    try:
+        return int(time.mktime(info.date_time + (0, 0, -1))) * 10 ** 9
+    except (OverflowError, ValueError):
+        return 0
+
+
+def read_zip(path):
+    """Yields the path, type, size, mtime and ZipInfo of the zip members"""
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            isdir = info.filename.endswith('/')
+            yield (
+                info.filename, isdir, 0 if isdir else info.file_size,
+                get_zip_mtime(info), info
+            )
+
+
+def read_tar(path, compression):
+    """
+    Yields the path, type, size, mtime and TarInfo of the tar members, but
+    links and special files
+    """
+    with tarfile.open(path, 'r:' + compression) as archive:
+        for info in archive:
+            if info.isdir():
+                yield info.name, True, 0, int(info.mtime) * 10 ** 9, info
+            elif info.isfile():
+                yield (
+                    info.name, False, info.size, int(info.mtime) * 10 ** 9,
+                    info
+                )
+
+
+def index_members(entries, mtime):
+    """
+    Returns the members of an archive by normalized path, from its entries
+    """
+    members = {'': Member(True, 0, mtime, None)}
+    for member_path, isdir, size, member_mtime, info in entries:
+        member_path = clean_member_path(member_path)
+        if not member_path:
+            continue
+        if len(members) > MAX_MEMBERS:
+            raise InvalidArchive('Too many members')
+        # The last one of a path wins, as when extracting
+        members[member_path] = Member(isdir, size, member_mtime, info)
+
+    # Parent directories, with the total size of their files
+    sizes = defaultdict(int)
+    for member_path, member in list(members.items()):
+        if member.isdir:
+            continue
+        parent = member_path
+        while parent:
+            parent = posixpath.dirname(parent)
+            sizes[parent] += member.size
+            if parent not in members or not members[parent].isdir:
+                members[parent] = Member(True, 0, mtime, None)
+    for member_path, size in sizes.items():
+        members[member_path] = members[member_path]._replace(size=size)
+    return members
+
+
+class Archive:
+    """
+    The members of an archive by path, directories included: those only
+    implied by the paths of their members too
+    """
+
+    def __init__(self, path, st):
+        self.path = path
+        self.key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        self.type, self.compression = get_archive_type(path)
+        if self.type is None or not is_browsable(path, st.st_size):
+            raise InvalidArchive(path)
+        try:
+            if self.type == 'zip':
+                entries = read_zip(path)
+            else:
+                entries = read_tar(path, self.compression)
+            self.members = index_members(entries, st.st_mtime_ns)
+        except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError,
+                zlib.error) as e:
+            raise InvalidArchive(path) from e
+
+        self.children = defaultdict(list)
+        for member_path in self.members:
+            if member_path:
+                parent, name = posixpath.split(member_path)
+                self.children[parent].append(name)
+
+
+class ArchiveCache:
+    """
+    Listings of the most recently browsed archives, up to max_members
+    members in all (the last archive read is kept whatever its size)
+    """
+
+    def __init__(self, max_members=ARCHIVE_CACHE_MEMBERS):
+        self.max_members = max_members
+        self._cache = OrderedDict()
+        self._members = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Returns the Archive at a physical path, read again if it changed.
+        Raises InvalidArchive if it can't be read.
+        """
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            raise InvalidArchive(path) from e
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            archive = self._cache.get(path)
+            if archive is not None and archive.key == key:
+                self._cache.move_to_end(path)
+                return archive
+
+        archive = Archive(path, st)
+        with self._lock:
+            old_archive = self._cache.pop(path, None)
+            if old_archive is not None:
+                self._members -= len(old_archive.members)
+            self._cache[path] = archive
+            self._members += len(archive.members)
+            while self._members > self.max_members and len(self._cache) > 1:
+                path, old_archive = self._cache.popitem(last=False)
+                self._members -= len(old_archive.members)
+        return archive
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._members = 0
+
+
+archive_cache = ArchiveCache()
+
+
+class MemberNode:
+    """
+    A member of an archive, with the attributes of FileSystemNode used by
+    listings
+    """
+
+    in_archive = True
+    isroot = False
+    metadata_known = True
+
+    def __init__(self, archive, archive_url, member_path):
+        self.archive = archive
+        # URL path of the archive itself
+        self.archive_url = archive_url
+        self.member_path = member_path
+        member = archive.members[member_path]
+        self.isdir = member.isdir
+        self.size = member.size
+        self.mtime = member.mtime
+        self.info = member.info
+
+    @property
+    def isfile(self):
+        return not self.isdir
+
+    @property
+    def name(self):
+        return posixpath.basename(self.member_path or self.archive_url)
+
+    @property
+    def path(self):
+        """Physical path of the member, were the archive extracted there"""
+        return posixpath.join(
+            SHARE_ROOT, self.archive_url, self.member_path
+        ).rstrip('/')
+
+    @property
+    def url(self):
+        url = '{0}/{1}'.format(self.archive_url, self.member_path)
+        if self.isdir and self.member_path:
+            url += '/'
+        return url
+
+    @property
+    def display_path(self):
+        return '/' + self.url.rstrip('/')
+
+    @property
+    def parent_url(self):
+        if not self.member_path:
+            parent_url = posixpath.dirname(self.archive_url)
+            return parent_url + '/' if parent_url else ''
+        return posixpath.join(
+            self.archive_url, posixpath.dirname(self.member_path), ''
+        )
+
+    @property
+    def mime_type(self):
+        if self.isdir:
+            return None
+        return mimetypes.guess_type(self.name)[0] or (
+            'application/octet-stream'
+        )
+
+    def iter_children(self):
+        """
+        Yields the child nodes, in no particular order
+        """
+        if self.isfile:
+            return
+        for name in self.archive.children.get(self.member_path, ()):
+            yield MemberNode(
+                self.archive, self.archive_url,
+                posixpath.join(self.member_path, name)
+            )
+
+
+def get_member_node(path):
+    """
+    Returns the MemberNode of a URL path below an archive of the share
+    ('dir/archive.zip/member', 'dir/archive.zip/' for the archive itself),
+    or None if there is none
+    """
+    segments = path.split('/')
+    # The archive URL alone is the archive file
+    for index in range(1, len(segments)):
+        if get_archive_type(segments[index - 1])[0] is None:
+            continue
+        filepath, isdir = path_resolver.resolve('/'.join(segments[:index]))
+        if filepath is None or isdir:
+            continue
+        member_path = clean_member_path('/'.join(segments[index:]))
+        if member_path is None:
+            return None
+        try:
+            archive = archive_cache.get(filepath)
+        except InvalidArchive:
+            return None
+        if member_path not in archive.members:
+            return None
+        archive_url = posixpath.relpath(filepath, SHARE_ROOT)
+        return MemberNode(archive, archive_url, member_path)
+    return None
+
+
+def get_archive_url(node):
+    """
+    Returns the URL browsing an archive node as a directory, None for other
+    nodes
+    """
+    if node.isdir or node.in_archive or get_archive_type(node.name)[0] is None:
+        return None
+    if not is_browsable(node.name, node.size):
+        return None
+    return reverse('share:browse', args=(node.url + '/',))
+
+
+def get_zip_data_offset(path, info):
+    """Returns the offset of the data of a zip member, after its header"""
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(ZIP_LOCAL_HEADER.size)
+    if len(header) != ZIP_LOCAL_HEADER.size:
+        raise InvalidArchive(path)
+    signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(header)
+    if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+        raise InvalidArchive(path)
+    return (
+        info.header_offset + ZIP_LOCAL_HEADER.size + name_length +
+        extra_length
+    )
+
+
+def iter_inflated(path, offset, info):
+    """Yields the blocks of a deflated zip member, checking its CRC"""
+    compressed = FileRange(path, offset, info.compress_size)
+    try:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        size, crc = 0, 0
+        while not decompressor.eof:
+            data = decompressor.unconsumed_tail or compressed.read(BLOCK_SIZE)
+            if not data:
+                break
+            # Bounded output, whatever the compression ratio
+            try:
+                data = decompressor.decompress(data, BLOCK_SIZE)
+            except zlib.error as e:
+                raise InvalidArchive(info.filename) from e
+            size += len(data)
+            if size > info.file_size:
+                break
+            crc = zlib.crc32(data, crc)
+            yield data
+    finally:
+        compressed.close()
+    if size != info.file_size or crc != info.CRC:
+        # Too late for an error status: the client sees a truncated file
+        raise InvalidArchive('Bad member {0}'.format(info.filename))
+
+
+def iter_member_file(open_archive, open_member):
+    """Yields the blocks of a member opened by the archive modules"""
+    with open_archive() as archive, open_member(archive) as member:
+        while True:
+            data = member.read(BLOCK_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def open_member(node):
+    """
+    Returns a FileRange of the data of a member stored as is in its archive,
+    or else an iterator over its blocks
+    """
+    archive, info = node.archive, node.info
+    if archive.type == 'zip':
+        encrypted = info.flag_bits & 0x1
+        if not encrypted and info.compress_type == zipfile.ZIP_STORED:
+            offset = get_zip_data_offset(archive.path, info)
+            return FileRange(archive.path, offset, info.file_size)
+        if not encrypted and info.compress_type == zipfile.ZIP_DEFLATED:
+            offset = get_zip_data_offset(archive.path, info)
+            return iter_inflated(archive.path, offset, info)
+        # Other compressions, left to zipfile
+        return iter_member_file(
+            lambda: zipfile.ZipFile(archive.path),
+            lambda zip_file: zip_file.open(info)
+        )
+    if not archive.compression and not info.issparse():
+        return FileRange(archive.path, info.offset_data, info.size)
+    return iter_member_file(
+        lambda: tarfile.open(archive.path, 'r:' + archive.compression),
+        lambda tar_file: tar_file.extractfile(info)
+    )
+
+
+def serve_member(request, node):
+    """
+    Returns a response streaming a member of an archive, unless the client
+    copy is still valid
+    """
+    dev, ino, mtime, size = node.archive.key
+    etag = quote_etag('{0:x}-{1:x}-{2}'.format(
+        ino, mtime, hashlib.sha1(
+            node.member_path.encode('utf-8', 'surrogateescape')
+        ).hexdigest()[:16]
+    ))
+    if request.method in ('GET', 'HEAD') and (
+            is_not_modified(request, etag, node.mtime / 10 ** 9)):
+        response = HttpResponseNotModified()
+    else:
+        content = open_member(node)
+        if isinstance(content, FileRange):
+            response = FileResponse(content, content_type=node.mime_type)
+            response.block_size = BLOCK_SIZE
+            response.file_to_stream = content
+        else:
+            response = StreamingHttpResponse(
+                content, content_type=node.mime_type
+            )
+        response['Content-Length'] = str(node.size)
+        response['Content-Disposition'] = (
+            'attachment; filename="{0}"'
+        ).format(node.name)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(node.mtime / 10 ** 9)
+    return response
@@ -0,0 +1,113 @@
+"""
+Parallel reading of the metadata of listed entries.
+
+On a network filesystem every stat call is a round trip to the server, and
+reading the mtimes and sizes of a large directory one entry after the other
+takes seconds. The metadata of the entries of a listing are read by a pool
+of threads instead, shared by all the requests of a web process: its size
+bounds the number of calls in flight on the filesystem.
+
+Listings only wait for them until their deadline. The entries still being
+read are displayed without size (see the 'print_size' filter), and their
+reading goes on in the background: directory sizes end up in the share
+index, so that the next listing gets them at once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import stat
+import threading
+import time
+
+from share.index import share_index
+from share.settings import SHARE_METADATA_DEADLINE, SHARE_METADATA_WORKERS
+
+
+def get_deadline(timeout=SHARE_METADATA_DEADLINE):
+    """
+    Returns the deadline of a request started now, in time.monotonic()
+    seconds, or None if it may wait as long as needed
+    """
+    if timeout <= 0:
+        return None
+    return time.monotonic() + timeout
+
+
+def read_metadata(path):
+    """Returns the mtime (in nanoseconds) and total size of an entry"""
+    st = os.stat(path)
+    if stat.S_ISDIR(st.st_mode):
+        return st.st_mtime_ns, share_index.get_dir_size(path, st.st_mtime_ns)
+    return st.st_mtime_ns, st.st_size
+
+
+class MetadataFetcher:
+    """
+    Reads the metadata of FileSystemNode objects with a pool of threads,
+    started on first use
+    """
+
+    def __init__(self, workers=SHARE_METADATA_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, nodes, deadline=None):
+        """
+        Sets the mtime and size of nodes, waiting for them until deadline
+        (in time.monotonic() seconds, forever if None). Those still being
+        read are set to None.
+        """
+        if self.workers <= 0:
+            # Read sequentially, when the properties are accessed
+            return
+        futures = {}
+        for node in nodes:
+            if not node.metadata_known:
+                futures[node] = self.schedule(node.path)
+        if not futures:
+            return
+
+        timeout = None
+        if deadline is not None:
+            timeout = max(0, deadline - time.monotonic())
+        wait(futures.values(), timeout)
+
+        for node, future in futures.items():
+            if not future.done():
+                node.set_metadata(None, None)
+            elif future.exception() is None:
+                node.set_metadata(*future.result())
+            # Otherwise read again when needed, raising the error then
+
+    def schedule(self, path):
+        """
+        Returns the future metadata of an entry, the one already being read
+        if any: a listing reloaded before the end of the previous one does
+        not read them twice
+        """
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers)
+            future = self._executor.submit(read_metadata, path)
+            self._pending[path] = future
+        future.add_done_callback(lambda f: self._forget(path, f))
+        return future
+
+    def wait(self):
+        """Waits for the metadata being read"""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures)
+
+    def _forget(self, path, future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+
+
+metadata_fetcher = MetadataFetcher()
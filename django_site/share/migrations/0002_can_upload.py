@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def create_permission(apps, schema_editor):
+    """Create the share 'can upload' global permission"""
+    
+    ContentType = apps.get_model("contenttypes.ContentType")
+    Permission = apps.get_model("auth.Permission")
+    
+    ct, created = ContentType.objects.get_or_create(
+        name="global_permission",
+        app_label='share',
+        model=''
+    )
+    
+    perm, created = Permission.objects.get_or_create(
+        codename='can_upload',
+        content_type=ct,
+        defaults={'name': 'Can upload'}
+    )
+
+
+def delete_permission(apps, schema_editor):
+    """Delete the share 'can upload' global permission"""
+    
+    ContentType = apps.get_model("contenttypes.ContentType")
+    Permission = apps.get_model("auth.Permission")
+    
+    # Gets content type
+    ct = ContentType.objects.get(
+        name="global_permission",
+        app_label='share',
+        model=''
+    )
+    
+    # Deletes permission
+    Permission.objects.get(
+        codename='can_upload',
+        content_type=ct
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('share', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_permission, delete_permission),
+    ]
@@ -0,0 +1,155 @@
+"""
+Cached MIME type detection of the shared files.
+
+libmagic reads the file header to detect its MIME type, so results are kept
+in a bounded SQLite cache under SHARE_CACHE_ROOT, keyed by (device, inode,
+mtime, size): they survive worker restarts and are ignored as soon as the
+file changes. Without python-magic, MIME types are guessed from the file
+names, which is cheap enough not to be cached.
+"""
+
+import mimetypes
+import os
+import posixpath
+import stat
+import sys
+import time
+try:
+    import magic
+except ImportError:
+    pass
+try:
+    from os import scandir
+except ImportError:
+    # Python < 3.5
+    from scandir import scandir
+
+from share.settings import SHARE_CACHE_ROOT, SHARE_MIME_CACHE_SIZE
+from share.storage import SQLiteStorage
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mime_types (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mime_type TEXT NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE INDEX IF NOT EXISTS mime_types_used_at ON mime_types (used_at);
+"""
+
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+# Number of insertions between two evictions of the least recently used types
+TRIM_INTERVAL = 100
+
+
+def detect_mime_type(path):
+    """
+    Detects the MIME type of a file, from its content if libmagic is
+    available or from its name otherwise
+    """
+    if 'magic' in sys.modules:
+        mimetype = magic.from_file(path, mime=True).decode('utf-8')
+    else:
+        mimetype, encoding = mimetypes.guess_type(path)
+    return mimetype or DEFAULT_MIME_TYPE
+
+
+class MimeTypeCache(SQLiteStorage):
+    """
+    Least recently used MIME types detected by libmagic, persisted in a
+    SQLite database
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, db_path, max_entries=SHARE_MIME_CACHE_SIZE):
+        super().__init__(db_path)
+        self.max_entries = max_entries
+        self._inserts = 0
+
+    def get(self, path, st=None):
+        """
+        Returns the MIME type of a file, only reading it on cache misses.
+        The file stat result can be given if already known.
+        """
+        if 'magic' not in sys.modules:
+            return detect_mime_type(path)
+        if st is None:
+            st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self.connection:
+            mime_type = self._lookup(key)
+        if mime_type is None:
+            # Outside of any transaction: the file is read meanwhile, other
+            # processes must not wait for the database
+            mime_type = detect_mime_type(path)
+            with self.connection:
+                self._store(key, mime_type)
+        return mime_type
+
+    def detect_dir(self, path):
+        """
+        Detects the MIME types of all the files of a directory at once and
+        returns them by file name. Each detected type is committed on its
+        own.
+        """
+        mime_types = {}
+        for dir_entry in scandir(path):
+            try:
+                st = dir_entry.stat()
+            except OSError:
+                # Broken symbolic link
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            child_path = posixpath.join(path, dir_entry.name)
+            mime_types[dir_entry.name] = self.get(child_path, st)
+        return mime_types
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM mime_types')
+
+    def _lookup(self, key):
+        row = self.connection.execute(
+            'SELECT mime_type FROM mime_types'
+            ' WHERE dev = ? AND ino = ? AND mtime = ? AND size = ?',
+            key
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute(
+            'UPDATE mime_types SET used_at = ? WHERE dev = ? AND ino = ?',
+            (time.time(), key[0], key[1])
+        )
+        return row[0]
+
+    def _store(self, key, mime_type):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO mime_types'
+            ' (dev, ino, mtime, size, mime_type, used_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            key + (mime_type, time.time())
+        )
+        self._inserts += 1
+        if self._inserts % TRIM_INTERVAL == 0:
+            self._trim()
+
+    def _trim(self):
+        """Evicts the least recently used types above max_entries"""
+        self.connection.execute(
+            'DELETE FROM mime_types WHERE rowid IN ('
+            ' SELECT rowid FROM mime_types ORDER BY used_at DESC'
+            ' LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+
+mime_type_cache = MimeTypeCache(
+    posixpath.join(SHARE_CACHE_ROOT, 'mime_types.sqlite3')
+)
@@ -0,0 +1,313 @@
+"""
+Pure-Python serving of the shared files, for servers without an accelerated
+download module.
+
+Responses honor conditional requests (ETag, Last-Modified, If-None-Match,
+If-Modified-Since) and byte ranges (Range, If-Range), including multipart
+ones. Whole files and single ranges expose the open file as
+'file_to_stream', so that the WSGI server can send it with sendfile(2)
+through wsgi.file_wrapper (see use_file_wrapper). Multipart ranges are
+sliced from a memory map of the file. Small files are served from the hot
+file cache if it is enabled (see share.hotcache).
+"""
+
+import mmap
+import os
+import re
+import uuid
+
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse
+)
+from django.utils.http import (
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+    quote_etag
+)
+
+from share.hotcache import get_key, hot_file_cache
+
+
+# Size of the blocks read from files when not using wsgi.file_wrapper
+BLOCK_SIZE = 64 * 1024
+
+# Requests with more ranges (once merged) get the whole file instead
+MAX_RANGES = 16
+
+RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class FileRange:
+    """
+    A read-only file object limited to a range of bytes
+    """
+
+    def __init__(self, path, start, length):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def get_etag(st):
+    """Builds a strong ETag from a file stat result"""
+    return quote_etag('{0:x}-{1:x}-{2:x}'.format(
+        st.st_ino, st.st_size, st.st_mtime_ns
+    ))
+
+
+def parse_range_header(header, size):
+    """
+    Returns the list of satisfiable (start, end) byte ranges of a Range
+    header, ends included, sorted and merged. Returns None if the header is
+    invalid or has too many ranges: it must be ignored.
+    """
+    units, sep, specs = header.partition('=')
+    if units.strip().lower() != 'bytes' or not sep:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last bytes of the file
+            if not last:
+                return None
+            if int(last) == 0 or size == 0:
+                continue
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+
+    # Overlapping and adjacent ranges are served once
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def is_etag_matched(request, etag):
+    """Checks the If-None-Match precondition, False if there is none"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is None:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag.strip('"') in etags
+
+
+def is_not_modified(request, etag, mtime):
+    if 'HTTP_IF_NONE_MATCH' in request.META:
+        return is_etag_matched(request, etag)
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE')
+    )
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def is_range_fresh(request, etag, mtime):
+    """Checks the If-Range precondition, if any"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.endswith('"'):
+        # Ranges are only served for strong validators
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def iter_multipart(path, ranges, parts_headers, closing):
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for (start, end), part_headers in zip(ranges, parts_headers):
+                yield part_headers
+                for offset in range(start, end + 1, BLOCK_SIZE):
+                    yield mapped[offset:min(offset + BLOCK_SIZE, end + 1)]
+                yield b'\r\n'
+            yield closing
+        finally:
+            mapped.close()
+
+
+def read_hot_file(path, st):
+    """
+    Returns the content of a small file from the hot file cache, reading and
+    caching it on a miss. Returns None for files not to be cached, or
+    modified since their stat result.
+    """
+    if not hot_file_cache.accepts(st):
+        return None
+    data = hot_file_cache.get(st)
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read(st.st_size + 1)
+            if get_key(os.fstat(f.fileno())) != get_key(st):
+                return None
+        if len(data) != st.st_size:
+            return None
+        hot_file_cache.put(st, data)
+    return data
+
+
+def serve_file(request, path, content_type):
+    """
+    Returns a response serving the file at path, or the requested ranges of
+    it, unless the client copy is still valid
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = get_etag(st)
+
+    if request.method in ('GET', 'HEAD') and (
+            is_not_modified(request, etag, st.st_mtime)):
+        response = HttpResponseNotModified()
+    else:
+        ranges = None
+        if 'HTTP_RANGE' in request.META and request.method == 'GET' and (
+                is_range_fresh(request, etag, st.st_mtime)):
+            ranges = parse_range_header(request.META['HTTP_RANGE'], size)
+
+        data = None
+        if request.method == 'GET' and (ranges is None or len(ranges) == 1):
+            data = read_hot_file(path, st)
+
+        if ranges is None:
+            response = serve_range(path, content_type, 0, size, data)
+        elif not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{0}'.format(size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = serve_range(
+                path, content_type, start, end - start + 1, data
+            )
+            response.status_code = 206
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end, size
+            )
+        else:
+            response = serve_multipart(path, content_type, ranges, size)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    return response
+
+
+def serve_range(path, content_type, start, length, data=None):
+    """
+    Returns a response sending length bytes of a file from start, taken from
+    data if its content is given
+    """
+    if data is not None:
+        response = HttpResponse(
+            data[start:start + length], content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        return response
+    range_file = FileRange(path, start, length)
+    response = FileResponse(range_file, content_type=content_type)
+    response.block_size = BLOCK_SIZE
+    response['Content-Length'] = str(length)
+    response.file_to_stream = range_file
+    return response
+
+
+def serve_multipart(path, content_type, ranges, size):
+    boundary = uuid.uuid4().hex
+    parts_headers = [
+        (
+            '--{0}\r\n'
+            'Content-Type: {1}\r\n'
+            'Content-Range: bytes {2}-{3}/{4}\r\n'
+            '\r\n'
+        ).format(boundary, content_type, start, end, size).encode('ascii')
+        for start, end in ranges
+    ]
+    closing = '--{0}--\r\n'.format(boundary).encode('ascii')
+    length = len(closing) + sum(
+        len(part_headers) + end - start + 1 + 2
+        for (start, end), part_headers in zip(ranges, parts_headers)
+    )
+
+    response = StreamingHttpResponse(
+        iter_multipart(path, ranges, parts_headers, closing),
+        status=206,
+        content_type='multipart/byteranges; boundary={0}'.format(boundary)
+    )
+    response['Content-Length'] = str(length)
+    return response
+
+
+class ResponseFile:
+    """
+    Gives a response file_to_stream to wsgi.file_wrapper, closing the whole
+    response (hence sending the request_finished signal) once sent
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.file = response.file_to_stream
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.response.close()
+
+
+def use_file_wrapper(application):
+    """
+    Wraps a Django WSGI application so that responses streaming a file are
+    handed to the server wsgi.file_wrapper, if any: most servers then send
+    the file with sendfile(2), without copying it through Python
+    """
+    def wrapper(environ, start_response):
+        response = application(environ, start_response)
+        if (getattr(response, 'file_to_stream', None) is not None and
+                'wsgi.file_wrapper' in environ and
+                environ.get('REQUEST_METHOD') != 'HEAD'):
+            return environ['wsgi.file_wrapper'](
+                ResponseFile(response), BLOCK_SIZE
+            )
+        return response
+    return wrapper
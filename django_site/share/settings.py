@@ -1,5 +1,191 @@
+from django.core.exceptions import ImproperlyConfigured
+
+import os.path
+import tempfile
+
 from core.tools import get_env_var
 
 
 # Shared directory physical root path
 SHARE_ROOT = get_env_var('DJANGO_SHARE_ROOT')
+
+# How shared files are sent: 'python' (by Django itself), 'apache'
+# (mod_xsendfile), 'nginx' (X-Accel-Redirect), 'lighttpd' or 'async' (by the
+# asyncio download server, see share.asyncserver)
+SHARE_DOWNLOAD_BACKEND = get_env_var(
+    'DJANGO_SHARE_DOWNLOAD_BACKEND',
+    required=False,
+    default='apache'
+)
+if SHARE_DOWNLOAD_BACKEND not in (
+        'python', 'apache', 'nginx', 'lighttpd', 'async'):
+    raise ImproperlyConfigured(
+        "'DJANGO_SHARE_DOWNLOAD_BACKEND' setting is invalid"
+    )
+
+# URL under which the front web server forwards requests to the asyncio
+# download server, for the 'async' backend
+SHARE_ASYNC_URL = get_env_var(
+    'DJANGO_SHARE_ASYNC_URL',
+    required=False,
+    default='/share/download/'
+)
+
+# nginx internal location serving SHARE_ROOT, for the 'nginx' backend
+SHARE_ACCEL_REDIRECT_URL = get_env_var(
+    'DJANGO_SHARE_ACCEL_REDIRECT_URL',
+    required=False,
+    default='/protected/share/'
+)
+
+# nginx internal location serving SHARE_CACHE_ROOT (compressed copies of the
+# shared files), for the 'nginx' backend
+SHARE_ACCEL_CACHE_URL = get_env_var(
+    'DJANGO_SHARE_ACCEL_CACHE_URL',
+    required=False,
+    default='/protected/share-cache/'
+)
+
+# Directory where the share app stores its persistent caches (size index...)
+SHARE_CACHE_ROOT = get_env_var(
+    'DJANGO_SHARE_CACHE_ROOT',
+    required=False,
+    default=os.path.join(tempfile.gettempdir(), 'madmox_share')
+)
+
+# Seconds between two rescans of the modified directories of the share when
+# the filesystem watcher can't be used (watch limit exhausted, non-Linux
+# systems...)
+SHARE_RESCAN_INTERVAL = int(get_env_var(
+    'DJANGO_SHARE_RESCAN_INTERVAL',
+    required=False,
+    default='300'
+))
+
+# Seconds between two full rescans of the share by the watcher, finding the
+# files rewritten in place that no event reported
+SHARE_FULL_RESCAN_INTERVAL = int(get_env_var(
+    'DJANGO_SHARE_FULL_RESCAN_INTERVAL',
+    required=False,
+    default='86400'
+))
+
+# Maximum number of detected MIME types kept in cache
+SHARE_MIME_CACHE_SIZE = int(get_env_var(
+    'DJANGO_SHARE_MIME_CACHE_SIZE',
+    required=False,
+    default='100000'
+))
+
+# Largest side of the image thumbnails, in pixels
+SHARE_THUMBNAIL_SIZE = int(get_env_var(
+    'DJANGO_SHARE_THUMBNAIL_SIZE',
+    required=False,
+    default='200'
+))
+
+# Maximum disk space used by cached thumbnails, in megabytes
+SHARE_THUMBNAIL_CACHE_SIZE = int(get_env_var(
+    'DJANGO_SHARE_THUMBNAIL_CACHE_SIZE',
+    required=False,
+    default='500'
+))
+
+# Maximum disk space used by compressed copies of the shared files, in
+# megabytes
+SHARE_COMPRESSION_CACHE_SIZE = int(get_env_var(
+    'DJANGO_SHARE_COMPRESSION_CACHE_SIZE',
+    required=False,
+    default='2000'
+))
+
+# Whether SHA-256 checksums of the shared files are published (set the key to
+# any value to enable them)
+SHARE_CHECKSUMS = (
+    get_env_var('DJANGO_SHARE_CHECKSUMS', required=False) is not None
+)
+
+# Number of threads computing checksums in each web process
+SHARE_CHECKSUM_WORKERS = int(get_env_var(
+    'DJANGO_SHARE_CHECKSUM_WORKERS',
+    required=False,
+    default='2'
+))
+
+# Size of the chunks of uploaded files, in mebibytes
+SHARE_UPLOAD_CHUNK_SIZE = int(get_env_var(
+    'DJANGO_SHARE_UPLOAD_CHUNK_SIZE',
+    required=False,
+    default='8'
+)) * 1024 ** 2
+
+# Directory of the files being uploaded. On the filesystem of SHARE_ROOT,
+# complete files are moved into place without being copied.
+SHARE_UPLOAD_TEMP_ROOT = get_env_var(
+    'DJANGO_SHARE_UPLOAD_TEMP_ROOT',
+    required=False,
+    default=os.path.join(SHARE_CACHE_ROOT, 'uploads')
+)
+
+# Key signing the download links (see share.links), the Django secret key by
+# default. Changing it revokes all the links.
+SHARE_LINK_KEY = get_env_var(
+    'DJANGO_SHARE_LINK_KEY',
+    required=False,
+    default=get_env_var('DJANGO_SECRET_KEY', required=False, default='')
+)
+
+# URL under which the front web server mounts the link server
+# (share.linkserver), apart from the URLs of the site
+SHARE_LINK_URL = get_env_var(
+    'DJANGO_SHARE_LINK_URL',
+    required=False,
+    default='/share-links/'
+)
+
+# Longest lifetime of a download link, in seconds
+SHARE_LINK_MAX_AGE = int(get_env_var(
+    'DJANGO_SHARE_LINK_MAX_AGE',
+    required=False,
+    default=str(30 * 24 * 3600)
+))
+
+# Number of threads reading the metadata (stat calls, directory sizes) of the
+# listed entries in each web process, 0 to read them sequentially
+SHARE_METADATA_WORKERS = int(get_env_var(
+    'DJANGO_SHARE_METADATA_WORKERS',
+    required=False,
+    default='8'
+))
+
+# Seconds a listing waits for the metadata of its entries, 0 to wait as long
+# as needed. Sizes still being computed are displayed as such.
+SHARE_METADATA_DEADLINE = float(get_env_var(
+    'DJANGO_SHARE_METADATA_DEADLINE',
+    required=False,
+    default='5'
+))
+
+# Memory shared by the web processes to keep small, frequently downloaded
+# files, in megabytes, 0 to disable it. Files are only served from memory by
+# the 'python' download backend.
+SHARE_HOT_CACHE_SIZE = int(get_env_var(
+    'DJANGO_SHARE_HOT_CACHE_SIZE',
+    required=False,
+    default='0'
+))
+
+# Largest file kept in the memory cache, in kilobytes
+SHARE_HOT_FILE_SIZE = int(get_env_var(
+    'DJANGO_SHARE_HOT_FILE_SIZE',
+    required=False,
+    default='1000'
+))
+
+# Directory of the memory-mapped file shared by the web processes, ideally
+# on a tmpfs filesystem (/dev/shm...)
+SHARE_HOT_CACHE_ROOT = get_env_var(
+    'DJANGO_SHARE_HOT_CACHE_ROOT',
+    required=False,
+    default=SHARE_CACHE_ROOT
+)
@@ -0,0 +1,139 @@
+$(function() {
+    var more = $(".share-authorized a.share-more");
+    var children = $(".share-authorized ul.share-children");
+    var loading = false;
+
+    // Appends the next page of the listing, instead of following the link
+    function loadNextPage() {
+        if (loading || !more.length) { return; }
+        loading = true;
+        $.getJSON(more.data("list-url"), function(data) {
+            $.each(data.entries, function(i, entry) {
+                var link = $("<a>").attr("href", entry.url);
+                if (entry.thumbnail) {
+                    link.append($("<img>").addClass("share-thumbnail").attr({src: entry.thumbnail, alt: ""}));
+                }
+                link.append($("<span>").addClass("share-name").text(entry.name));
+                link.append($("<span>").addClass("share-size").text(entry.display_size));
+                var item = $("<li>")
+                    .addClass(entry.isdir ? "share-directory" : "share-file")
+                    .append(link)
+                    .appendTo(children);
+                if (entry.archive_url) {
+                    item.append($("<a>").addClass("share-archive-browse").attr("href", entry.archive_url).text("Parcourir"));
+                }
+            });
+            if (data.next === null) {
+                more.remove();
+                more = $();
+            } else {
+                var params = {sort: data.sort, order: data.order, cursor: data.next, limit: data.limit};
+                if (children.hasClass("share-grid")) { params.view = "grid"; }
+                var query = "?" + $.param(params);
+                more.attr("href", query);
+                more.data("list-url", more.data("list-url").split("?")[0] + query);
+            }
+        }).always(function() {
+            loading = false;
+        });
+    }
+
+    more.click(function(event) {
+        event.preventDefault();
+        loadNextPage();
+    });
+
+    // Pages are loaded as the end of the listing gets visible
+    $(window).scroll(function() {
+        if (more.length && more.offset().top < $(window).scrollTop() + 2 * $(window).height()) {
+            loadNextPage();
+        }
+    });
+
+    // Uploads the chosen file chunk by chunk, a few chunks at a time. Chunks
+    // received by an interrupted upload of the same file are not sent again.
+    var upload = $(".share-authorized form.share-upload");
+    var parallelChunks = 3;
+
+    function toHex(buffer) {
+        return Array.prototype.map.call(new Uint8Array(buffer), function(b) {
+            return ("0" + b.toString(16)).slice(-2);
+        }).join("");
+    }
+
+    upload.find("input[type=file]").change(function() {
+        var file = this.files[0];
+        if (!file || !window.crypto || !window.crypto.subtle) { return; }
+        var token = upload.find("input[name=csrfmiddlewaretoken]").val();
+        var progress = upload.find(".share-upload-progress");
+        var fail = function() {
+            progress.text("Échec de l'envoi, choisissez à nouveau le fichier pour le reprendre");
+        };
+        var params = {name: file.name, size: file.size, csrfmiddlewaretoken: token};
+        $.post(upload.data("upload-url"), params, function(state) {
+            var next = 0, done = 0, failed = false;
+
+            function chunkDone(response) {
+                done++;
+                progress.text(Math.floor(100 * done / state.chunks) + " %");
+                if (response && response.complete) {
+                    window.location.reload();
+                } else {
+                    sendNextChunk();
+                }
+            }
+
+            // The file was received, but its name was taken meanwhile
+            function askName(name) {
+                name = window.prompt("Un fichier « " + name + " » existe déjà, choisissez un autre nom :", name);
+                if (!name) {
+                    fail();
+                    return;
+                }
+                $.post(state.url, {name: name, csrfmiddlewaretoken: token}, function() {
+                    window.location.reload();
+                }).fail(function(xhr) {
+                    if (xhr.status === 409) {
+                        askName(name);
+                    } else {
+                        fail();
+                    }
+                });
+            }
+
+            function sendNextChunk() {
+                if (failed || next >= state.chunks) { return; }
+                var index = next++;
+                var reader = new FileReader();
+                reader.onload = function() {
+                    var data = reader.result;
+                    window.crypto.subtle.digest("SHA-256", data).then(function(hash) {
+                        var checksum = toHex(hash);
+                        if (state.received[index] === checksum) {
+                            chunkDone(null);
+                            return;
+                        }
+                        $.ajax({
+                            url: state.url + "/" + index,
+                            type: "PUT",
+                            data: data,
+                            processData: false,
+                            contentType: "application/octet-stream",
+                            headers: {"X-CSRFToken": token, "X-Chunk-SHA256": checksum}
+                        }).done(chunkDone).fail(function(xhr) {
+                            failed = true;
+                            if (xhr.status === 409) {
+                                askName(file.name);
+                            } else {
+                                fail();
+                            }
+                        });
+                    });
+                };
+                reader.readAsArrayBuffer(file.slice(index * state.chunk_size, (index + 1) * state.chunk_size));
+            }
+
+            for (var i = 0; i < parallelChunks; i++) { sendNextChunk(); }
+        }).fail(fail);
+    });
+});
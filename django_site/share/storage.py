@@ -0,0 +1,238 @@
+"""
+Base classes of the share app persistent caches.
+"""
+
+import hashlib
+import os
+import posixpath
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+DISK_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    size INTEGER,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_used_at ON files (used_at);
+"""
+
+# Number of files written between two evictions
+TRIM_INTERVAL = 100
+
+# Seconds after which a temporary file of a disk cache was left by a killed
+# process: files being written are modified all along
+STALE_TEMP_AGE = 3600
+
+
+class SQLiteStorage:
+    """
+    A SQLite database created on first use with the class schema. Each thread
+    gets its own connection, SQLite connections can't be shared.
+    """
+
+    schema = ''
+
+    # Databases created with another schema version are emptied: they only
+    # hold caches, rebuilt from the filesystem anyway
+    version = 1
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            # Lets readers (web workers) run while the database is updated
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.migrate(connection)
+            connection.executescript(self.schema)
+            self.setup(connection)
+            self._local.connection = connection
+        return connection
+
+    def migrate(self, connection):
+        """Drops the tables of another schema version"""
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            version, = connection.execute('PRAGMA user_version').fetchone()
+            if version == self.version:
+                return
+            # Virtual tables first, they drop their own shadow tables
+            # SQLite internal tables (sqlite_sequence...) can't be dropped
+            tables = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+                " AND name NOT LIKE 'sqlite!_%' ESCAPE '!'"
+                " ORDER BY sql NOT LIKE 'CREATE VIRTUAL%'"
+            ).fetchall()
+            for name, in tables:
+                name = name.replace('"', '""')
+                connection.execute('DROP TABLE IF EXISTS "{0}"'.format(name))
+            connection.execute('PRAGMA user_version = {0:d}'.format(
+                self.version
+            ))
+
+    def setup(self, connection):
+        """Called once the schema is created, for optional features"""
+        pass
+
+
+class DiskCache(SQLiteStorage):
+    """
+    Files derived from the shared files (thumbnails, compressed copies...),
+    stored in a directory. Their total size is bounded: the least recently
+    used files are evicted first, their last use being tracked in a SQLite
+    database.
+
+    A key can also be cached without file, to remember that there is nothing
+    to derive from a shared file.
+    """
+
+    schema = DISK_CACHE_SCHEMA
+
+    # Extension of the cached files
+    suffix = ''
+
+    def __init__(self, root, max_size):
+        super().__init__(posixpath.join(root, 'cache.sqlite3'))
+        self.root = root
+        self.max_size = max_size
+        self._writes = 0
+        self._stale_files_removed = False
+
+    def setup(self, connection):
+        """Removes the stale temporary files when the cache is first used"""
+        if not self._stale_files_removed:
+            self._stale_files_removed = True
+            self.remove_stale_files()
+
+    def get_key(self, *parts):
+        """Hashes the parts (path, mtime, size...) of a cache key"""
+        data = '\0'.join(str(part) for part in parts)
+        data = data.encode('utf-8', 'surrogateescape')
+        return hashlib.sha1(data).hexdigest()
+
+    def get_path(self, key):
+        # Spread files among sub directories to keep them small
+        return posixpath.join(self.root, key[:2], key + self.suffix)
+
+    def lookup(self, key):
+        """
+        Returns whether key is cached and the path of its file, None if it
+        was cached without file
+        """
+        with self.connection:
+            row = self.connection.execute(
+                'SELECT size FROM files WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            self.connection.execute(
+                'UPDATE files SET used_at = ? WHERE key = ?',
+                (time.time(), key)
+            )
+        if row[0] is None:
+            return True, None
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            # Removed behind our back
+            return False, None
+        return True, path
+
+    def write(self, key, write):
+        """
+        Caches the file of key, written by write(file). If write returns
+        False, key is cached without file. Returns the file path, or None.
+        """
+        path = self.get_path(key)
+        dirname = posixpath.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        # Written aside first, so a file is never served half written
+        fd, temp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                written = write(f) is not False
+            if written:
+                os.replace(temp_path, path)
+                size = os.path.getsize(path)
+            else:
+                os.remove(temp_path)
+                path = size = None
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files (key, size, used_at)'
+                ' VALUES (?, ?, ?)',
+                (key, size, time.time())
+            )
+            self._writes += 1
+            if self._writes % TRIM_INTERVAL == 0:
+                self._trim()
+        return path
+
+    def remove_stale_files(self, max_age=STALE_TEMP_AGE):
+        """
+        Removes the temporary files not modified for max_age seconds, left
+        by processes killed while writing them
+        """
+        expired_at = time.time() - max_age
+        try:
+            dirnames = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for dirname in dirnames:
+            dirpath = posixpath.join(self.root, dirname)
+            if not os.path.isdir(dirpath):
+                continue
+            for name in os.listdir(dirpath):
+                if not name.endswith('.tmp'):
+                    continue
+                path = posixpath.join(dirpath, name)
+                try:
+                    if os.stat(path).st_mtime < expired_at:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        with self.connection:
+            keys = self.connection.execute('SELECT key FROM files').fetchall()
+            self.connection.execute('DELETE FROM files')
+        for key, in keys:
+            try:
+                os.remove(self.get_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _trim(self):
+        """Evicts the least recently used files above max_size"""
+        total_size, = self.connection.execute(
+            'SELECT TOTAL(size) FROM files'
+        ).fetchone()
+        if total_size <= self.max_size:
+            return
+        evicted = []
+        for key, size in self.connection.execute(
+                'SELECT key, size FROM files ORDER BY used_at'):
+            if total_size <= self.max_size:
+                break
+            evicted.append((key,))
+            total_size -= size or 0
+        self.connection.executemany(
+            'DELETE FROM files WHERE key = ?', evicted
+        )
+        for key, in evicted:
+            try:
+                os.remove(self.get_path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,72 @@
+"""
+Streamed HTML listings of huge directories.
+
+The page is rendered around a marker standing for its rows: everything up
+to the marker is sent at once, then the rows follow as the directory is
+scanned, and the end of the page last. Entries go through a pipeline of
+generators, from the directory scan to the formatted rows, a batch at a
+time: the first byte and the memory used do not depend on the size of the
+directory.
+
+Entries are listed in the order of the directory scan, sorting them would
+require them all.
+"""
+
+from itertools import islice
+import uuid
+
+from django.http import StreamingHttpResponse
+from django.template import Context, RequestContext
+from django.template.loader import get_template, render_to_string
+
+from share.metadata import metadata_fetcher
+
+
+# Number of entries whose metadata are read together, and whose rows are
+# sent together
+BATCH_SIZE = 100
+
+
+def iter_batches(iterable, size=BATCH_SIZE):
+    """Yields lists of at most size items of iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_rows(node, grid=False):
+    """Yields the HTML rows of the children of a directory node, by batch"""
+    template = get_template('share/browse_row.html')
+    for batch in iter_batches(node.iter_children()):
+        # Rows are already being sent, no deadline applies
+        metadata_fetcher.fetch(batch)
+        yield ''.join(
+            template.render(Context({'child': child, 'grid': grid}))
+            for child in batch
+        )
+
+
+def iter_page(head, rows, tail):
+    yield head
+    yield from rows
+    yield tail
+
+
+def stream_listing(request, template_name, context, node, grid=False):
+    """
+    Returns a response streaming a template, the rows of the children of
+    node standing for its 'rows_marker' variable
+    """
+    marker = 'share-rows-{0}'.format(uuid.uuid4().hex)
+    context = dict(context, rows_marker=marker)
+    page = render_to_string(
+        template_name, context, context_instance=RequestContext(request)
+    )
+    head, sep, tail = page.partition(marker)
+    return StreamingHttpResponse(
+        iter_page(head, iter_rows(node, grid), tail),
+        content_type='text/html; charset=utf-8'
+    )
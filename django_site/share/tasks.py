@@ -0,0 +1,67 @@
+"""
+Background work of the web processes (thumbnails, compressed copies...).
+
+Tasks run one at a time in a daemon thread, in the order they were queued.
+A task already waiting is not queued twice, so the same request repeated
+while the work is pending costs nothing. At most MAX_PENDING tasks wait:
+tasks added meanwhile are dropped, they are asked again by later requests.
+"""
+
+import logging
+import queue
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# Tasks waiting at most in a queue
+MAX_PENDING = 100
+
+
+class BackgroundTasks:
+    """A queue of tasks run by a single daemon thread, started on demand"""
+
+    def __init__(self, name, max_pending=MAX_PENDING):
+        self.name = name
+        self._queue = queue.Queue(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def add(self, func, *args):
+        """
+        Queues func(*args), unless it is already queued. Returns False if the
+        task was dropped, the queue being full.
+        """
+        task = (func,) + args
+        with self._lock:
+            if task in self._pending:
+                return True
+            try:
+                self._queue.put_nowait(task)
+            except queue.Full:
+                logger.debug('%s queue full, task dropped', self.name)
+                return False
+            self._pending.add(task)
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._worker.start()
+        return True
+
+    def join(self):
+        """Waits for the queued tasks to be done"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                task[0](*task[1:])
+            except Exception:
+                logger.exception('%s task failed', self.name)
+            finally:
+                with self._lock:
+                    self._pending.discard(task)
+                self._queue.task_done()
@@ -1,10 +1,16 @@
 from django import template
 
+from share.members import get_archive_url
+from share.thumbnails import get_thumbnail_url
+
 register = template.Library()
 
 @register.filter
 def print_size(value):
-    if value < 1000:
+    if value is None:
+        # Still being computed (see share.metadata)
+        result = 'calcul…'
+    elif value < 1000:
         result = '{0}   '.format(value) + '  o'
     elif value < 1000 ** 2:
         result = '{0:.2f}'.format(value / 1000) + ' Ko'
@@ -16,3 +22,13 @@ def print_size(value):
         result = '{0:.2f}'.format(value / 1000 ** 4) + ' To'
     
     return result
+
+
+@register.filter
+def thumbnail_url(node):
+    return get_thumbnail_url(node)
+
+
+@register.filter
+def archive_url(node):
+    return get_archive_url(node)
@@ -1,31 +1,49 @@
 from django import template
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
+import os
 import urllib.parse
 
 from core.navigation import NavigationNode
+from share.settings import SHARE_ROOT
 from share.utils import (
-    get_physical_path,
-    FileSystemNode
+    FileSystemNode,
+    stat_entry
 )
 
 register = template.Library()
 
 
+def get_root_links():
+    """Returns the (url, label) pairs of the share root children. They are
+    cached until the root directory gets modified, which happens whenever a
+    child is added, removed or renamed.
+    """
+    st = os.stat(SHARE_ROOT)
+    key = 'share:navigation:{0}'.format(st.st_mtime_ns)
+    links = cache.get(key)
+    
+    if links is None:
+        node = FileSystemNode(SHARE_ROOT, entry=stat_entry(SHARE_ROOT, st))
+        links = [
+            (reverse('share:browse', args=(child.url,)), child.name)
+            for child in node.children
+        ]
+        cache.set(key, links, None)
+    
+    return links
+
+
 @register.assignment_tag(takes_context=True)
 def set_share_navigation(context, current_path):
     """Returns a list of NavigationNode instances containing informations
     to build the navigation specific to this app
     """
     results = []
+    unquoted_curpath = urllib.parse.unquote(current_path)
     
-    filepath = get_physical_path('')
-    node = FileSystemNode(filepath)
-    
-    for child in node.children:
-        url = reverse('share:browse', args=(child.url,))
-        label = child.name
-        unquoted_curpath = urllib.parse.unquote(current_path)
+    for url, label in get_root_links():
         unquoted_url = urllib.parse.unquote(url)
         active = unquoted_curpath.startswith(unquoted_url)
         results.append(NavigationNode(active, url, label))
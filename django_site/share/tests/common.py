@@ -0,0 +1 @@
+from share.instrumentation import CountingDirEntry, count_syscalls
@@ -0,0 +1,106 @@
+from django.test import TestCase
+
+import io
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from share.archives import ZipStream, dos_date_time
+from share.utils import FileSystemNode
+
+
+class ZipStreamTests(TestCase):
+
+    def setUp(self):
+        """Creates a small tree in a temporary dir"""
+        self.root = tempfile.mkdtemp()
+        self.dirname = posixpath.join(self.root, 'test_dir')
+        os.makedirs(posixpath.join(self.dirname, 'test_dir_empty'))
+        self.files = {
+            'test_dir/test_file': b'test content',
+            'test_dir/test_file_é': bytes(range(256)) * 1000,
+            'test_dir/test_dir_empty/../test_file_empty': b'',
+        }
+        for name, content in self.files.items():
+            with open(posixpath.join(self.root, name), 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def build_archive(self):
+        stream = ZipStream(FileSystemNode(self.dirname))
+        content = b''.join(stream.iter_blocks())
+        return stream, content
+
+    def check_archive(self, content):
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            sorted(archive.namelist()),
+            [
+                'test_dir/',
+                'test_dir/test_dir_empty/',
+                'test_dir/test_file',
+                'test_dir/test_file_empty',
+                'test_dir/test_file_é',
+            ]
+        )
+        for name, content in self.files.items():
+            name = posixpath.normpath(name)
+            self.assertEqual(archive.read(name), content)
+
+    def test_share_archives_zip(self):
+        """Asserts the archive is valid and its size known beforehand"""
+
+        stream, content = self.build_archive()
+        self.check_archive(content)
+
+    @mock.patch('share.archives.ZIP64_LIMIT', 100)
+    @mock.patch('share.archives.ZIP64_ENTRIES_LIMIT', 2)
+    def test_share_archives_zip64(self):
+        """Asserts ZIP64 records are valid"""
+
+        stream, content = self.build_archive()
+        self.assertTrue(stream.zip64)
+        self.check_archive(content)
+
+    def test_share_archives_first_block(self):
+        """Asserts the archive starts before the tree is walked"""
+
+        stream = ZipStream(FileSystemNode(self.dirname))
+        with mock.patch(
+            'share.utils.FileSystemNode.iter_children'
+        ) as iter_children:
+            blocks = stream.iter_blocks()
+            self.assertTrue(next(blocks).startswith(b'PK\x03\x04'))
+            self.assertFalse(iter_children.called)
+
+    def test_share_archives_symlink_loop(self):
+        """Asserts symbolic links to directories are not followed"""
+
+        os.symlink('..', posixpath.join(self.dirname, 'test_loop'))
+        os.symlink(
+            self.root, posixpath.join(self.dirname, 'test_dir_empty/outside')
+        )
+        stream, content = self.build_archive()
+        self.check_archive(content)
+
+    def test_share_archives_dos_date_time(self):
+        """Asserts mtimes out of the MS-DOS range are clamped"""
+
+        minimum = ((1 << 5) | 1, 0)
+        maximum = ((127 << 9) | (12 << 5) | 31, (23 << 11) | (59 << 5) | 29)
+        # 1970, 2110, and out of the range of the platform
+        for mtime, expected in ((0, minimum), (4418150400, maximum),
+                                (10 ** 30, maximum), (-10 ** 30, minimum)):
+            self.assertEqual(dos_date_time(mtime * 10 ** 9), expected)
+
+        # Raised in the middle of the stream otherwise
+        path = posixpath.join(self.dirname, 'test_file')
+        os.utime(path, (4418150400, 4418150400))
+        stream, content = self.build_archive()
+        self.check_archive(content)
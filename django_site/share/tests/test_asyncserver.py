@@ -0,0 +1,147 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+import os
+import posixpath
+import unittest
+from unittest import mock
+
+from share.settings import SHARE_ROOT
+
+try:
+    import asyncio
+except ImportError:
+    # Python 3.3 without the asyncio package
+    asyncio = None
+else:
+    from share.asyncserver import DownloadServer
+
+
+@unittest.skipIf(asyncio is None, 'requires asyncio')
+@mock.patch('share.asyncserver.check_permission', return_value=True)
+class DownloadServerTests(TestCase):
+
+    def setUp(self):
+        """Creates a file in the shared dir and starts a server"""
+        self.dirname = posixpath.join(SHARE_ROOT, 'test_dir_async')
+        os.makedirs(self.dirname)
+        self.fname = posixpath.join(self.dirname, 'test_file_é')
+        self.content = os.urandom(300 * 1024)
+        with open(self.fname, 'wb') as f:
+            f.write(self.content)
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            DownloadServer(prefix='/download/').start('127.0.0.1', 0)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        os.remove(self.fname)
+        os.rmdir(self.dirname)
+
+    def request(self, path, *headers, method='GET'):
+        """Returns the status, headers and content of a response"""
+        @asyncio.coroutine
+        def send():
+            reader, writer = yield from asyncio.open_connection(
+                '127.0.0.1', self.port
+            )
+            writer.write('\r\n'.join(
+                ('{0} {1} HTTP/1.1'.format(method, path),
+                 'Cookie: sessionid=test', 'Connection: close') +
+                headers + ('', '')
+            ).encode('utf-8'))
+            response = yield from reader.read()
+            writer.close()
+            return response
+
+        response = self.loop.run_until_complete(send())
+        head, sep, content = response.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        return int(lines[0].split()[1]), headers, content
+
+    def test_share_asyncserver_file(self, check_permission):
+        """Path is a valid file, the response must be its content"""
+
+        status, headers, content = self.request(
+            '/download/test_dir_async/test_file_%C3%A9'
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(content, self.content)
+        self.assertEqual(headers['Content-Length'], str(len(self.content)))
+        self.assertEqual(headers['Accept-Ranges'], 'bytes')
+        check_permission.assert_called_once_with('test')
+
+        status, headers, content = self.request(
+            '/download/test_dir_async/test_file_%C3%A9',
+            'If-None-Match: {0}'.format(headers['ETag'])
+        )
+        self.assertEqual(status, 304)
+        self.assertEqual(content, b'')
+
+    def test_share_asyncserver_range(self, check_permission):
+        """Range is asked, the response must be this part of the file"""
+
+        status, headers, content = self.request(
+            '/download/test_dir_async/test_file_%C3%A9', 'Range: bytes=10-19'
+        )
+        self.assertEqual(status, 206)
+        self.assertEqual(content, self.content[10:20])
+        self.assertEqual(
+            headers['Content-Range'],
+            'bytes 10-19/{0}'.format(len(self.content))
+        )
+
+        status, headers, content = self.request(
+            '/download/test_dir_async/test_file_%C3%A9',
+            'Range: bytes=1000000-'
+        )
+        self.assertEqual(status, 416)
+
+    def test_share_asyncserver_head(self, check_permission):
+        status, headers, content = self.request(
+            '/download/test_dir_async/test_file_%C3%A9', method='HEAD'
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Length'], str(len(self.content)))
+        self.assertEqual(content, b'')
+
+    def test_share_asyncserver_invalid_path(self, check_permission):
+        for path in ('/download/test_dir_async/', '/download/invalid',
+                     '/other/test_dir_async/test_file_%C3%A9'):
+            status, headers, content = self.request(path)
+            self.assertEqual(status, 404)
+
+    def test_share_asyncserver_anonymous_user(self, check_permission):
+        """User is anonymous, the response must be a redirect to the login
+        page"""
+
+        check_permission.return_value = None
+        status, headers, content = self.request('/download/test_dir_async/')
+        self.assertEqual(status, 302)
+        self.assertEqual(
+            headers['Location'],
+            '{0}?next={1}'.format(
+                reverse('accounts:login'),
+                reverse('share:browse', args=('test_dir_async/',))
+            )
+        )
+
+    def test_share_asyncserver_unauthorized_user(self, check_permission):
+        check_permission.return_value = False
+        status, headers, content = self.request(
+            '/download/test_dir_async/test_file_%C3%A9'
+        )
+        self.assertEqual(status, 403)
+        self.assertEqual(content, b'')
+
+    def test_share_asyncserver_bad_request(self, check_permission):
+        status, headers, content = self.request('/download/ invalid')
+        self.assertEqual(status, 400)
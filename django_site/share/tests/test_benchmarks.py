@@ -0,0 +1,70 @@
+from django.core.management import call_command
+from django.test import TestCase
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from share import benchmarks
+from share.settings import SHARE_ROOT
+
+
+class BenchmarksTests(TestCase):
+
+    def test_share_benchmarks_trees(self):
+        """Asserts generated trees only depend on their shape and scale"""
+
+        listings = []
+        for i in range(2):
+            path = tempfile.mkdtemp()
+            try:
+                target = benchmarks.build_tree('deep', path, scale=0.05)
+                self.assertEqual(
+                    target.count('/dir'), path.count('/dir') + 5
+                )
+                listings.append([
+                    (os.path.relpath(child, path), os.stat(child).st_size,
+                     os.stat(child).st_mtime_ns)
+                    for child in benchmarks.get_paths(path)
+                ])
+            finally:
+                shutil.rmtree(path)
+        self.assertEqual(len(listings[0]), 30)
+        self.assertEqual(listings[0], listings[1])
+
+    def test_share_benchmarks_run(self):
+        """Asserts every operation is measured, and trees are removed"""
+
+        before = sorted(os.listdir(SHARE_ROOT))
+        results = benchmarks.run(scale=0.01, runs=2)
+        self.assertEqual(sorted(os.listdir(SHARE_ROOT)), before)
+        self.assertEqual(list(results['results']), list(benchmarks.TREES))
+        for tree in results['results'].values():
+            self.assertGreater(tree['entries'], 0)
+            for operation in benchmarks.OPERATIONS:
+                measures = tree[operation]
+                self.assertLessEqual(
+                    measures['min_time'], measures['max_time']
+                )
+                self.assertIsInstance(measures['syscalls'], dict)
+        # Listing the wide directory costs a single directory listing
+        self.assertEqual(
+            results['results']['wide']['children']['syscalls']['scandir'], 1
+        )
+
+    def test_share_benchmarks_command(self):
+        """Asserts the command prints the results as JSON"""
+
+        stdout = io.StringIO()
+        call_command(
+            'benchmarkshare', 'sparse', runs=1, cold=True, stdout=stdout
+        )
+        results = json.loads(stdout.getvalue())
+        self.assertEqual(list(results['results']), ['sparse'])
+        self.assertTrue(results['cold'])
+        self.assertEqual(
+            results['results']['sparse']['children']['syscalls']['scandir'],
+            1
+        )
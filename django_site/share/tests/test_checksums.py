@@ -0,0 +1,138 @@
+from django.test import TestCase
+
+import hashlib
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from share.checksums import FAILED, ChecksumCache, compute_sha256
+
+
+class ChecksumCacheTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_root = tempfile.mkdtemp()
+        self.fname = posixpath.join(self.root, 'test_file')
+        self.content = os.urandom(3 * 1024 * 1024 + 5)
+        self.write_file(self.fname, self.content)
+        self.cache = self.create_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache_root)
+
+    def create_cache(self):
+        db_path = posixpath.join(self.cache_root, 'checksums.sqlite3')
+        return ChecksumCache(db_path, workers=2)
+
+    def write_file(self, path, content):
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_share_checksums_compute_sha256(self):
+        self.assertEqual(
+            compute_sha256(self.fname),
+            hashlib.sha256(self.content).hexdigest()
+        )
+        fname = posixpath.join(self.root, 'test_file_empty')
+        self.write_file(fname, b'')
+        self.assertEqual(
+            compute_sha256(fname), hashlib.sha256(b'').hexdigest()
+        )
+
+    def test_share_checksums_background(self):
+        """Asserts checksums are computed in the background, once"""
+
+        self.assertIsNone(self.cache.get(self.fname))
+        self.cache.wait()
+        checksum = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(self.cache.get(self.fname), checksum)
+        with mock.patch('share.checksums.compute_sha256') as compute_sha256:
+            self.assertEqual(self.create_cache().get(self.fname), checksum)
+            self.assertFalse(compute_sha256.called)
+
+    def test_share_checksums_modified_file(self):
+        """Asserts checksums of modified files are computed again"""
+
+        self.cache.get(self.fname)
+        self.cache.wait()
+        self.write_file(self.fname, b'test content')
+        os.utime(self.fname, ns=(0, 10 ** 9))
+        self.assertIsNone(self.cache.get(self.fname))
+        self.cache.wait()
+        self.assertEqual(
+            self.cache.get(self.fname),
+            hashlib.sha256(b'test content').hexdigest()
+        )
+
+    def test_share_checksums_get_dir(self):
+        """Asserts the files of a directory are listed, pending ones
+        counted"""
+
+        os.mkdir(posixpath.join(self.root, 'test_dir'))
+        self.write_file(posixpath.join(self.root, 'test_file_2'), b'')
+        self.assertEqual(self.cache.get_dir(self.root), ({}, 2))
+        self.cache.wait()
+        self.assertEqual(
+            self.cache.get_dir(self.root),
+            (
+                {
+                    'test_file': hashlib.sha256(self.content).hexdigest(),
+                    'test_file_2': hashlib.sha256(b'').hexdigest()
+                },
+                0
+            )
+        )
+
+    def test_share_checksums_failure(self):
+        """Asserts files that can't be hashed are not tried again at each
+        request, nor counted as pending"""
+
+        error = OSError(5, 'Input/output error')
+        with mock.patch(
+                'share.checksums.compute_sha256', side_effect=error
+        ) as compute_sha256:
+            with mock.patch('share.checksums.logger'):
+                self.assertIsNone(self.cache.get(self.fname))
+                self.cache.wait()
+            self.assertEqual(self.cache.get(self.fname), FAILED)
+            self.assertEqual(self.cache.get_dir(self.root), ({}, 0))
+            self.cache.wait()
+            self.assertEqual(compute_sha256.call_count, 1)
+
+        # Tried again later
+        with mock.patch('share.checksums.FAILURE_RETRY_DELAY', 0):
+            self.assertIsNone(self.cache.get(self.fname))
+        self.cache.wait()
+        self.assertEqual(
+            self.cache.get(self.fname),
+            hashlib.sha256(self.content).hexdigest()
+        )
+
+    @mock.patch('share.checksums.MAX_PENDING', 1)
+    def test_share_checksums_max_pending(self):
+        """Asserts the number of checksums waiting is bounded, the others
+        being scheduled by later requests"""
+
+        fname = posixpath.join(self.root, 'test_file_2')
+        self.write_file(fname, b'')
+        computing = threading.Event()
+        with mock.patch(
+                'share.checksums.compute_sha256',
+                side_effect=lambda path: computing.wait(5) and 'x'):
+            self.assertTrue(
+                self.cache.schedule(self.fname, os.stat(self.fname))
+            )
+            self.assertFalse(self.cache.schedule(fname, os.stat(fname)))
+            self.assertEqual(self.cache.get_dir(self.root), ({}, 2))
+            computing.set()
+            self.cache.wait()
+        self.assertIsNone(self.cache.get(fname))
+        self.cache.wait()
+        self.assertEqual(
+            self.cache.get(fname), hashlib.sha256(b'').hexdigest()
+        )
@@ -0,0 +1,166 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+import gzip
+import os
+import posixpath
+import shutil
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+from share.compression import (
+    CompressedCache,
+    get_compressed_file,
+    is_compressible,
+    negotiate_encoding
+)
+from share.tasks import BackgroundTasks
+
+
+class NegotiationTests(TestCase):
+
+    def test_share_compression_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate_encoding('deflate, *;q=0.5'), 'gzip')
+        self.assertIsNone(negotiate_encoding('gzip;q=0, deflate'))
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertIsNone(negotiate_encoding(''))
+
+    @mock.patch.dict(sys.modules, {'brotli': mock.Mock()})
+    def test_share_compression_negotiate_encoding_brotli(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(negotiate_encoding('gzip, br;q=0'), 'gzip')
+
+    def test_share_compression_is_compressible(self):
+        self.assertTrue(is_compressible('text/plain'))
+        self.assertTrue(is_compressible('application/octet-stream'))
+        self.assertTrue(is_compressible('image/svg+xml'))
+        self.assertFalse(is_compressible('image/jpeg'))
+        self.assertFalse(is_compressible('video/mp4'))
+        self.assertFalse(is_compressible('application/zip'))
+
+
+class CompressedCacheTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_root = tempfile.mkdtemp()
+        self.fname = posixpath.join(self.root, 'test_file')
+        self.content = b'test content\n' * 1000
+        self.write_file(self.fname, self.content)
+        self.cache = CompressedCache(self.cache_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache_root)
+
+    def write_file(self, path, content):
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def get(self, fname):
+        """Gets a compressed copy once generated in the background"""
+        self.assertIsNone(self.cache.get(fname, 'gzip'))
+        self.cache.background_tasks.join()
+        return self.cache.get(fname, 'gzip')
+
+    def test_share_compression_generated(self):
+        """Asserts copies are generated in the background"""
+
+        path = self.get(self.fname)
+        with gzip.open(path) as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertLess(os.path.getsize(path), len(self.content) / 10)
+
+    def test_share_compression_modified_file(self):
+        """Asserts modified files are compressed again"""
+
+        path = self.get(self.fname)
+        self.write_file(self.fname, b'new content\n' * 1000)
+        os.utime(self.fname, ns=(0, 10 ** 9))
+        new_path = self.get(self.fname)
+        self.assertNotEqual(new_path, path)
+        with gzip.open(new_path) as f:
+            self.assertEqual(f.read(), b'new content\n' * 1000)
+
+    def test_share_compression_incompressible_file(self):
+        """Asserts files compressing poorly are only compressed once"""
+
+        fname = posixpath.join(self.root, 'test_random')
+        self.write_file(fname, os.urandom(10000))
+        self.assertIsNone(self.get(fname))
+        with mock.patch.object(CompressedCache, 'generate') as generate:
+            self.assertIsNone(self.cache.get(fname, 'gzip'))
+            self.cache.background_tasks.join()
+            self.assertFalse(generate.called)
+
+    def test_share_compression_queue_full(self):
+        """Asserts files requested while the queue is full are dropped, and
+        compressed when requested again"""
+
+        self.cache.background_tasks = BackgroundTasks(
+            'compression', max_pending=1
+        )
+        fname = posixpath.join(self.root, 'test_file_2')
+        self.write_file(fname, self.content)
+        started, released = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            released.wait()
+
+        # The worker is busy and the queue full
+        self.cache.background_tasks.add(block)
+        started.wait()
+        self.cache.background_tasks.add(released.wait)
+        with mock.patch.object(CompressedCache, 'generate') as generate:
+            self.assertIsNone(self.cache.get(fname, 'gzip'))
+            released.set()
+            self.cache.background_tasks.join()
+            self.assertFalse(generate.called)
+        self.assertIsNotNone(self.get(fname))
+
+    def test_share_compression_stale_files(self):
+        """Asserts temporary files left by killed processes are removed"""
+
+        dirname = posixpath.join(self.cache_root, 'ab')
+        os.makedirs(dirname)
+        stale, fresh = (
+            posixpath.join(dirname, name) for name in ('1.tmp', '2.tmp')
+        )
+        self.write_file(stale, b'')
+        self.write_file(fresh, b'')
+        os.utime(stale, (0, 0))
+        cache = CompressedCache(self.cache_root)
+        self.assertIsNone(cache.get(self.fname, 'gzip'))
+        cache.background_tasks.join()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+    @mock.patch('share.compression.compressed_cache')
+    def test_share_compression_get_compressed_file(self, compressed_cache):
+        """Asserts copies are only looked up when they may be sent"""
+
+        compressed_cache.get.return_value = '/cache/test_file'
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(
+            get_compressed_file(request, self.fname, 'text/plain'),
+            ('/cache/test_file', 'gzip')
+        )
+        self.assertEqual(
+            get_compressed_file(request, self.fname, 'image/png'),
+            (None, None)
+        )
+        self.assertEqual(
+            get_compressed_file(RequestFactory().get('/'), self.fname,
+                                'text/plain'),
+            (None, None)
+        )
+        fname = posixpath.join(self.root, 'test_small_file')
+        self.write_file(fname, b'test content')
+        self.assertEqual(
+            get_compressed_file(request, fname, 'text/plain'), (None, None)
+        )
+        self.assertEqual(compressed_cache.get.call_count, 1)
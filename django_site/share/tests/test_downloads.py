@@ -0,0 +1,80 @@
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils.http import urlquote
+
+import posixpath
+from unittest import mock
+
+from share import settings
+from share.downloads import send_file
+from share.settings import SHARE_ROOT
+
+
+class DownloadBackendsTests(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.path = posixpath.join(SHARE_ROOT, 'test_dir_é', 'test_file_é')
+
+    def send_file(self, backend, compressed_path=None):
+        with mock.patch.object(settings, 'SHARE_DOWNLOAD_BACKEND', backend):
+            encoding = 'gzip' if compressed_path is not None else None
+            with mock.patch(
+                    'share.downloads.get_compressed_file',
+                    return_value=(compressed_path, encoding)):
+                return send_file(self.request, self.path, 'text/plain')
+
+    def test_share_downloads_apache(self):
+        response = self.send_file('apache')
+        self.assertEqual(response['X-SendFile'], urlquote(self.path))
+
+    def test_share_downloads_nginx(self):
+        response = self.send_file('nginx')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            urlquote(posixpath.join(
+                settings.SHARE_ACCEL_REDIRECT_URL, 'test_dir_é/test_file_é'
+            ))
+        )
+
+    def test_share_downloads_lighttpd(self):
+        response = self.send_file('lighttpd')
+        header = response.serialize_headers()
+        self.assertIn(
+            b'X-LIGHTTPD-send-file: ' + self.path.encode('utf-8'), header
+        )
+
+    def test_share_downloads_python(self):
+        with mock.patch(
+                'share.downloads.serve_file',
+                return_value=HttpResponse()) as serve_file:
+            self.send_file('python')
+        serve_file.assert_called_once_with(
+            self.request, self.path, 'text/plain'
+        )
+
+    def test_share_downloads_compressed(self):
+        compressed_path = posixpath.join(
+            settings.SHARE_CACHE_ROOT, 'compressed', 'test_file'
+        )
+        response = self.send_file('apache', compressed_path)
+        self.assertEqual(response['X-SendFile'], urlquote(compressed_path))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        response = self.send_file('nginx', compressed_path)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            urlquote(posixpath.join(
+                settings.SHARE_ACCEL_CACHE_URL, 'compressed/test_file'
+            ))
+        )
+
+    def test_share_downloads_async(self):
+        response = self.send_file('async')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            response['Location'],
+            settings.SHARE_ASYNC_URL + urlquote('test_dir_é/test_file_é')
+        )
@@ -0,0 +1,94 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import tempfile
+
+from share.hotcache import HotFileCache
+
+
+class HotFileCacheTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = self.create_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def create_cache(self, max_size=10000, max_file_size=5000):
+        return HotFileCache(
+            posixpath.join(self.root, 'cache'), max_size, max_file_size
+        )
+
+    def write_file(self, name, size):
+        path = posixpath.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(name.encode('ascii')[:1] * size)
+        return os.stat(path)
+
+    def test_share_hotcache_get(self):
+        """Asserts contents are returned while their file is unchanged"""
+
+        st = self.write_file('a', 4000)
+        self.assertIsNone(self.cache.get(st))
+        self.assertTrue(self.cache.put(st, b'a' * 4000))
+        self.assertEqual(self.cache.get(st), b'a' * 4000)
+
+        st = self.write_file('a', 3000)
+        self.assertIsNone(self.cache.get(st))
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['size'], 4000)
+
+    def test_share_hotcache_too_large(self):
+        st = self.write_file('a', 6000)
+        self.assertFalse(self.cache.put(st, b'a' * 6000))
+        self.assertIsNone(self.cache.get(st))
+        self.assertEqual(self.cache.get_stats()['misses'], 0)
+        self.assertFalse(self.create_cache(0).accepts(st))
+
+    def test_share_hotcache_evict_lru(self):
+        """Asserts the least recently used contents make room"""
+
+        st_a = self.write_file('a', 4000)
+        st_b = self.write_file('b', 4000)
+        st_c = self.write_file('c', 4000)
+        self.cache.put(st_a, b'a' * 4000)
+        self.cache.put(st_b, b'b' * 4000)
+        self.cache.get(st_a)
+        self.cache.put(st_c, b'c' * 4000)
+
+        self.assertIsNone(self.cache.get(st_b))
+        self.assertEqual(self.cache.get(st_a), b'a' * 4000)
+        self.assertEqual(self.cache.get(st_c), b'c' * 4000)
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+
+    def test_share_hotcache_evict_set(self):
+        """Asserts entries are evicted when their set of slots is full"""
+
+        stats = [self.write_file(name, 10) for name in 'abcdefghi']
+        for st in stats:
+            self.cache.put(st, bytes(10))
+        self.assertEqual(self.cache.slots, 8)
+        self.assertEqual(self.cache.get_stats()['entries'], 8)
+        self.assertIsNone(self.cache.get(stats[0]))
+
+    def test_share_hotcache_shared(self):
+        """Asserts processes share the contents and statistics"""
+
+        st = self.write_file('a', 4000)
+        self.cache.put(st, b'a' * 4000)
+        other = self.create_cache()
+        self.assertEqual(other.get(st), b'a' * 4000)
+        self.assertEqual(self.cache.get_stats()['hits'], 1)
+
+        other.clear()
+        self.assertIsNone(self.cache.get(st))
+        self.assertEqual(self.cache.get_stats()['hits'], 0)
+
+        # Another geometry does not share the file
+        self.assertNotEqual(self.create_cache(20000).path, self.cache.path)
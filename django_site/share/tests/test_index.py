@@ -0,0 +1,370 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import tempfile
+from unittest import mock
+
+from share.index import ShareIndex
+
+
+class ShareIndexTests(TestCase):
+
+    def setUp(self):
+        """Creates a small tree and an empty index in temporary dirs"""
+        self.root = tempfile.mkdtemp()
+        self.cache_root = tempfile.mkdtemp()
+        self.dirname = posixpath.join(self.root, 'test_dir')
+        self.subdirname = posixpath.join(self.dirname, 'test_subdir')
+        os.makedirs(self.subdirname)
+        self.write_file(posixpath.join(self.dirname, 'test_file'), 10)
+        self.write_file(posixpath.join(self.subdirname, 'test_file'), 20)
+        self.index = self.create_index()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache_root)
+
+    def create_index(self):
+        db_path = posixpath.join(self.cache_root, 'index.sqlite3')
+        return ShareIndex(db_path, root=self.root)
+
+    def write_file(self, path, size):
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_share_index_get_size(self):
+        """Asserts directory sizes include sub dirs and files"""
+
+        self.assertEqual(self.index.get_size(self.root), 30)
+        self.assertEqual(self.index.get_size(self.subdirname), 20)
+        self.assertEqual(
+            self.index.get_size(posixpath.join(self.dirname, 'test_file')), 10
+        )
+
+    def test_share_index_unmodified_not_rescanned(self):
+        """Asserts unmodified directories are not listed again, even by
+        another index instance"""
+
+        self.index.get_size(self.root)
+        with mock.patch('share.index.scandir') as scandir:
+            size = self.create_index().get_size(self.root)
+            self.assertFalse(scandir.called)
+        self.assertEqual(size, 30)
+
+    def test_share_index_new_file(self):
+        """Asserts a file added in a directory is taken into account"""
+
+        self.index.get_size(self.root)
+        self.write_file(posixpath.join(self.root, 'test_file'), 5)
+        self.assertEqual(self.index.get_size(self.root), 35)
+
+    def test_share_index_update_deep_change(self):
+        """Asserts update() finds changes below unmodified directories"""
+
+        self.index.get_size(self.root)
+        self.write_file(posixpath.join(self.subdirname, 'test_file_2'), 5)
+        self.assertEqual(self.index.update(), 35)
+        self.assertEqual(self.index.get_size(self.root), 35)
+
+    def test_share_index_deep_change(self):
+        """Asserts sizes account for changes below unmodified directories,
+        without any update"""
+
+        self.index.get_size(self.root)
+        self.write_file(posixpath.join(self.subdirname, 'test_file_2'), 5)
+        self.assertEqual(self.index.get_size(self.root), 35)
+        self.assertEqual(self.index.get_size(self.dirname), 35)
+
+    def test_share_index_removed_dir(self):
+        """Asserts entries below a removed directory are dropped and the
+        parent directories sizes are updated"""
+
+        self.index.get_size(self.root)
+        shutil.rmtree(self.subdirname)
+        self.assertEqual(self.index.get_size(self.dirname), 10)
+        self.assertEqual(self.index.get_size(self.root), 10)
+        count, = self.index.connection.execute(
+            'SELECT COUNT(*) FROM entries WHERE path LIKE ?',
+            ('test_dir/test_subdir%',)
+        ).fetchone()
+        self.assertEqual(count, 0)
+
+    def test_share_index_apply_change(self):
+        """Asserts single changes are added to the ancestors sizes"""
+
+        self.index.get_size(self.root)
+        path = posixpath.join(self.subdirname, 'test_file')
+        self.write_file(path, 50)
+        self.index.apply_change(path)
+        self.assertEqual(self.index.update(), 60)
+        os.remove(path)
+        self.index.apply_change(path)
+        with mock.patch('share.index.scandir') as scandir:
+            self.assertEqual(self.index.get_size(self.root), 10)
+            self.assertFalse(scandir.called)
+
+    def test_share_index_list_dir_live(self):
+        """Asserts listings are served from the index while it is live"""
+
+        self.index.get_size(self.root)
+        self.assertIsNone(self.index.list_dir(self.dirname))
+        self.index.heartbeat()
+        self.index._live_checked_at = None
+        entries = sorted(self.index.list_dir(self.dirname))
+        self.assertEqual(
+            [(e.name, e.isdir, e.size) for e in entries],
+            [('test_file', False, 10), ('test_subdir', True, 20)]
+        )
+
+    def test_share_index_symlink_live(self):
+        """Asserts links to directories are listed while the index is live,
+        without being followed nor counted in their parent size"""
+
+        link = posixpath.join(self.dirname, 'test_link')
+        os.symlink(self.subdirname, link)
+        os.symlink('..', posixpath.join(self.subdirname, 'test_loop'))
+        self.assertEqual(self.index.update(), 30)
+        self.index.heartbeat()
+        self.index._live_checked_at = None
+        entries = sorted(self.index.list_dir(self.dirname))
+        self.assertEqual(
+            [(e.name, e.isdir) for e in entries],
+            [('test_file', False), ('test_link', True), ('test_subdir', True)]
+        )
+        self.assertEqual(self.index.get_size(self.dirname), 30)
+        # Looked up on the filesystem
+        self.assertEqual(self.index.get_size(link), 20)
+        self.assertIsNone(self.index.list_dir(link))
+        self.assertEqual(self.index.get_size(self.root), 30)
+
+    def test_share_index_symlink_search_changes(self):
+        """Asserts the entries indexed through a link are neither searched
+        nor listed in the changes"""
+
+        link = posixpath.join(self.dirname, 'test_link')
+        os.symlink(self.subdirname, link)
+        self.index.update()
+        changes, token, reset, more = self.index.get_changes()
+        # Indexes the target content below the link path
+        self.assertEqual(self.index.get_size(link), 20)
+
+        self.assertEqual(
+            self.search('file'),
+            ['test_dir/test_file', 'test_dir/test_subdir/test_file']
+        )
+        self.assertEqual(
+            self.search('link'), ['test_dir/test_link']
+        )
+        self.assertEqual(
+            self.index.search('link')[0][1], ('test_link', True, None, None)
+        )
+        changes = dict(self.index.get_changes(token)[0])
+        self.assertNotIn('test_dir/test_link/test_file', changes)
+        self.assertEqual(
+            changes['test_dir/test_link'], ('test_link', True, None, None)
+        )
+        self.assertNotIn(
+            'test_dir/test_link/test_file', dict(self.index.get_changes()[0])
+        )
+
+    def test_share_index_update_keep_alive(self):
+        """Asserts heartbeats are committed during updates keeping the index
+        live"""
+
+        other_index = self.create_index()
+        heartbeats = []
+
+        def heartbeat():
+            ShareIndex.heartbeat(self.index)
+            # Seen by other processes
+            heartbeats.append(other_index._get_meta('watcher_heartbeat'))
+
+        with mock.patch('share.index.WATCHER_HEARTBEAT', 0):
+            with mock.patch.object(self.index, 'heartbeat', heartbeat):
+                self.assertEqual(
+                    self.index.update(full=True, keep_alive=True), 30
+                )
+                # One per directory
+                self.assertEqual(len(heartbeats), 3)
+                self.assertNotIn(None, heartbeats)
+                self.index.update(full=True)
+                self.assertEqual(len(heartbeats), 3)
+
+    def test_share_index_generation(self):
+        """Asserts the generation changes with the entries, while live"""
+
+        self.index.update()
+        self.assertIsNone(self.index.get_generation())
+        self.index.heartbeat()
+        self.index._live_checked_at = None
+        generation = self.index.get_generation()
+        self.assertIsNotNone(generation)
+        self.assertEqual(self.index.get_generation(), generation)
+
+        self.write_file(posixpath.join(self.subdirname, 'test_file'), 30)
+        self.index.apply_change(posixpath.join(self.subdirname, 'test_file'))
+        self.assertNotEqual(self.index.get_generation(), generation)
+
+    def search(self, query, **kwargs):
+        return [path for path, entry in self.index.search(query, **kwargs)]
+
+    def test_share_index_search(self):
+        """Asserts names are searched by substring or prefix, ignoring case"""
+
+        self.index.update()
+        self.assertTrue(self.index.searchable)
+        self.assertEqual(
+            self.search('SUBDIR'), ['test_dir/test_subdir']
+        )
+        self.assertEqual(
+            self.search('file'),
+            ['test_dir/test_file', 'test_dir/test_subdir/test_file']
+        )
+        self.assertEqual(self.search('file', prefix=True), [])
+        self.assertEqual(
+            self.search('Test_s', prefix=True), ['test_dir/test_subdir']
+        )
+        self.assertEqual(
+            self.search('file', path=self.subdirname),
+            ['test_dir/test_subdir/test_file']
+        )
+        self.assertEqual(len(self.search('t', limit=2)), 2)
+
+    def test_share_index_search_without_trigrams(self):
+        """Asserts names are scanned if they can't be looked up"""
+
+        self.index.update()
+        self.index.searchable = False
+        self.assertEqual(self.search('sub'), ['test_dir/test_subdir'])
+        self.assertEqual(self.search('%'), [])
+        self.assertEqual(self.search('_s'), ['test_dir/test_subdir'])
+
+    def test_share_index_search_incremental(self):
+        """Asserts the search index follows the changes"""
+
+        self.index.update()
+        path = posixpath.join(self.dirname, 'new_file')
+        self.write_file(path, 5)
+        self.index.apply_change(path)
+        self.assertEqual(self.search('new_'), ['test_dir/new_file'])
+        shutil.rmtree(self.subdirname)
+        self.index.update()
+        self.assertEqual(self.search('subdir'), [])
+        self.assertEqual(self.search('test_file'), ['test_dir/test_file'])
+
+    def test_share_index_changes_reset(self):
+        """Asserts a missing or unknown token lists the current entries"""
+
+        self.index.update()
+        for token in (None, 'invalid', 'abc-1'):
+            changes, token, reset, more = self.index.get_changes(token)
+            self.assertTrue(reset)
+            self.assertFalse(more)
+            self.assertEqual(sorted(path for path, entry in changes), [
+                'test_dir', 'test_dir/test_file', 'test_dir/test_subdir',
+                'test_dir/test_subdir/test_file'
+            ])
+
+        changes, token, reset, more = self.index.get_changes(
+            path=self.subdirname
+        )
+        self.assertEqual(changes, [
+            ('test_dir/test_subdir/test_file', (
+                'test_file', False, 20,
+                os.stat(posixpath.join(self.subdirname, 'test_file'))
+                .st_mtime_ns
+            ))
+        ])
+
+    def test_share_index_changes_since_token(self):
+        """Asserts only the changes made since a token are listed, and the
+        token survives the index"""
+
+        self.index.update()
+        changes, token, reset, more = self.index.get_changes()
+        self.assertEqual(
+            self.index.get_changes(token), ([], token, False, False)
+        )
+
+        path = posixpath.join(self.subdirname, 'new_file')
+        self.write_file(path, 5)
+        self.index.apply_change(path)
+        shutil.rmtree(self.subdirname)
+        self.index.apply_change(self.subdirname)
+
+        # Another instance, as after a restart
+        changes, new_token, reset, more = self.create_index().get_changes(
+            token
+        )
+        self.assertFalse(reset)
+        self.assertNotEqual(new_token, token)
+        changes = dict(changes)
+        self.assertIsNone(changes['test_dir/test_subdir'])
+        self.assertIsNone(changes['test_dir/test_subdir/test_file'])
+        self.assertIsNone(changes['test_dir/test_subdir/new_file'])
+        self.assertEqual(changes['test_dir'].size, 10)
+        self.assertNotIn('test_dir/test_file', changes)
+        self.assertEqual(
+            self.index.get_changes(new_token), ([], new_token, False, False)
+        )
+
+    def test_share_index_changes_pages(self):
+        """Asserts changes can be fetched page by page"""
+
+        self.index.update()
+        paths = []
+        changes, token, reset, more = self.index.get_changes(limit=3)
+        self.assertTrue(reset)
+        while True:
+            paths += [path for path, entry in changes]
+            if not more:
+                break
+            changes, token, reset, more = self.index.get_changes(
+                token, limit=3
+            )
+            self.assertFalse(reset)
+        self.assertEqual(len(paths), 4)
+        self.assertEqual(len(set(paths)), 4)
+
+    def test_share_index_changes_stale_token(self):
+        """Asserts a token older than the removals logged gets a reset"""
+
+        self.index.update()
+        changes, token, reset, more = self.index.get_changes()
+        shutil.rmtree(self.subdirname)
+        self.index.update()
+        changes, new_token, reset, more = self.index.get_changes(token)
+        self.assertFalse(reset)
+
+        self.index.prune_changes(max_age=-1)
+        changes, token, reset, more = self.index.get_changes(token)
+        self.assertTrue(reset)
+        self.assertEqual(sorted(path for path, entry in changes), [
+            'test_dir', 'test_dir/test_file'
+        ])
+        # Tokens following the removals are still valid
+        changes, token, reset, more = self.index.get_changes(new_token)
+        self.assertFalse(reset)
+
+    def test_share_index_other_version(self):
+        """Asserts an index of another version is emptied, with a new change
+        feed"""
+
+        self.index.update()
+        changes, token, reset, more = self.index.get_changes()
+
+        class NewShareIndex(ShareIndex):
+            version = ShareIndex.version + 1
+
+        index = NewShareIndex(self.index.db_path, root=self.root)
+        self.assertEqual(
+            index.connection.execute('SELECT COUNT(*) FROM entries')
+            .fetchone(),
+            (0,)
+        )
+        index.update()
+        changes, new_token, reset, more = index.get_changes(token)
+        self.assertTrue(reset)
+        self.assertEqual(len(changes), 4)
@@ -0,0 +1,146 @@
+from django.core.urlresolvers import Resolver404, resolve
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+import io
+import os
+import posixpath
+import time
+from unittest import mock
+from urllib.parse import unquote
+from wsgiref.util import setup_testing_defaults
+
+from share import settings
+from share.links import (
+    ExpiredLink,
+    InvalidLink,
+    check_link,
+    get_signature,
+    make_link
+)
+from share.linkserver import application, serve_link
+from share.settings import SHARE_LINK_URL, SHARE_ROOT
+
+
+class LinksTests(TestCase):
+
+    def test_share_links_check(self):
+        """Asserts links are only valid for their path, until they expire"""
+
+        expires = int(time.time()) + 60
+        signature = get_signature('test_dir/test_file_é', expires)
+        check_link('test_dir/test_file_é', str(expires), signature)
+        with self.assertRaises(InvalidLink):
+            check_link('test_dir/test_file', str(expires), signature)
+        with self.assertRaises(InvalidLink):
+            check_link('test_dir/test_file_é', str(expires + 1), signature)
+        with self.assertRaises(InvalidLink):
+            check_link('test_dir/test_file_é', None, None)
+        with self.assertRaises(InvalidLink):
+            check_link(
+                'test_dir/test_file_é', str(expires), signature, key='other'
+            )
+
+        expires = int(time.time()) - 1
+        with self.assertRaises(ExpiredLink):
+            check_link(
+                'test_dir/test_file_é', str(expires),
+                get_signature('test_dir/test_file_é', expires)
+            )
+
+    def test_share_links_make(self):
+        url, expires = make_link('test_dir/test_file_é', 60)
+        self.assertAlmostEqual(expires, time.time() + 60, delta=2)
+        self.assertTrue(
+            url.startswith(SHARE_LINK_URL + 'test_dir/test_file_%C3%A9?')
+        )
+
+    def test_share_links_apart_from_site(self):
+        """Asserts links are not served by the views of the site"""
+
+        url, expires = make_link('test_dir/test_file_é', 60)
+        try:
+            match = resolve(url.partition('?')[0])
+        except Resolver404:
+            pass
+        else:
+            self.assertNotEqual(match.view_name, 'share:link')
+
+
+class LinkServerTests(TestCase):
+
+    def setUp(self):
+        self.dirname = posixpath.join(SHARE_ROOT, 'test_dir_link')
+        os.makedirs(self.dirname)
+        self.fname = posixpath.join(self.dirname, 'test_file_é')
+        with open(self.fname, 'w') as f:
+            f.write('test content')
+
+    def tearDown(self):
+        os.remove(self.fname)
+        os.rmdir(self.dirname)
+
+    def get(self, url, **extra):
+        """Requests a link relative to the link server mount point"""
+        request = RequestFactory().get(url, **extra)
+        request.path_info = request.path_info[len(SHARE_LINK_URL) - 1:]
+        return serve_link(request)
+
+    @mock.patch.object(settings, 'SHARE_DOWNLOAD_BACKEND', 'nginx')
+    def test_share_linkserver_valid(self):
+        """Link is valid, the file must be sent by the backend"""
+
+        url, expires = make_link('test_dir_link/test_file_é')
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.SHARE_ACCEL_REDIRECT_URL +
+            'test_dir_link/test_file_%C3%A9'
+        )
+        self.assertEqual(response['Cache-Control'], 'private')
+
+    def test_share_linkserver_invalid(self):
+        url, expires = make_link('test_dir_link/test_file_é')
+        self.assertEqual(self.get(url + 'x').status_code, 403)
+        self.assertEqual(
+            self.get(url.replace('test_file', 'other_file')).status_code, 403
+        )
+
+        url, expires = make_link('test_dir_link/test_file_é', -10)
+        self.assertEqual(self.get(url).status_code, 410)
+
+    @mock.patch.object(settings, 'SHARE_DOWNLOAD_BACKEND', 'python')
+    def test_share_linkserver_application(self):
+        """Asserts the WSGI application serves links by itself"""
+
+        url, expires = make_link('test_dir_link/test_file_é')
+        path, sep, query = url.partition('?')
+        environ = {
+            'SCRIPT_NAME': SHARE_LINK_URL.rstrip('/'),
+            # Raw bytes of the path, as WSGI servers pass them
+            'PATH_INFO': unquote(
+                path[len(SHARE_LINK_URL) - 1:], encoding='latin-1'
+            ),
+            'QUERY_STRING': query,
+            'wsgi.input': io.BytesIO(),
+        }
+        setup_testing_defaults(environ)
+        statuses = []
+        # Django rewrites the environ of its requests
+        response = application(
+            dict(environ), lambda status, headers: statuses.append(status)
+        )
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        self.assertEqual(statuses, ['200 OK'])
+        self.assertEqual(content, b'test content')
+
+        environ['QUERY_STRING'] = ''
+        response = application(
+            dict(environ), lambda status, headers: statuses.append(status)
+        )
+        response.close()
+        self.assertEqual(statuses[-1], '403 FORBIDDEN')
@@ -0,0 +1,116 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import tempfile
+
+from share.listing import (
+    InvalidCursor,
+    encode_cursor,
+    list_page,
+    parse_query
+)
+from share.utils import FileSystemNode
+
+
+class ListPageTests(TestCase):
+
+    def setUp(self):
+        """Creates a directory with a few sub dirs and files"""
+        self.root = tempfile.mkdtemp()
+        for i in range(3):
+            os.mkdir(posixpath.join(self.root, 'dir_{0}'.format(i)))
+        for i in range(10):
+            self.create_file('File_{0}'.format(i), i)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def create_file(self, name, size):
+        with open(posixpath.join(self.root, name), 'wb') as f:
+            f.write(b'x' * size)
+
+    def list_all(self, sort='name', order='asc', limit=4):
+        names, cursor = [], None
+        while True:
+            children, cursor = list_page(
+                FileSystemNode(self.root), sort, order, cursor, limit
+            )
+            self.assertLessEqual(len(children), limit)
+            names.extend(child.name for child in children)
+            if cursor is None:
+                return names
+
+    def test_share_listing_name(self):
+        """Asserts pages follow each other, directories first"""
+
+        self.assertEqual(
+            self.list_all(),
+            ['dir_0', 'dir_1', 'dir_2'] +
+            ['File_{0}'.format(i) for i in range(10)]
+        )
+
+    def test_share_listing_size_desc(self):
+        """Asserts pages can be sorted by size, in descending order"""
+
+        self.assertEqual(
+            self.list_all(sort='size', order='desc', limit=5),
+            ['dir_2', 'dir_1', 'dir_0'] +
+            ['File_{0}'.format(i) for i in reversed(range(10))]
+        )
+
+    def test_share_listing_stable_cursor(self):
+        """Asserts changes before a cursor do not shift the next pages"""
+
+        node = FileSystemNode(self.root)
+        children, cursor = list_page(node, limit=5)
+        self.assertEqual(children[-1].name, 'File_1')
+
+        os.remove(posixpath.join(self.root, 'File_0'))
+        self.create_file('File_00', 0)
+        self.create_file('File_10', 0)
+        children, cursor = list_page(
+            FileSystemNode(self.root), cursor=cursor, limit=3
+        )
+        self.assertEqual(
+            [child.name for child in children],
+            ['File_10', 'File_2', 'File_3']
+        )
+
+    def test_share_listing_invalid_cursor(self):
+        """Asserts cursors are checked against the sort"""
+
+        node = FileSystemNode(self.root)
+        children, cursor = list_page(node, limit=5)
+        for invalid_cursor in ('invalid', cursor[:-4]):
+            with self.assertRaises(InvalidCursor):
+                list_page(node, cursor=invalid_cursor)
+        with self.assertRaises(InvalidCursor):
+            list_page(node, sort='size', cursor=cursor)
+
+    def test_share_listing_wrongly_typed_cursor(self):
+        """Asserts the types of the cursor keys are checked"""
+
+        node = FileSystemNode(self.root)
+        for sort, key in (
+                ('name', ['x', 'a', 'a']),
+                ('name', [1, 2, 'a']),
+                ('name', [2, 'a', 'a']),
+                ('size', [1, 'x', 'a', 'a']),
+                ('mtime', [1, None, 'a', 'a']),
+                ('size', [True, 1, 'a', 'a'])):
+            cursor = encode_cursor(sort, 'asc', key)
+            with self.assertRaises(InvalidCursor):
+                list_page(node, sort, cursor=cursor)
+            with self.assertRaises(ValueError):
+                parse_query({'sort': sort, 'cursor': cursor})
+
+    def test_share_listing_parse_query(self):
+        """Asserts query parameters are validated"""
+
+        self.assertEqual(parse_query({}), ('name', 'asc', None, 200))
+        for query in ({'sort': 'type'}, {'order': 'up'}, {'limit': '0'},
+                      {'limit': 'all'}, {'cursor': 'invalid'}):
+            with self.assertRaises(ValueError):
+                parse_query(query)
@@ -0,0 +1,192 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+import io
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+import zipfile
+
+from share.members import (
+    ArchiveCache,
+    InvalidArchive,
+    archive_cache,
+    get_archive_url,
+    get_archive_type,
+    get_member_node,
+    serve_member
+)
+from share.serving import FileRange
+from share.settings import SHARE_ROOT
+
+
+class MembersTests(TestCase):
+
+    def setUp(self):
+        """Creates zip and tar archives of the same files in the share"""
+        self.dirname = tempfile.mkdtemp(dir=SHARE_ROOT, prefix='test_members')
+        self.url = posixpath.basename(self.dirname)
+        self.files = {
+            'docs/readme_é.txt': b'read me ' * 1000,
+            'docs/sub/empty': b'',
+            'stored.bin': bytes(range(256)),
+        }
+        with zipfile.ZipFile(self.get_path('test.zip'), 'w') as archive:
+            for name, data in sorted(self.files.items()):
+                archive.writestr(
+                    name, data, zipfile.ZIP_STORED if name.endswith('.bin')
+                    else zipfile.ZIP_DEFLATED
+                )
+            archive.writestr('../outside', b'x')
+        for name, mode in (('test.tar', 'w'), ('test.tar.gz', 'w:gz')):
+            with tarfile.open(self.get_path(name), mode) as archive:
+                for member_name, data in sorted(self.files.items()):
+                    info = tarfile.TarInfo('./' + member_name)
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+        archive_cache.clear()
+
+    def get_path(self, name):
+        return posixpath.join(self.dirname, name)
+
+    def get_node(self, path):
+        return get_member_node(posixpath.join(self.url, path))
+
+    def read(self, node, **headers):
+        request = self.factory.get('/', **headers)
+        response = serve_member(request, node)
+        try:
+            content = b''.join(getattr(response, 'streaming_content', []))
+            return response, content
+        finally:
+            response.close()
+
+    def test_share_members_archive_type(self):
+        self.assertEqual(get_archive_type('a.ZIP'), ('zip', None))
+        self.assertEqual(get_archive_type('a.tar'), ('tar', ''))
+        self.assertEqual(get_archive_type('a.tar.gz'), ('tar', 'gz'))
+        self.assertEqual(get_archive_type('a.tgz'), ('tar', 'gz'))
+        self.assertEqual(get_archive_type('a.gz'), (None, None))
+
+    def test_share_members_list(self):
+        """Asserts archives are listed as directories, whatever their type"""
+
+        for name in ('test.zip', 'test.tar', 'test.tar.gz'):
+            root = self.get_node(name + '/')
+            self.assertTrue(root.isdir)
+            self.assertTrue(root.in_archive)
+            self.assertEqual(root.url, self.url + '/' + name + '/')
+            self.assertEqual(root.parent_url, self.url + '/')
+            self.assertEqual(root.size, sum(map(len, self.files.values())))
+            self.assertEqual(
+                sorted(child.name for child in root.iter_children()),
+                ['docs', 'stored.bin']
+            )
+
+            docs = self.get_node(name + '/docs')
+            self.assertTrue(docs.isdir)
+            self.assertEqual(docs.url, self.url + '/' + name + '/docs/')
+            self.assertEqual(docs.parent_url, self.url + '/' + name + '/')
+            self.assertEqual(docs.size, 8000)
+            self.assertEqual(
+                sorted(child.name for child in docs.iter_children()),
+                ['readme_é.txt', 'sub']
+            )
+
+        self.assertIsNone(self.get_node('test.zip/outside'))
+        self.assertIsNone(self.get_node('test.zip/../test.tar/stored.bin'))
+        self.assertIsNone(self.get_node('test.zip/missing'))
+        self.assertIsNone(self.get_node('test.zip'))
+
+    def test_share_members_cache(self):
+        """Asserts listings are read again only if the archive changed"""
+
+        path = self.get_path('test.zip')
+        archive = archive_cache.get(path)
+        self.assertIs(archive_cache.get(path), archive)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertIsNot(archive_cache.get(path), archive)
+
+        with open(self.get_path('invalid.zip'), 'wb') as f:
+            f.write(b'not a zip')
+        with self.assertRaises(InvalidArchive):
+            archive_cache.get(self.get_path('invalid.zip'))
+        self.assertIsNone(self.get_node('invalid.zip/'))
+
+    def test_share_members_cache_bound(self):
+        """Asserts the cache is bounded by the total number of members"""
+
+        # 6 members each, with the implied directories
+        cache = ArchiveCache(max_members=15)
+        paths = [self.get_path(name) for name in ('test.zip', 'test.tar')]
+        archives = [cache.get(path) for path in paths]
+        self.assertIs(cache.get(paths[0]), archives[0])
+        self.assertIs(cache.get(paths[1]), archives[1])
+        archive = cache.get(self.get_path('test.tar.gz'))
+        # The least recently used one is dropped
+        self.assertIsNot(cache.get(paths[0]), archives[0])
+        self.assertIs(cache.get(self.get_path('test.tar.gz')), archive)
+
+        # The last one is kept whatever its size
+        cache = ArchiveCache(max_members=1)
+        archive = cache.get(paths[0])
+        self.assertIs(cache.get(paths[0]), archive)
+
+    def test_share_members_large_compressed(self):
+        """Asserts compressed tar archives are not browsed above a size"""
+
+        size = os.path.getsize(self.get_path('test.tar.gz'))
+        node = mock.Mock(
+            isdir=False, in_archive=False, size=size, url='test.tar.gz'
+        )
+        node.name = 'test.tar.gz'
+        with mock.patch('share.members.MAX_COMPRESSED_SIZE', size - 1):
+            self.assertIsNone(self.get_node('test.tar.gz/'))
+            self.assertIsNone(get_archive_url(node))
+            # Uncompressed ones are seeked
+            self.assertIsNotNone(self.get_node('test.tar/'))
+        self.assertIsNotNone(self.get_node('test.tar.gz/'))
+        self.assertIsNotNone(get_archive_url(node))
+
+    def test_share_members_serve(self):
+        """Asserts members are streamed out of every archive type"""
+
+        for name in ('test.zip', 'test.tar', 'test.tar.gz'):
+            for member_name, data in self.files.items():
+                node = self.get_node(name + '/' + member_name)
+                response, content = self.read(node)
+                self.assertEqual(content, data)
+                self.assertEqual(response['Content-Length'], str(len(data)))
+
+                response = self.read(
+                    node, HTTP_IF_NONE_MATCH=response['ETag']
+                )[0]
+                self.assertEqual(response.status_code, 304)
+
+        # Sent as files if stored as is
+        for name in ('test.zip', 'test.tar'):
+            response = serve_member(
+                self.factory.get('/'), self.get_node(name + '/stored.bin')
+            )
+            self.assertIsInstance(response.file_to_stream, FileRange)
+            response.close()
+
+    def test_share_members_serve_corrupted(self):
+        """Member data is corrupted, the stream must fail"""
+
+        path = self.get_path('test.zip')
+        node = self.get_node('test.zip/docs/readme_é.txt')
+        with open(path, 'r+b') as f:
+            data = f.read()
+            f.seek(data.index(b'PK\x03\x04', 1) - 10)
+            f.write(b'\xff')
+        with self.assertRaises(InvalidArchive):
+            self.read(node)
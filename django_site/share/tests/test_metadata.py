@@ -0,0 +1,107 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from share import metadata
+from share.listing import list_page
+from share.metadata import MetadataFetcher, get_deadline, read_metadata
+from share.templatetags.share_filters import print_size
+from share.utils import FileSystemNode
+
+
+class MetadataFetcherTests(TestCase):
+
+    def setUp(self):
+        """Creates a directory with a sub dir and a few files"""
+        self.root = tempfile.mkdtemp()
+        os.mkdir(posixpath.join(self.root, 'dir'))
+        for i in range(5):
+            name = posixpath.join(self.root, 'dir', 'file_{0}'.format(i))
+            with open(name, 'wb') as f:
+                f.write(b'x' * i)
+        self.fetcher = MetadataFetcher(workers=4)
+        self.released = threading.Event()
+
+    def tearDown(self):
+        self.released.set()
+        self.fetcher.wait()
+        shutil.rmtree(self.root)
+
+    def get_children(self):
+        return list(FileSystemNode(self.root).iter_children()) + list(
+            FileSystemNode(posixpath.join(self.root, 'dir')).iter_children()
+        )
+
+    def read_slowly(self, path):
+        self.released.wait()
+        return read_metadata(path)
+
+    def test_share_metadata_fetch(self):
+        """Asserts metadata are set without further stat call"""
+
+        nodes = self.get_children()
+        self.fetcher.fetch(nodes)
+        for node in nodes:
+            self.assertTrue(node.metadata_known)
+            expected = read_metadata(node.path)
+            with mock.patch('os.stat') as stat:
+                self.assertEqual((node.mtime, node.size), expected)
+                stat.assert_not_called()
+        self.assertEqual(nodes[0].size, sum(range(5)))
+
+    def test_share_metadata_deadline(self):
+        """Deadline expired, sizes must be left to compute"""
+
+        nodes = self.get_children()
+        with mock.patch.object(metadata, 'read_metadata', self.read_slowly):
+            start = time.monotonic()
+            self.fetcher.fetch(nodes, time.monotonic() + 0.05)
+            self.assertLess(time.monotonic() - start, 1)
+            for node in nodes:
+                self.assertIsNone(node.size)
+                self.assertIsNone(node.mtime)
+                self.assertEqual(print_size(node.size), 'calcul…')
+
+            # Reloaded while being read: the same reads are waited for
+            futures = [self.fetcher.schedule(node.path) for node in nodes]
+            nodes = self.get_children()
+            self.released.set()
+            self.fetcher.fetch(nodes)
+            for node, future in zip(nodes, futures):
+                self.assertEqual((node.mtime, node.size), future.result())
+
+    def test_share_metadata_sequential(self):
+        """No worker, metadata must be read when accessed"""
+
+        fetcher = MetadataFetcher(workers=0)
+        nodes = self.get_children()
+        fetcher.fetch(nodes)
+        self.assertFalse(any(node.metadata_known for node in nodes))
+        sizes = dict((node.name, node.size) for node in nodes)
+        self.assertEqual(sizes['file_3'], 3)
+
+    def test_share_metadata_get_deadline(self):
+        self.assertIsNone(get_deadline(0))
+        self.assertAlmostEqual(
+            get_deadline(5), time.monotonic() + 5, delta=1
+        )
+
+    def test_share_metadata_listing(self):
+        """Deadline expired, listings sorted by size must not fail"""
+
+        node = FileSystemNode(posixpath.join(self.root, 'dir'))
+        with mock.patch.object(metadata, 'read_metadata', self.read_slowly):
+            children, cursor = list_page(
+                node, sort='size', limit=3, deadline=time.monotonic() + 0.05
+            )
+        self.assertEqual(
+            [child.name for child in children],
+            ['file_0', 'file_1', 'file_2']
+        )
+        self.assertIsNotNone(cursor)
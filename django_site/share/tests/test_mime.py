@@ -0,0 +1,94 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+from share.mime import MimeTypeCache
+
+
+@mock.patch.dict(sys.modules, {'magic': mock.Mock()})
+@mock.patch('share.mime.detect_mime_type', return_value='text/plain')
+class MimeTypeCacheTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_root = tempfile.mkdtemp()
+        self.fname = posixpath.join(self.root, 'test_file')
+        self.write_file(self.fname, 'test content')
+        self.cache = self.create_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache_root)
+
+    def create_cache(self, max_entries=100):
+        db_path = posixpath.join(self.cache_root, 'mime_types.sqlite3')
+        return MimeTypeCache(db_path, max_entries=max_entries)
+
+    def write_file(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_share_mime_cached(self, detect_mime_type):
+        """Asserts a file is only read once, even by another instance"""
+
+        self.assertEqual(self.cache.get(self.fname), 'text/plain')
+        self.assertEqual(self.create_cache().get(self.fname), 'text/plain')
+        self.assertEqual(detect_mime_type.call_count, 1)
+
+    def test_share_mime_modified_file(self, detect_mime_type):
+        """Asserts a modified file is read again"""
+
+        self.cache.get(self.fname)
+        self.write_file(self.fname, 'modified test content')
+        self.cache.get(self.fname)
+        self.assertEqual(detect_mime_type.call_count, 2)
+
+    def test_share_mime_detect_dir(self, detect_mime_type):
+        """Asserts all the files of a directory are detected at once"""
+
+        self.write_file(posixpath.join(self.root, 'test_file_é'), 'test')
+        os.mkdir(posixpath.join(self.root, 'test_dir'))
+        self.assertEqual(
+            self.cache.detect_dir(self.root),
+            {'test_file': 'text/plain', 'test_file_é': 'text/plain'}
+        )
+        self.cache.get(self.fname)
+        self.assertEqual(detect_mime_type.call_count, 2)
+
+    def test_share_mime_detect_dir_unlocked(self, detect_mime_type):
+        """Asserts the database is not locked while files are read"""
+
+        other_cache = self.create_cache()
+        other_cache.connection.execute('PRAGMA busy_timeout = 0')
+
+        def detect(path):
+            self.assertFalse(self.cache.connection.in_transaction)
+            # Another process writing meanwhile
+            with other_cache.connection:
+                other_cache.connection.execute('DELETE FROM mime_types')
+            return 'text/plain'
+
+        detect_mime_type.side_effect = detect
+        self.write_file(posixpath.join(self.root, 'test_file_é'), 'test')
+        self.assertEqual(
+            self.cache.detect_dir(self.root),
+            {'test_file': 'text/plain', 'test_file_é': 'text/plain'}
+        )
+
+    def test_share_mime_bounded(self, detect_mime_type):
+        """Asserts least recently used types are evicted"""
+
+        cache = self.create_cache(max_entries=10)
+        for i in range(200):
+            path = posixpath.join(self.root, 'file_{0}'.format(i))
+            self.write_file(path, 'test content')
+            cache.get(path)
+        count, = cache.connection.execute(
+            'SELECT COUNT(*) FROM mime_types'
+        ).fetchone()
+        self.assertEqual(count, 10)
@@ -0,0 +1,151 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+
+import os
+import posixpath
+import shutil
+import tempfile
+from unittest import mock
+
+from share import serving
+from share.hotcache import HotFileCache
+from share.serving import (
+    parse_range_header,
+    serve_file
+)
+
+
+class RangeHeaderTests(TestCase):
+
+    def test_share_serving_parse_range(self):
+        """Asserts ranges are parsed, clipped, sorted and merged"""
+
+        self.assertEqual(parse_range_header('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_range_header('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=50-500', 100), [(50, 99)])
+        self.assertEqual(
+            parse_range_header('bytes=50-60, 0-9, 5-20', 100),
+            [(0, 20), (50, 60)]
+        )
+
+    def test_share_serving_parse_range_unsatisfiable(self):
+        """Asserts ranges beyond the end of the file are dropped"""
+
+        self.assertEqual(parse_range_header('bytes=100-', 100), [])
+        self.assertEqual(parse_range_header('bytes=-0', 100), [])
+
+    def test_share_serving_parse_range_invalid(self):
+        """Asserts invalid headers are ignored"""
+
+        self.assertIsNone(parse_range_header('items=0-9', 100))
+        self.assertIsNone(parse_range_header('bytes=9-0', 100))
+        self.assertIsNone(parse_range_header('bytes=a-b', 100))
+        self.assertIsNone(parse_range_header('bytes=-', 100))
+
+
+class ServeFileTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fname = posixpath.join(self.root, 'test_file')
+        self.content = bytes(range(256)) * 4
+        with open(self.fname, 'wb') as f:
+            f.write(self.content)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def serve(self, **headers):
+        request = self.factory.get('/', **headers)
+        response = serve_file(request, self.fname, 'application/test')
+        content = b''.join(getattr(response, 'streaming_content', []))
+        response.close()
+        return response, content
+
+    def test_share_serving_whole_file(self):
+        response, content = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.content)
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+
+    def test_share_serving_hot_file(self):
+        """Hot file cache is enabled, the file must only be read once"""
+
+        cache = HotFileCache(posixpath.join(self.root, 'cache'), 10000, 5000)
+        with mock.patch.object(serving, 'hot_file_cache', cache):
+            response = self.serve()[0]
+            self.assertEqual(response.content, self.content)
+            with mock.patch('builtins.open') as open_mock:
+                response = self.serve()[0]
+                self.assertFalse(open_mock.called)
+            self.assertEqual(response.content, self.content)
+            self.assertEqual(response['Content-Length'], '1024')
+
+            response = self.serve(HTTP_RANGE='bytes=100-199')[0]
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.content, self.content[100:200])
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_share_serving_single_range(self):
+        response, content = self.serve(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.content[100:200])
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(response['Content-Length'], '100')
+
+    def test_share_serving_multipart_ranges(self):
+        response, content = self.serve(HTTP_RANGE='bytes=0-9,-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(
+            response['Content-Type'].startswith('multipart/byteranges')
+        )
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertIn(
+            b'Content-Range: bytes 0-9/1024\r\n\r\n' + self.content[:10],
+            content
+        )
+        self.assertIn(
+            b'Content-Range: bytes 1014-1023/1024\r\n\r\n' +
+            self.content[-10:],
+            content
+        )
+
+    def test_share_serving_unsatisfiable_range(self):
+        response, content = self.serve(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_share_serving_if_none_match(self):
+        response, content = self.serve()
+        response, content = self.serve(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(content, b'')
+
+    def test_share_serving_if_modified_since(self):
+        mtime = os.stat(self.fname).st_mtime
+        response, content = self.serve(HTTP_IF_MODIFIED_SINCE=http_date(mtime))
+        self.assertEqual(response.status_code, 304)
+        response, content = self.serve(
+            HTTP_IF_MODIFIED_SINCE=http_date(mtime - 10)
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_share_serving_if_range_modified(self):
+        """Asserts the whole file is sent if it changed since the first
+        part was downloaded"""
+
+        response, content = self.serve(
+            HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.content)
+        response, content = self.serve(
+            HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=response['ETag']
+        )
+        self.assertEqual(response.status_code, 206)
@@ -19,4 +19,11 @@ class SettingsTests(SettingsTestsBase):
         # Path should be written POSIX style to avoid display issues
         path_posix = posixpath.normpath(settings.SHARE_ROOT)
         self.assertTrue(settings.SHARE_ROOT == path_posix)
-        
\ No newline at end of file
+
+    def test_share_setting_download_backend(self):
+        from share import settings
+        
+        self.assertIn(
+            settings.SHARE_DOWNLOAD_BACKEND,
+            ('python', 'apache', 'nginx', 'lighttpd', 'async')
+        )
@@ -0,0 +1,34 @@
+from django.test import TestCase
+
+import posixpath
+import shutil
+import tempfile
+
+from share.streaming import iter_batches, iter_rows
+from share.utils import FileSystemNode
+
+
+class StreamingTests(TestCase):
+
+    def test_share_streaming_batches(self):
+        self.assertEqual(
+            list(iter_batches(range(5), 2)), [[0, 1], [2, 3], [4]]
+        )
+        self.assertEqual(list(iter_batches([], 2)), [])
+
+    def test_share_streaming_rows(self):
+        """Asserts rows are produced by batch, as the directory is read"""
+
+        root = tempfile.mkdtemp()
+        try:
+            for i in range(250):
+                with open(posixpath.join(root, 'file_{0}'.format(i)), 'w'):
+                    pass
+            rows = iter_rows(FileSystemNode(root))
+            first = next(rows)
+            self.assertEqual(first.count('<li'), 100)
+            self.assertEqual(
+                sum(batch.count('<li') for batch in rows), 150
+            )
+        finally:
+            shutil.rmtree(root)
@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+from unittest import mock
+
+from share.settings import SHARE_ROOT
+from share.templatetags.share_navigation import set_share_navigation
+
+
+class ShareNavigationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.dirname = posixpath.join(SHARE_ROOT, 'test_dir_nav')
+        os.makedirs(self.dirname)
+        self.addCleanup(shutil.rmtree, self.dirname)
+
+    def get_labels(self, nodes):
+        return [node.label for node in nodes]
+
+    def test_share_navigation_active(self):
+        """Asserts the current directory is the active node"""
+
+        url = reverse('share:browse', args=('test_dir_nav/',))
+        nodes = set_share_navigation({}, url + 'test_file')
+        active = [node.label for node in nodes if node.active]
+        self.assertEqual(active, ['test_dir_nav'])
+
+    def test_share_navigation_cached(self):
+        """Asserts the root is not listed again while unmodified"""
+
+        nodes = set_share_navigation({}, '/')
+        with mock.patch('share.utils.scan_dir') as scan_dir:
+            cached_nodes = set_share_navigation({}, '/')
+            self.assertFalse(scan_dir.called)
+        self.assertEqual(self.get_labels(cached_nodes), self.get_labels(nodes))
+
+    def test_share_navigation_root_modified(self):
+        """Asserts a directory added to the root invalidates the cache"""
+
+        set_share_navigation({}, '/')
+        dirname = posixpath.join(SHARE_ROOT, 'test_dir_nav_2')
+        os.makedirs(dirname)
+        self.addCleanup(os.rmdir, dirname)
+        nodes = set_share_navigation({}, '/')
+        self.assertIn('test_dir_nav_2', self.get_labels(nodes))
@@ -0,0 +1,104 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import tempfile
+from unittest import mock
+
+from PIL import Image
+
+from share.thumbnails import ThumbnailCache
+
+
+class ThumbnailCacheTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_root = tempfile.mkdtemp()
+        self.fname = posixpath.join(self.root, 'test_image.png')
+        self.write_image(self.fname, (400, 200))
+        self.cache = self.create_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache_root)
+
+    def create_cache(self, max_size=10 ** 6):
+        return ThumbnailCache(
+            self.cache_root, max_size=max_size, thumbnail_size=50
+        )
+
+    def write_image(self, path, size):
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(path)
+
+    def test_share_thumbnails_generated(self):
+        """Asserts thumbnails are JPEG images fitting the thumbnail size"""
+
+        thumbnail = Image.open(self.cache.get(self.fname))
+        self.assertEqual(thumbnail.format, 'JPEG')
+        self.assertEqual(thumbnail.size, (50, 25))
+
+    def test_share_thumbnails_cached(self):
+        """Asserts images are only read once, even by another instance"""
+
+        path = self.cache.get(self.fname)
+        with mock.patch.object(ThumbnailCache, 'generate') as generate:
+            self.assertEqual(self.create_cache().get(self.fname), path)
+            self.assertFalse(generate.called)
+
+    def test_share_thumbnails_modified_image(self):
+        """Asserts a modified image gets a new thumbnail"""
+
+        path = self.cache.get(self.fname)
+        self.write_image(self.fname, (200, 400))
+        os.utime(self.fname, ns=(0, 10 ** 9))
+        new_path = self.cache.get(self.fname)
+        self.assertNotEqual(new_path, path)
+        self.assertEqual(Image.open(new_path).size, (25, 50))
+
+    def test_share_thumbnails_unreadable_image(self):
+        """Asserts unreadable images are only read once"""
+
+        fname = posixpath.join(self.root, 'test_invalid.png')
+        with open(fname, 'w') as f:
+            f.write('not an image')
+        self.assertIsNone(self.cache.get(fname))
+        with mock.patch.object(ThumbnailCache, 'generate') as generate:
+            self.assertIsNone(self.cache.get(fname))
+            self.assertFalse(generate.called)
+
+    @mock.patch('share.storage.TRIM_INTERVAL', 1)
+    def test_share_thumbnails_bounded(self):
+        """Asserts the least recently used thumbnails are evicted"""
+
+        paths = []
+        for i in range(3):
+            fname = posixpath.join(self.root, 'test_image_{0}.png'.format(i))
+            self.write_image(fname, (100, 100))
+            paths.append(self.create_cache().get(fname))
+        max_size = sum(os.path.getsize(path) for path in paths[1:])
+
+        cache = self.create_cache(max_size=max_size)
+        cache.get(self.fname)
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    def test_share_thumbnails_generate_dir(self):
+        """Asserts thumbnails of all the images of a directory are
+        generated"""
+
+        subdirname = posixpath.join(self.root, 'test_dir')
+        os.mkdir(subdirname)
+        fname = posixpath.join(subdirname, 'test_image.gif')
+        self.write_image(fname, (10, 10))
+        with open(posixpath.join(self.root, 'test_file.txt'), 'w') as f:
+            f.write('test content')
+
+        with mock.patch.object(ThumbnailCache, 'get') as get:
+            self.cache.generate_dir(self.root)
+            get.assert_called_once_with(self.fname)
+        with mock.patch.object(ThumbnailCache, 'get') as get:
+            self.cache.generate_dir(self.root, recursive=True)
+            self.assertEqual(get.call_count, 2)
@@ -0,0 +1,227 @@
+from django.test import TestCase
+
+import errno
+import hashlib
+import os
+import posixpath
+import shutil
+import tempfile
+from unittest import mock
+
+from share.uploads import (
+    CONFLICT,
+    InvalidUpload,
+    UploadClosed,
+    UploadConflict,
+    UploadStore,
+    preallocate
+)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadStoreTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dirname = posixpath.join(self.root, 'share')
+        os.makedirs(self.dirname)
+        self.store = UploadStore(
+            posixpath.join(self.root, 'uploads.sqlite3'),
+            posixpath.join(self.root, 'uploads'),
+            chunk_size=10
+        )
+        self.data = os.urandom(25)
+        self.chunks = [self.data[i:i + 10] for i in range(0, 25, 10)]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_share_uploads_start(self):
+        """Checks an upload gets a temporary file of the full size"""
+
+        upload = self.store.start(1, self.dirname, 'test_file_é', 25)
+        self.assertEqual(
+            upload.path, posixpath.join(self.dirname, 'test_file_é')
+        )
+        self.assertEqual(upload.chunks, 3)
+        self.assertEqual(upload.get_chunk_length(2), 5)
+        self.assertEqual(upload.received, {})
+        temp_path = self.store.get_temp_path(upload.id)
+        self.assertEqual(os.path.getsize(temp_path), 25)
+        self.assertEqual(self.store.get(upload.id, 1), upload)
+        # Uploads belong to their user
+        self.assertIsNone(self.store.get(upload.id, 2))
+
+    def test_share_uploads_invalid(self):
+        for name in ('', '.', '..', 'a/b', 'a\\b', 'x' * 256):
+            with self.assertRaises(InvalidUpload):
+                self.store.start(1, self.dirname, name, 25)
+        with self.assertRaises(InvalidUpload):
+            self.store.start(1, self.dirname, 'test_file', -1)
+        open(posixpath.join(self.dirname, 'test_file'), 'w').close()
+        with self.assertRaises(UploadConflict):
+            self.store.start(1, self.dirname, 'test_file', 25)
+
+    def test_share_uploads_chunks_out_of_order(self):
+        """Chunks sent in any order make up the file once all received"""
+
+        upload = self.store.start(1, self.dirname, 'test_file', 25)
+        for index in (2, 0):
+            path = self.store.write_chunk(
+                upload, index, self.chunks[index], sha256(self.chunks[index])
+            )
+            self.assertIsNone(path)
+        self.assertFalse(os.path.exists(upload.path))
+
+        path = self.store.write_chunk(
+            upload, 1, self.chunks[1], sha256(self.chunks[1])
+        )
+        self.assertEqual(path, upload.path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        self.assertFalse(os.path.exists(self.store.get_temp_path(upload.id)))
+        self.assertIsNone(self.store.get(upload.id, 1))
+
+    def test_share_uploads_resume(self):
+        """Declaring an interrupted upload again resumes it"""
+
+        upload = self.store.start(1, self.dirname, 'test_file', 25)
+        self.store.write_chunk(
+            upload, 1, self.chunks[1], sha256(self.chunks[1])
+        )
+
+        resumed = self.store.start(1, self.dirname, 'test_file', 25)
+        self.assertEqual(resumed.id, upload.id)
+        self.assertEqual(resumed.received, {1: sha256(self.chunks[1])})
+        # Another user, or another size, is another upload
+        self.assertNotEqual(
+            self.store.start(2, self.dirname, 'test_file', 25).id, upload.id
+        )
+        self.assertNotEqual(
+            self.store.start(1, self.dirname, 'test_file', 26).id, upload.id
+        )
+
+        # Temporary file lost: the upload starts over
+        os.remove(self.store.get_temp_path(upload.id))
+        restarted = self.store.start(1, self.dirname, 'test_file', 25)
+        self.assertNotEqual(restarted.id, upload.id)
+        self.assertEqual(restarted.received, {})
+
+    def test_share_uploads_invalid_chunk(self):
+        upload = self.store.start(1, self.dirname, 'test_file', 25)
+        with self.assertRaises(InvalidUpload):
+            self.store.write_chunk(upload, 0, self.chunks[0], sha256(b'x'))
+        with self.assertRaises(InvalidUpload):
+            self.store.write_chunk(
+                upload, 0, self.chunks[2], sha256(self.chunks[2])
+            )
+        with self.assertRaises(InvalidUpload):
+            self.store.write_chunk(
+                upload, 3, self.chunks[2], sha256(self.chunks[2])
+            )
+        self.assertEqual(self.store.get(upload.id, 1).received, {})
+
+    def test_share_uploads_empty_file(self):
+        upload = self.store.start(1, self.dirname, 'test_file', 0)
+        path = self.store.write_chunk(upload, 0, b'', sha256(b''))
+        self.assertEqual(os.path.getsize(path), 0)
+
+    def test_share_uploads_conflict_on_completion(self):
+        """A file created meanwhile is never replaced"""
+
+        upload = self.store.start(1, self.dirname, 'test_file', 5)
+        with open(upload.path, 'w') as f:
+            f.write('other')
+        with self.assertRaises(UploadConflict):
+            self.store.write_chunk(upload, 0, b'12345', sha256(b'12345'))
+        with open(upload.path) as f:
+            self.assertEqual(f.read(), 'other')
+
+        # Kept until another name is given
+        upload = self.store.get(upload.id, 1)
+        self.assertEqual(upload.state, CONFLICT)
+        with self.assertRaises(UploadClosed):
+            self.store.write_chunk(upload, 0, b'12345', sha256(b'12345'))
+        with self.assertRaises(UploadConflict):
+            self.store.rename(upload, 'test_file')
+        with self.assertRaises(InvalidUpload):
+            self.store.rename(upload, '../test_file_2')
+        path = self.store.rename(upload, 'test_file_2')
+        self.assertEqual(path, posixpath.join(self.dirname, 'test_file_2'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'12345')
+        self.assertFalse(os.path.exists(self.store.get_temp_path(upload.id)))
+        self.assertIsNone(self.store.get(upload.id, 1))
+
+    def test_share_uploads_last_chunk_again(self):
+        """A chunk sent again once the upload is complete is refused"""
+
+        upload = self.store.start(1, self.dirname, 'test_file', 5)
+        self.store.write_chunk(upload, 0, b'12345', sha256(b'12345'))
+        with self.assertRaises(UploadClosed):
+            self.store.write_chunk(upload, 0, b'12345', sha256(b'12345'))
+        with open(upload.path, 'rb') as f:
+            self.assertEqual(f.read(), b'12345')
+
+        # Completed by another request once the upload was looked up
+        upload = self.store.start(1, self.dirname, 'test_file_2', 5)
+        os.remove(self.store.get_temp_path(upload.id))
+        with self.assertRaises(UploadClosed):
+            self.store.write_chunk(upload, 0, b'12345', sha256(b'12345'))
+
+    def test_share_uploads_other_filesystem(self):
+        """Checks files are copied when they can't be linked into place"""
+
+        upload = self.store.start(1, self.dirname, 'test_file', 5)
+        real_link = os.link
+
+        def link(source, target):
+            if source == self.store.get_temp_path(upload.id):
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            return real_link(source, target)
+
+        with mock.patch('os.link', link):
+            path = self.store.write_chunk(
+                upload, 0, b'12345', sha256(b'12345')
+            )
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'12345')
+        self.assertEqual(os.listdir(self.dirname), ['test_file'])
+
+    def test_share_uploads_cancel_and_purge(self):
+        upload = self.store.start(1, self.dirname, 'test_file', 25)
+        self.store.cancel(upload.id)
+        self.assertIsNone(self.store.get(upload.id, 1))
+        self.assertFalse(os.path.exists(self.store.get_temp_path(upload.id)))
+
+        upload = self.store.start(1, self.dirname, 'test_file', 25)
+        self.store.purge(max_age=-1)
+        self.assertIsNone(self.store.get(upload.id, 1))
+
+        # Temporary files of forgotten uploads
+        upload = self.store.start(1, self.dirname, 'test_file', 25)
+        self.store.connection.execute('DELETE FROM uploads')
+        self.store.purge()
+        self.assertTrue(os.path.exists(self.store.get_temp_path(upload.id)))
+        self.store.purge(max_age=-1)
+        self.assertFalse(os.path.exists(self.store.get_temp_path(upload.id)))
+
+    def test_share_uploads_preallocate_fallback(self):
+        """Filesystems without fallocate get a sparse file"""
+
+        path = posixpath.join(self.root, 'test_file')
+        with open(path, 'wb') as f, mock.patch(
+                'os.posix_fallocate',
+                side_effect=OSError(errno.EOPNOTSUPP, 'Not supported')):
+            preallocate(f.fileno(), 1000)
+        self.assertEqual(os.path.getsize(path), 1000)
+
+        with open(path, 'wb') as f, mock.patch(
+                'os.posix_fallocate',
+                side_effect=OSError(errno.ENOSPC, 'No space left')):
+            with self.assertRaises(OSError):
+                preallocate(f.fileno(), 1000)
@@ -5,15 +5,30 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.utils.http import urlquote
 
+import hashlib
+import io
+import json
 import os.path
 import posixpath
+import shutil
+import zipfile
 from unittest import mock
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from PIL import Image
 
 from share.utils import (
     FileSystemNode,
+    PathResolver,
     get_physical_path
 )
+from share import settings
+from share.checksums import checksum_cache
+from share.index import share_index
+from share.links import check_link
+from share.uploads import upload_store
 from share.settings import SHARE_ROOT
+from share.tests.common import count_syscalls
 
 
 class BaseTestCase(TestCase):
@@ -92,6 +107,72 @@ class UtilsTests(BaseTestCase):
         )
         self.assertEqual(filepath, expected_path)
     
+    def test_share_helpers_get_physical_path_traversal(self):
+        """Asserts paths can't go above the shared dir"""
+        
+        for path in ('../test_dir/test_file', '/../../test_dir/test_file',
+                     'test_dir/../../test_dir/./test_file'):
+            self.assertEqual(
+                get_physical_path(path),
+                posixpath.join(SHARE_ROOT, 'test_dir/test_file')
+            )
+        self.assertEqual(get_physical_path('../..'), SHARE_ROOT)
+    
+    def test_share_helpers_path_resolver_cache(self):
+        """Checks a resolved path costs a single stat call, until its parent
+        directory changes"""
+        
+        resolver = PathResolver()
+        filepath = posixpath.join(SHARE_ROOT, 'test_dir/test_file')
+        self.assertEqual(
+            resolver.resolve('test_dir/test_file'), (filepath, False)
+        )
+        with count_syscalls() as counts:
+            self.assertEqual(
+                resolver.resolve('test_dir/test_file'), (filepath, False)
+            )
+        self.assertEqual(counts['stat'], 1)
+        self.assertEqual(counts['lstat'], 0)
+        
+        node = resolver.get_node('test_dir/')
+        self.assertTrue(node.isdir)
+        self.assertEqual(node.path, self.dirname)
+        self.assertEqual(node.url, 'test_dir/')
+        
+        # Removed, then replaced by a directory
+        os.remove(self.fname)
+        try:
+            self.assertEqual(
+                resolver.resolve('test_dir/test_file'), (None, None)
+            )
+            os.makedirs(self.fname)
+            self.assertEqual(
+                resolver.resolve('test_dir/test_file'), (filepath, True)
+            )
+        finally:
+            if os.path.isdir(self.fname):
+                os.rmdir(self.fname)
+            with open(self.fname, 'w') as f:
+                f.write('test content')
+    
+    def test_share_helpers_path_resolver_symlink(self):
+        """Checks symbolic links are resolved again every time"""
+        
+        resolver = PathResolver()
+        link = posixpath.join(self.dirname_empty, 'test_link')
+        os.symlink(self.fname, link)
+        try:
+            self.assertEqual(
+                resolver.resolve('test_dir_empty/test_link'), (link, False)
+            )
+            os.remove(link)
+            os.symlink(self.dirname, link)
+            self.assertEqual(
+                resolver.resolve('test_dir_empty/test_link'), (link, True)
+            )
+        finally:
+            os.remove(link)
+    
     def test_share_helpers_filesystemnode_no_children(self):
         """Checks FileSystemNode() returns an empty node if the given path
         matches an empty directory"""
@@ -138,6 +219,55 @@ class UtilsTests(BaseTestCase):
         self.assertFalse(node.isdir)
         self.assertTrue(node.isfile)
         self.assertEqual(node.children, [])
+    
+    def test_share_helpers_filesystemnode_syscalls(self):
+        """Checks listing a directory with sizes costs a single stat call per
+        entry once sub directories sizes are indexed, and none without"""
+        
+        dirname = posixpath.join(SHARE_ROOT, 'test_dir_large')
+        for i in range(20):
+            os.makedirs(posixpath.join(dirname, 'dir_{0}'.format(i)))
+        for i in range(200):
+            with open(posixpath.join(dirname, 'file_{0}'.format(i)), 'w'):
+                pass
+        self.addCleanup(shutil.rmtree, dirname)
+        [child.size for child in FileSystemNode(dirname).children]
+        
+        with count_syscalls() as counts:
+            node = FileSystemNode(dirname)
+            [(child.name, child.url) for child in node.children]
+        self.assertEqual(len(node.children), 220)
+        self.assertEqual(counts['scandir'], 1)
+        self.assertEqual(counts['listdir'], 0)
+        self.assertEqual(counts['lstat'], 0)
+        # Only for the directory itself
+        self.assertEqual(counts['stat'], 1)
+        
+        with count_syscalls() as counts:
+            node = FileSystemNode(dirname)
+            [child.size for child in node.children]
+        self.assertEqual(counts['scandir'], 1)
+        # One for the directory itself, one per child
+        self.assertEqual(counts['stat'], 221)
+    
+    def test_share_helpers_filesystemnode_slots(self):
+        """Checks nodes are compact and only compute attributes once"""
+        
+        node = FileSystemNode(self.dirname)
+        self.assertFalse(hasattr(node, '__dict__'))
+        children = node.children
+        with mock.patch('share.utils.scan_dir') as scan_dir:
+            self.assertIs(node.children, children)
+            self.assertFalse(scan_dir.called)
+    
+    @mock.patch('share.mime.detect_mime_type', return_value='text/plain')
+    def test_share_helpers_filesystemnode_lazy_mime_type(self, detect):
+        """Checks listing a directory does not detect its files MIME types"""
+        
+        node = FileSystemNode(self.dirname)
+        self.assertFalse(detect.called)
+        self.assertIsNotNone(node.children[0].mime_type)
+        self.assertTrue(detect.called)
 
 
 class ViewsTests(BaseTestCase):
@@ -332,3 +462,612 @@ class ViewsTests(BaseTestCase):
         self.assertIsNotNone(response['Content-Type'])
         self.assertFalse(response['Content-Type'].startswith('text/html'))
         self.assertEqual(response['X-SendFile'], urlquote(self.fname_accent))
+    
+    def test_share_views_archive(self):
+        """Path is a valid dir, the response must be a ZIP archive of it"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        
+        response = self.client.get(
+            reverse('share:archive', args=('test_dir_é/',))
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content))
+        )
+        self.assertEqual(
+            archive.read('test_dir_é/test_file_é'), b'test content'
+        )
+    
+    def test_share_views_archive_anonymous_user(self):
+        """User is anonymous, the response must be a redirect to the login
+        page"""
+        
+        response = self.client.get(
+            reverse('share:archive', args=('test_dir/',))
+        )
+        self.assertRedirects(
+            response,
+            '{0}?next={1}'.format(
+                reverse('accounts:login'),
+                reverse('share:archive', args=('test_dir/',))
+            )
+        )
+    
+    def test_share_views_list(self):
+        """Path is a valid dir, the response must be a JSON page of its
+        children, with the cursor of the next page"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        
+        url = reverse('share:list', args=('',))
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(
+            [entry['name'] for entry in data['entries']],
+            ['test_dir', 'test_dir_empty']
+        )
+        self.assertEqual(
+            data['entries'][0]['url'],
+            reverse('share:browse', args=('test_dir/',))
+        )
+        self.assertEqual(data['entries'][0]['size'], 12)
+        self.assertTrue(data['entries'][0]['isdir'])
+        
+        response = self.client.get(url, {'limit': 2, 'cursor': data['next']})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(
+            [entry['name'] for entry in data['entries']], ['test_dir_é']
+        )
+        self.assertIsNone(data['next'])
+    
+    def test_share_views_list_invalid_query(self):
+        """Query is invalid, the response must be an HTTP 400 code"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        
+        response = self.client.get(
+            reverse('share:list', args=('',)), {'sort': 'invalid'}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse('share:list', args=('test_dir/test_file',))
+        )
+        self.assertEqual(response.status_code, 404)
+    
+    def test_share_views_browse_next_page(self):
+        """Directory has more children than a page, the next ones must be
+        linked"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        
+        response = self.client.get(
+            reverse('share:browse', args=('',)), {'limit': 2}
+        )
+        self.assertEqual(len(response.context['children']), 2)
+        self.assertContains(response, 'share-more')
+        response = self.client.get(
+            reverse('share:browse', args=('',)) + '?' +
+            response.context['next_query']
+        )
+        self.assertEqual(
+            [child.name for child in response.context['children']],
+            ['test_dir_é']
+        )
+        self.assertIsNone(response.context['next_query'])
+    
+    def test_share_views_browse_stream(self):
+        """Streaming is asked for, the response must send the page header
+        first, then all the children"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        
+        response = self.client.get(
+            reverse('share:browse', args=('',)), {'stream': 1, 'limit': 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = [
+            chunk.decode('utf-8') for chunk in response.streaming_content
+        ]
+        self.assertIn('<h1>/</h1>', chunks[0])
+        self.assertNotIn('share-name', chunks[0])
+        content = ''.join(chunks)
+        for name in ('test_dir', 'test_dir_é', 'test_dir_empty'):
+            self.assertIn(
+                '<span class="share-name">{0}</span>'.format(name), content
+            )
+        self.assertNotIn('share-rows-', content)
+        self.assertNotIn('share-more', content)
+        self.assertTrue(content.rstrip().endswith('</html>'))
+    
+    def test_share_views_browse_not_modified(self):
+        """Listing is unchanged, the response must be a 304 built without
+        reading the directory"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        url = reverse('share:browse', args=('test_dir/',))
+        
+        # Not validated unless a watcher keeps the index up to date
+        response = self.client.get(url)
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+        
+        share_index.update()
+        share_index.heartbeat()
+        share_index._live_checked_at = None
+        try:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            
+            with mock.patch('share.views.path_resolver.get_node') as get_node:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(get_node.called)
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('private', response['Cache-Control'])
+            
+            # The JSON listing has its own
+            response = self.client.get(
+                reverse('share:list', args=('test_dir/',)),
+                HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 200)
+            
+            with open(self.fname, 'w') as f:
+                f.write('modified content')
+            share_index.apply_change(self.fname)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+        finally:
+            share_index.stop_heartbeat()
+            share_index._live_checked_at = None
+    
+    def test_share_views_browse_unauthorized_no_store(self):
+        """User may not browse, the response must not be stored"""
+        
+        self.create_unauthorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest2', password='unittest2')
+        )
+        response = self.client.get(reverse('share:browse', args=('',)))
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('private', response['Cache-Control'])
+    
+    def test_share_views_browse_archive(self):
+        """Path is below an archive, the response must list or send its
+        members"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        path = posixpath.join(self.dirname, 'test.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('sub/test_member', b'member content')
+        try:
+            response = self.client.get(
+                reverse('share:browse', args=('test_dir/',))
+            )
+            self.assertContains(
+                response,
+                'href="{0}"'.format(
+                    reverse('share:browse', args=('test_dir/test.zip/',))
+                )
+            )
+            
+            response = self.client.get(
+                reverse('share:browse', args=('test_dir/test.zip/',))
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [child.name for child in response.context['children']],
+                ['sub']
+            )
+            self.assertNotContains(response, 'share-checksums')
+            
+            response = self.client.get(
+                reverse('share:browse', args=('test_dir/test.zip/sub',))
+            )
+            self.assertRedirects(
+                response,
+                reverse('share:browse', args=('test_dir/test.zip/sub/',)),
+                status_code=301
+            )
+            
+            response = self.client.get(reverse(
+                'share:list', args=('test_dir/test.zip/sub/',)
+            ))
+            entries = json.loads(response.content.decode('utf-8'))['entries']
+            self.assertEqual(
+                [(entry['name'], entry['size']) for entry in entries],
+                [('test_member', 14)]
+            )
+            
+            response = self.client.get(entries[0]['url'])
+            self.assertEqual(
+                b''.join(response.streaming_content), b'member content'
+            )
+            
+            # The archive itself is still downloaded
+            response = self.client.get(
+                reverse('share:browse', args=('test_dir/test.zip',))
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('test.zip', response['Content-Disposition'])
+        finally:
+            os.remove(path)
+    
+    def test_share_views_search(self):
+        """Query matches indexed names, the response must list them"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        share_index.update()
+        
+        response = self.client.get(
+            reverse('share:search', args=('',)), {'q': 'FILE_é'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result.url for result in response.context['results']],
+            ['test_dir_é/test_file_é']
+        )
+        self.assertFalse(response.context['truncated'])
+        
+        response = self.client.get(
+            reverse('share:search', args=('test_dir/',)),
+            {'q': 'test_', 'prefix': '1'}
+        )
+        self.assertEqual(
+            [result.url for result in response.context['results']],
+            ['test_dir/test_file']
+        )
+    
+    def test_share_views_thumbnail(self):
+        """Path is an image, the response must be its thumbnail"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        fname = posixpath.join(self.dirname, 'test_image.png')
+        Image.new('RGB', (400, 400)).save(fname)
+        try:
+            response = self.client.get(
+                reverse('share:thumbnail', args=('test_dir/test_image.png',))
+            )
+        finally:
+            os.remove(fname)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        thumbnail = Image.open(
+            io.BytesIO(b''.join(response.streaming_content))
+        )
+        self.assertLessEqual(max(thumbnail.size), 400)
+        
+        response = self.client.get(
+            reverse('share:thumbnail', args=('test_dir/test_file',))
+        )
+        self.assertEqual(response.status_code, 404)
+    
+    def test_share_views_thumbnail_anonymous_user(self):
+        """User is anonymous, the response must be a redirect to the login
+        page, not kept by the browser"""
+        
+        response = self.client.get(
+            reverse('share:thumbnail', args=('test_dir/test_image.png',))
+        )
+        self.assertRedirects(
+            response,
+            '{0}?next={1}'.format(
+                reverse('accounts:login'),
+                reverse('share:thumbnail', args=('test_dir/test_image.png',))
+            )
+        )
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('max-age', response['Cache-Control'])
+    
+    @mock.patch('share.views.pregenerate')
+    def test_share_views_browse_grid(self, pregenerate):
+        """Grid view is asked, images must be shown as thumbnails"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        fname = posixpath.join(self.dirname, 'test_image.png')
+        Image.new('RGB', (10, 10)).save(fname)
+        try:
+            response = self.client.get(
+                reverse('share:browse', args=('test_dir/',)), {'view': 'grid'}
+            )
+        finally:
+            os.remove(fname)
+        pregenerate.assert_called_once_with(self.dirname)
+        self.assertContains(
+            response,
+            reverse('share:thumbnail', args=('test_dir/test_image.png',))
+        )
+        self.assertEqual(response.content.count(b'share-thumbnail'), 1)
+    
+    def test_share_views_changes(self):
+        """Path is a directory, the response must list its entries, then
+        nothing until they change"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        share_index.update()
+        url = reverse('share:changes', args=('test_dir_é/',))
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertTrue(data['reset'])
+        self.assertFalse(data['more'])
+        self.assertEqual(data['changes'], [{
+            'path': 'test_dir_é/test_file_é',
+            'deleted': False,
+            'url': reverse('share:browse', args=('test_dir_é/test_file_é',)),
+            'isdir': False,
+            'size': 12,
+            'mtime': os.stat(self.fname_accent).st_mtime_ns // 10 ** 6
+        }])
+        
+        response = self.client.get(url, {'token': data['token']})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['changes'], [])
+        
+        response = self.client.get(url, {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse('share:changes', args=('test_dir_é/test_file_é',))
+        )
+        self.assertEqual(response.status_code, 404)
+    
+    def test_share_views_link(self):
+        """Path is a file, the response must hold a valid download link"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        url = reverse('share:link', args=('test_dir_é/test_file_é',))
+        
+        response = self.client.get(url, {'age': 60})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        link = urlsplit(data['url'])
+        self.assertEqual(
+            unquote(link.path),
+            settings.SHARE_LINK_URL + 'test_dir_é/test_file_é'
+        )
+        query = parse_qs(link.query)
+        self.assertEqual(query['expires'], [str(data['expires'])])
+        check_link(
+            'test_dir_é/test_file_é', query['expires'][0],
+            query['signature'][0]
+        )
+        
+        for age in (0, 'x', settings.SHARE_LINK_MAX_AGE + 1):
+            response = self.client.get(url, {'age': age})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('share:link', args=('test_dir/',)))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_share_views_checksums(self):
+        """Checksums are enabled, the response must list them once
+        computed"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        url = reverse('share:checksums', args=('test_dir/',))
+        
+        with mock.patch.object(settings, 'SHARE_CHECKSUMS', False):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        
+        with mock.patch.object(settings, 'SHARE_CHECKSUMS', True):
+            response = self.client.get(url)
+            if response.status_code == 202:
+                checksum_cache.wait()
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content.decode('utf-8'),
+            '{0}  test_file\n'.format(
+                hashlib.sha256(b'test content').hexdigest()
+            )
+        )
+    
+    def test_share_views_upload(self):
+        """User may upload, the chunks sent must make up the file"""
+        
+        self.create_authorized_user()
+        User = get_user_model()
+        User.objects.get(username='unittest1').user_permissions.add(
+            Permission.objects.get(codename='can_upload')
+        )
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        self.assertIn(
+            b'share-upload',
+            self.client.get(reverse('share:browse', args=('',))).content
+        )
+        
+        data = os.urandom(upload_store.chunk_size + 10)
+        response = self.client.post(
+            reverse('share:upload', args=('test_dir_é/',)),
+            {'name': 'test_upload_é', 'size': len(data)}
+        )
+        self.assertEqual(response.status_code, 200)
+        state = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(state['chunks'], 2)
+        self.assertEqual(state['received'], {})
+        path = posixpath.join(self.dirname_accent, 'test_upload_é')
+        try:
+            chunk = data[upload_store.chunk_size:]
+            response = self.client.put(
+                state['url'] + '/1', chunk,
+                content_type='application/octet-stream',
+                HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest()
+            )
+            self.assertEqual(
+                json.loads(response.content.decode('utf-8')),
+                {'complete': False, 'url': None}
+            )
+            
+            # Resumed with the chunk already received
+            response = self.client.get(state['url'])
+            self.assertEqual(
+                json.loads(response.content.decode('utf-8'))['received'],
+                {'1': hashlib.sha256(chunk).hexdigest()}
+            )
+            
+            chunk = data[:upload_store.chunk_size]
+            response = self.client.put(
+                state['url'] + '/0', chunk,
+                content_type='application/octet-stream',
+                HTTP_X_CHUNK_SHA256='0' * 64
+            )
+            self.assertEqual(response.status_code, 400)
+            response = self.client.put(
+                state['url'] + '/0', chunk,
+                content_type='application/octet-stream',
+                HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest()
+            )
+            self.assertEqual(
+                json.loads(response.content.decode('utf-8')),
+                {
+                    'complete': True,
+                    'url': reverse(
+                        'share:browse', args=('test_dir_é/test_upload_é',)
+                    )
+                }
+            )
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(self.client.get(state['url']).status_code, 404)
+            
+            # The last chunk sent again
+            response = self.client.put(
+                state['url'] + '/0', chunk,
+                content_type='application/octet-stream',
+                HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest()
+            )
+            self.assertEqual(response.status_code, 404)
+            
+            # The file can't be uploaded again
+            response = self.client.post(
+                reverse('share:upload', args=('test_dir_é/',)),
+                {'name': 'test_upload_é', 'size': len(data)}
+            )
+            self.assertEqual(response.status_code, 409)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def test_share_views_upload_conflict(self):
+        """The file name was taken during the upload, the file must be
+        moved into place under the name posted next"""
+        
+        self.create_authorized_user()
+        User = get_user_model()
+        User.objects.get(username='unittest1').user_permissions.add(
+            Permission.objects.get(codename='can_upload')
+        )
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        
+        response = self.client.post(
+            reverse('share:upload', args=('test_dir/',)),
+            {'name': 'test_upload', 'size': 5}
+        )
+        state = json.loads(response.content.decode('utf-8'))
+        path = posixpath.join(self.dirname, 'test_upload')
+        new_path = posixpath.join(self.dirname, 'test_upload_2')
+        try:
+            with open(path, 'wb') as f:
+                f.write(b'other')
+            response = self.client.put(
+                state['url'] + '/0', b'12345',
+                content_type='application/octet-stream',
+                HTTP_X_CHUNK_SHA256=hashlib.sha256(b'12345').hexdigest()
+            )
+            self.assertEqual(response.status_code, 409)
+            response = self.client.get(state['url'])
+            self.assertTrue(
+                json.loads(response.content.decode('utf-8'))['conflict']
+            )
+            
+            response = self.client.post(state['url'], {'name': 'test_upload'})
+            self.assertEqual(response.status_code, 409)
+            response = self.client.post(
+                state['url'], {'name': 'test_upload_2'}
+            )
+            self.assertEqual(
+                json.loads(response.content.decode('utf-8')),
+                {
+                    'complete': True,
+                    'url': reverse(
+                        'share:browse', args=('test_dir/test_upload_2',)
+                    )
+                }
+            )
+            with open(new_path, 'rb') as f:
+                self.assertEqual(f.read(), b'12345')
+        finally:
+            for filepath in (path, new_path):
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+    
+    def test_share_views_upload_unauthorized_user(self):
+        """User may browse but not upload, the response must be 403"""
+        
+        self.create_authorized_user()
+        self.assertTrue(
+            self.client.login(username='unittest1', password='unittest1')
+        )
+        self.assertNotIn(
+            b'share-upload',
+            self.client.get(reverse('share:browse', args=('',))).content
+        )
+        response = self.client.post(
+            reverse('share:upload', args=('test_dir/',)),
+            {'name': 'test_upload', 'size': 10}
+        )
+        self.assertEqual(response.status_code, 403)
+
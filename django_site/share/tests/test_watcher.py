@@ -0,0 +1,70 @@
+from django.test import TestCase
+
+import os
+import posixpath
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from share.watcher import (
+    Inotify,
+    IN_CREATE,
+    IN_ISDIR,
+    ShareWatcher
+)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'requires inotify')
+class InotifyTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.inotify = Inotify()
+
+    def tearDown(self):
+        self.inotify.close()
+        shutil.rmtree(self.root)
+
+    def test_share_watcher_inotify_events(self):
+        """Asserts created files and directories are reported"""
+
+        wd = self.inotify.add_watch(self.root)
+        with open(posixpath.join(self.root, 'test_file_é'), 'w') as f:
+            f.write('test content')
+        os.mkdir(posixpath.join(self.root, 'test_dir'))
+
+        created = [
+            (name, bool(mask & IN_ISDIR))
+            for event_wd, mask, name in self.inotify.read_events(1)
+            if event_wd == wd and mask & IN_CREATE
+        ]
+        self.assertEqual(created, [('test_file_é', False), ('test_dir', True)])
+
+    def test_share_watcher_inotify_no_event(self):
+        """Asserts reading events times out when nothing happens"""
+
+        self.inotify.add_watch(self.root)
+        self.assertEqual(self.inotify.read_events(0), [])
+
+
+class ShareWatcherTests(TestCase):
+
+    def test_share_watcher_update(self):
+        """Asserts rescans only read the whole share once in a while"""
+
+        index = mock.Mock()
+        watcher = ShareWatcher(
+            index, rescan_interval=300, full_rescan_interval=3600
+        )
+        index.get_full_update_time.return_value = time.time() - 60
+        watcher.update()
+        index.update.assert_called_with(full=False, keep_alive=False)
+        index.get_full_update_time.return_value = time.time() - 7200
+        watcher.update()
+        index.update.assert_called_with(full=True, keep_alive=False)
+        index.get_full_update_time.return_value = None
+        watcher.update()
+        index.update.assert_called_with(full=True, keep_alive=False)
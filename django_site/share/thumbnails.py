@@ -0,0 +1,129 @@
+"""
+Thumbnails of the shared images.
+
+Thumbnails are generated with Pillow once per (path, mtime, size) of the
+original image, as JPEG files under SHARE_CACHE_ROOT. The disk space they use
+is bounded: the least recently served thumbnails are evicted first (see
+share.storage.DiskCache). Thumbnails of modified images are never served
+again and end up evicted the same way.
+
+Thumbnails of a whole directory can be generated ahead of time, either by a
+background thread of the web process (see pregenerate) or by the
+'generatesharethumbnails' management command.
+"""
+
+import logging
+import os
+import posixpath
+
+from django.core.urlresolvers import reverse
+
+from PIL import Image
+
+from share.mime import mime_type_cache
+from share.settings import (
+    SHARE_CACHE_ROOT,
+    SHARE_THUMBNAIL_CACHE_SIZE,
+    SHARE_THUMBNAIL_SIZE
+)
+from share.storage import DiskCache
+from share.tasks import BackgroundTasks
+
+
+logger = logging.getLogger(__name__)
+
+# Image types Pillow can read
+IMAGE_MIME_TYPES = (
+    'image/bmp', 'image/gif', 'image/jpeg', 'image/png', 'image/tiff',
+    'image/x-ms-bmp'
+)
+
+
+def is_image(mime_type):
+    return mime_type in IMAGE_MIME_TYPES
+
+
+def get_thumbnail_url(node):
+    """
+    Returns the thumbnail URL of an image node, None for other nodes and
+    members of archives. The URL changes with the image, so that browsers
+    can cache thumbnails.
+    """
+    if node.isdir or node.in_archive or not is_image(node.mime_type):
+        return None
+    return '{0}?v={1}'.format(
+        reverse('share:thumbnail', args=(node.url,)), node.mtime
+    )
+
+
+class ThumbnailCache(DiskCache):
+    """
+    Least recently used thumbnails, stored as JPEG files in a directory
+    """
+
+    suffix = '.jpg'
+
+    def __init__(self, root, max_size=SHARE_THUMBNAIL_CACHE_SIZE * 1000 ** 2,
+                 thumbnail_size=SHARE_THUMBNAIL_SIZE):
+        super().__init__(root, max_size)
+        self.thumbnail_size = thumbnail_size
+
+    def get(self, path, st=None):
+        """
+        Returns the path of the thumbnail of an image, generating it on cache
+        misses, or None if the image can't be read. The image stat result can
+        be given if already known.
+        """
+        if st is None:
+            st = os.stat(path)
+        key = self.get_key(
+            path, st.st_mtime_ns, st.st_size, self.thumbnail_size
+        )
+        cached, thumbnail_path = self.lookup(key)
+        if cached:
+            # Unreadable images are remembered as such
+            return thumbnail_path
+        return self.write(key, lambda f: self.generate(path, f))
+
+    def generate(self, path, f):
+        """
+        Writes the thumbnail of an image to a file object, returns False if
+        the image can't be read
+        """
+        try:
+            image = Image.open(path)
+            # JPEG images are decoded straight to a reduced scale
+            image.draft('RGB', (self.thumbnail_size, self.thumbnail_size))
+            image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+        except (IOError, OSError, ValueError) as e:
+            logger.info('No thumbnail for %s (%s)', path, e)
+            return False
+        image.save(f, 'JPEG', quality=85)
+
+    def generate_dir(self, path, recursive=False):
+        """Generates the missing thumbnails of the images of a directory"""
+        for dirpath, dirnames, filenames in os.walk(path):
+            mime_types = mime_type_cache.detect_dir(dirpath)
+            for name in sorted(filenames):
+                if is_image(mime_types.get(name)):
+                    self.get(posixpath.join(dirpath, name))
+            if not recursive:
+                break
+
+
+thumbnail_cache = ThumbnailCache(
+    posixpath.join(SHARE_CACHE_ROOT, 'thumbnails')
+)
+
+
+background_tasks = BackgroundTasks('thumbnails')
+
+
+def pregenerate(path):
+    """
+    Queues the generation of the thumbnails of a directory in a background
+    thread, so that they are ready when the browser asks for them
+    """
+    background_tasks.add(thumbnail_cache.generate_dir, path)
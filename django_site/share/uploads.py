@@ -0,0 +1,412 @@
+"""
+Resumable chunked uploads into the share.
+
+A client first declares the file it uploads (directory, name and size), and
+gets back an upload id, the chunk size and the chunks already received. The
+file is then sent as fixed-size chunks, in any order and possibly in
+parallel, each with its SHA-256 checksum. Chunks are written straight at
+their offset (pwrite) in a temporary file preallocated to the full size, so
+that they never wait for each other and a full disk is detected at once.
+
+Uploads are recorded in a SQLite database under SHARE_CACHE_ROOT, with the
+checksum of each chunk once it is on disk: an interrupted upload declared
+again by the same user resumes where it stopped, and the client can check
+the chunks already received against its own file before skipping them.
+
+When the last chunk is received, the temporary file is moved into place
+atomically, never replacing an existing file. If a file of the same name
+was created meanwhile, the upload is kept until the client gives another
+name (see UploadStore.rename). Abandoned uploads are removed after
+UPLOAD_EXPIRATION.
+"""
+
+from collections import namedtuple
+import errno
+import hashlib
+import os
+import posixpath
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from share.settings import (
+    SHARE_CACHE_ROOT,
+    SHARE_UPLOAD_CHUNK_SIZE,
+    SHARE_UPLOAD_TEMP_ROOT
+)
+from share.storage import SQLiteStorage
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (user_id, path, size)
+);
+CREATE INDEX IF NOT EXISTS uploads_updated_at ON uploads (updated_at);
+CREATE TABLE IF NOT EXISTS chunks (
+    upload TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (upload, idx)
+);
+"""
+
+# Seconds after which an upload without new chunk is abandoned
+UPLOAD_EXPIRATION = 7 * 24 * 3600
+
+# Permissions of the uploaded files, readable by the front web server
+FILE_MODE = 0o644
+
+# States of an upload: receiving chunks, being moved into place, or waiting
+# for another name
+RECEIVING = 'receiving'
+FINISHING = 'finishing'
+CONFLICT = 'conflict'
+
+
+class InvalidUpload(ValueError):
+    """Raised when an upload or one of its chunks is invalid"""
+    pass
+
+
+class UploadConflict(Exception):
+    """Raised when the uploaded file already exists"""
+    pass
+
+
+class UploadClosed(Exception):
+    """
+    Raised when an upload no longer receives chunks: complete, cancelled, or
+    waiting for another name
+    """
+    pass
+
+
+class Upload(namedtuple(
+        'Upload', 'id user_id path size chunk_size state received')):
+    """
+    An upload in progress. received maps the indexes of the chunks already
+    written to their SHA-256 checksum.
+    """
+
+    __slots__ = ()
+
+    @property
+    def chunks(self):
+        """Number of chunks of the file"""
+        return max(1, -(-self.size // self.chunk_size))
+
+    def get_chunk_length(self, index):
+        if index == self.chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+
+def check_name(name):
+    """Raises InvalidUpload unless name is a valid file name"""
+    if not name or name in (os.curdir, os.pardir) or '/' in name or (
+            '\0' in name or '\\' in name):
+        raise InvalidUpload('Invalid file name')
+    if len(name.encode('utf-8', 'surrogateescape')) > 255:
+        raise InvalidUpload('File name too long')
+
+
+def preallocate(fd, size):
+    """
+    Allocates the blocks of a file, so that a full disk is detected before
+    any chunk is received. Filesystems without fallocate get a sparse file.
+    """
+    if size == 0:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except AttributeError:
+        # Not available on this system
+        os.ftruncate(fd, size)
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        os.ftruncate(fd, size)
+
+
+def pwrite_all(fd, data, offset):
+    """Writes all of data at offset, pwrite may write only part of it"""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class UploadStore(SQLiteStorage):
+    """
+    Uploads in progress: their state in a SQLite database, their data in
+    temporary files
+    """
+
+    schema = SCHEMA
+
+    # Version 2 records the state of uploads
+    version = 2
+
+    def __init__(self, db_path, temp_root, chunk_size=SHARE_UPLOAD_CHUNK_SIZE):
+        super().__init__(db_path)
+        self.temp_root = temp_root
+        self.chunk_size = chunk_size
+
+    def get_temp_path(self, upload_id):
+        return posixpath.join(self.temp_root, upload_id + '.part')
+
+    def start(self, user_id, dirpath, name, size):
+        """
+        Declares the upload of a file of size bytes in directory dirpath,
+        returns the Upload. The unfinished upload of the same file by the
+        same user is resumed, if any.
+        """
+        check_name(name)
+        if size < 0:
+            raise InvalidUpload('Invalid size')
+        path = posixpath.join(dirpath, name)
+        if os.path.lexists(path):
+            raise UploadConflict(path)
+        self.purge()
+
+        row = self.connection.execute(
+            'SELECT id, state FROM uploads'
+            ' WHERE user_id = ? AND path = ? AND size = ?',
+            (user_id, path, size)
+        ).fetchone()
+        if row is not None and row[1] == RECEIVING:
+            upload = self.get(row[0], user_id)
+            if upload is not None:
+                return upload
+        elif row is not None:
+            # Declared again instead of being given another name
+            self.cancel(row[0])
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self.temp_root, exist_ok=True)
+        temp_path = self.get_temp_path(upload_id)
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            preallocate(fd, size)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        finally:
+            os.close(fd)
+
+        with self.connection:
+            # Replaces the record of an upload whose file was lost
+            self.connection.execute(
+                'DELETE FROM uploads WHERE user_id = ? AND path = ?'
+                ' AND size = ?',
+                (user_id, path, size)
+            )
+            self.connection.execute(
+                'INSERT INTO uploads'
+                ' (id, user_id, path, size, chunk_size, state, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    upload_id, user_id, path, size, self.chunk_size,
+                    RECEIVING, time.time()
+                )
+            )
+        return Upload(
+            upload_id, user_id, path, size, self.chunk_size, RECEIVING, {}
+        )
+
+    def get(self, upload_id, user_id):
+        """Returns an upload of a user, None if there is none"""
+        row = self.connection.execute(
+            'SELECT id, user_id, path, size, chunk_size, state FROM uploads'
+            ' WHERE id = ? AND user_id = ?',
+            (upload_id, user_id)
+        ).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(self.get_temp_path(upload_id)):
+            # Removed behind our back
+            self.cancel(upload_id)
+            return None
+        received = dict(self.connection.execute(
+            'SELECT idx, sha256 FROM chunks WHERE upload = ?', (upload_id,)
+        ))
+        return Upload(*row, received=received)
+
+    def write_chunk(self, upload, index, data, sha256):
+        """
+        Writes a chunk of an upload at its offset, once its checksum is
+        verified. Returns the path of the uploaded file if this was the last
+        missing chunk, None otherwise. Raises UploadClosed if the upload no
+        longer receives chunks (a chunk sent again after the last one...).
+        """
+        if not 0 <= index < upload.chunks:
+            raise InvalidUpload('Invalid chunk index')
+        if len(data) != upload.get_chunk_length(index):
+            raise InvalidUpload('Invalid chunk length')
+        sha256 = sha256.lower()
+        if hashlib.sha256(data).hexdigest() != sha256:
+            raise InvalidUpload('Checksum mismatch')
+
+        if not self.connection.execute(
+                'SELECT 1 FROM uploads WHERE id = ? AND state = ?',
+                (upload.id, RECEIVING)).fetchone():
+            raise UploadClosed(upload.id)
+        try:
+            fd = os.open(self.get_temp_path(upload.id), os.O_WRONLY)
+        except FileNotFoundError:
+            # Completed or cancelled by another request meanwhile
+            raise UploadClosed(upload.id)
+        try:
+            pwrite_all(fd, data, index * upload.chunk_size)
+            # The chunk is only recorded once it is on disk
+            getattr(os, 'fdatasync', os.fsync)(fd)
+        finally:
+            os.close(fd)
+
+        with self.connection:
+            if not self.connection.execute(
+                    'UPDATE uploads SET updated_at = ?'
+                    ' WHERE id = ? AND state = ?',
+                    (time.time(), upload.id, RECEIVING)).rowcount:
+                raise UploadClosed(upload.id)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO chunks (upload, idx, sha256)'
+                ' VALUES (?, ?, ?)',
+                (upload.id, index, sha256)
+            )
+            # Only one of the requests sending the last chunks completes
+            # the upload
+            completed = self.connection.execute(
+                'UPDATE uploads SET state = ? WHERE id = ? AND state = ? AND'
+                ' (SELECT COUNT(*) FROM chunks WHERE upload = ?) = ?',
+                (FINISHING, upload.id, RECEIVING, upload.id, upload.chunks)
+            ).rowcount
+        if not completed:
+            return None
+        return self.finish(upload)
+
+    def rename(self, upload, name):
+        """
+        Moves the file of an upload whose name was taken into place under
+        another name, in the same directory. Returns the path of the file.
+        """
+        check_name(name)
+        path = posixpath.join(posixpath.dirname(upload.path), name)
+        try:
+            with self.connection:
+                claimed = self.connection.execute(
+                    'UPDATE uploads SET path = ?, state = ?, updated_at = ?'
+                    ' WHERE id = ? AND state = ?',
+                    (path, FINISHING, time.time(), upload.id, CONFLICT)
+                ).rowcount
+        except sqlite3.IntegrityError:
+            # The same file is being uploaded under this name
+            raise UploadConflict(path)
+        if not claimed:
+            raise UploadClosed(upload.id)
+        return self.finish(upload._replace(path=path))
+
+    def finish(self, upload):
+        """
+        Moves the file of a complete upload into place, returns its path. If
+        the name is taken, the upload waits for another one (see rename).
+        """
+        temp_path = self.get_temp_path(upload.id)
+        try:
+            os.chmod(temp_path, FILE_MODE)
+            try:
+                # Unlike a rename, a link never replaces an existing file
+                os.link(temp_path, upload.path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Temporary files on another filesystem: copied next to
+                # the destination first
+                self.copy_into_place(temp_path, upload.path)
+        except FileExistsError:
+            with self.connection:
+                self.connection.execute(
+                    'UPDATE uploads SET state = ? WHERE id = ?',
+                    (CONFLICT, upload.id)
+                )
+            raise UploadConflict(upload.path)
+        except Exception:
+            self.cancel(upload.id)
+            raise
+        self.cancel(upload.id)
+        return upload.path
+
+    def copy_into_place(self, temp_path, path):
+        dirname, name = posixpath.split(path)
+        fd, copy_path = tempfile.mkstemp(
+            dir=dirname, prefix='.' + name + '.', suffix='.part'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f, open(temp_path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(copy_path, FILE_MODE)
+            os.link(copy_path, path)
+        finally:
+            os.remove(copy_path)
+
+    def cancel(self, upload_id):
+        """Forgets an upload and removes its temporary file"""
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM uploads WHERE id = ?', (upload_id,)
+            )
+            self.connection.execute(
+                'DELETE FROM chunks WHERE upload = ?', (upload_id,)
+            )
+        try:
+            os.remove(self.get_temp_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def purge(self, max_age=UPLOAD_EXPIRATION):
+        """
+        Cancels the uploads without new chunk for max_age seconds, and
+        removes the temporary files of forgotten uploads as old
+        """
+        expired_at = time.time() - max_age
+        expired = self.connection.execute(
+            'SELECT id FROM uploads WHERE updated_at < ?', (expired_at,)
+        ).fetchall()
+        for upload_id, in expired:
+            self.cancel(upload_id)
+
+        try:
+            names = os.listdir(self.temp_root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            upload_id, ext = posixpath.splitext(name)
+            temp_path = posixpath.join(self.temp_root, name)
+            try:
+                if ext != '.part' or (
+                        os.stat(temp_path).st_mtime >= expired_at):
+                    continue
+                if not self.connection.execute(
+                        'SELECT 1 FROM uploads WHERE id = ?',
+                        (upload_id,)).fetchone():
+                    os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+
+upload_store = UploadStore(
+    posixpath.join(SHARE_CACHE_ROOT, 'uploads.sqlite3'),
+    SHARE_UPLOAD_TEMP_ROOT
+)
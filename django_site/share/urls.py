@@ -4,4 +4,16 @@ from share import views
 
 urlpatterns = patterns('',
     url(r'^browse/(?P<path>.*)$', views.browse, name='browse'),
+    url(r'^list/(?P<path>.*)$', views.listing, name='list'),
+    url(r'^search/(?P<path>.*)$', views.search, name='search'),
+    url(r'^thumbnail/(?P<path>.*)$', views.thumbnail, name='thumbnail'),
+    url(r'^link/(?P<path>.*)$', views.link, name='link'),
+    url(r'^changes/(?P<path>.*)$', views.changes, name='changes'),
+    url(r'^checksums/(?P<path>.*)$', views.checksums, name='checksums'),
+    url(r'^archive/(?P<path>.*)$', views.archive, name='archive'),
+    url(r'^upload/(?P<path>.*)$', views.upload, name='upload'),
+    url(r'^uploads/(?P<upload_id>[0-9a-f]{32})$', views.upload_detail,
+        name='upload_detail'),
+    url(r'^uploads/(?P<upload_id>[0-9a-f]{32})/(?P<index>\d+)$',
+        views.upload_chunk, name='upload_chunk'),
 )
@@ -1,70 +1,140 @@
-import os.path
+from collections import OrderedDict
+import os
 import posixpath
-import sys
+import stat
+import threading
 try:
-    import magic
+    from os import scandir
 except ImportError:
-    import mimetypes
+    # Python < 3.5
+    from scandir import scandir
 
+from share.index import IndexEntry, share_index
+from share.mime import mime_type_cache
 from share.settings import SHARE_ROOT
 
 
+# Number of resolved URL paths remembered
+PATH_CACHE_SIZE = 10000
+
+
 # Classes
+class memoized:
+    """
+    A read-only property computed on first access only. The result is stored
+    in the '_<name>' slot of the instance.
+    """
+    
+    def __init__(self, func):
+        self.func = func
+        self.slot = '_' + func.__name__
+        self.__doc__ = func.__doc__
+    
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            # Slot not set yet
+            value = self.func(instance)
+            setattr(instance, self.slot, value)
+            return value
+
+
 class FileSystemNode:
     """
     A mapping between a physical directory in the shared folder and metadata
     informations useful for template display.
+    
+    Only the node type is known on creation: other attributes are computed
+    on first access, so that listings only pay for what templates display.
     """
     
-    def __init__(self, path, set_children=True):
+    __slots__ = (
+        'path', 'isdir', '_mtime', '_size', '_display_path', '_url',
+        '_parent_url', '_mime_type', '_children'
+    )
+    
+    # Unlike the members of archives (see share.members)
+    in_archive = False
+    
+    def __init__(self, path, set_children=True, entry=None):
         self.path = path
-        self.isfile = os.path.isfile(path)
-        self.isdir = os.path.isdir(path)
-        self.isroot = (path == SHARE_ROOT)
+        if entry is None:
+            entry = stat_entry(path, os.stat(path))
+        # Metadata already known from the parent listing or the share index
+        self.isdir = entry.isdir
+        if entry.mtime is not None:
+            self._mtime = entry.mtime
+        if entry.size is not None:
+            self._size = entry.size
+        if not set_children:
+            self._children = []
+    
+    @property
+    def isfile(self):
+        return not self.isdir
+    
+    @property
+    def isroot(self):
+        return self.path == SHARE_ROOT
+    
+    @property
+    def name(self):
+        return 'share' if self.isroot else posixpath.basename(self.path)
+    
+    @memoized
+    def display_path(self):
         if self.isroot:
-            self.name = 'share'
-            self.display_path = '/'
-        else:
-            self.name = os.path.basename(path)
-            self.display_path = (
-                posixpath.join('/', posixpath.relpath(path, start=SHARE_ROOT))
-            )
-        self.size = self.get_size()
-        self.url = self.build_url()
-        self.parent_url = self.build_parent_url()
-        if self.isfile:
-            self.mime_type = self.get_mime_type()
-            self.children = []
-        else:
-            self.mime_type = None
-            if set_children:
-                self.children = self.get_children()
-            else:
-                self.children = []
+            return '/'
+        return posixpath.join('/', posixpath.relpath(self.path, SHARE_ROOT))
+    
+    @memoized
+    def mtime(self):
+        """
+        Gets the last modification time, in nanoseconds
+        """
+        st = os.stat(self.path)
+        if not self.isdir:
+            # Spares another stat call if the size is needed too
+            self._size = st.st_size
+        return st.st_mtime_ns
     
-    def get_size(self):
+    @memoized
+    def size(self):
         """
         Gets the folder or file total size (including sub dirs and files)
         """
-        total_size = 0
         if self.isdir:
-            for dirpath, dirnames, filenames in os.walk(self.path):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    total_size += os.path.getsize(fp)
-        else:
-            total_size = os.path.getsize(self.path)
-        
-        return total_size
-        
-    def build_url(self):
+            return share_index.get_dir_size(self.path, self.mtime)
+        # Listed without stat call: the size comes with the mtime
+        self.mtime
+        return self._size
+    
+    @property
+    def metadata_known(self):
+        """Whether the mtime and size are known, without any stat call"""
+        return hasattr(self, '_mtime') and hasattr(self, '_size')
+    
+    def set_metadata(self, mtime, size):
+        """
+        Sets the mtime and size read by another thread, None while they are
+        still being computed
+        """
+        self._mtime = mtime
+        self._size = size
+    
+    @memoized
+    def url(self):
         relative_url = self.display_path.lstrip('/')
         # URL has trailing slash for directories
         if not self.isroot and self.isdir:
             relative_url += '/'
         return relative_url
-
-    def build_parent_url(self):
+    
+    @memoized
+    def parent_url(self):
         if self.isroot:
             return None
         else:
@@ -72,32 +142,70 @@ class FileSystemNode:
             if relative_url != '':
                 relative_url += '/'
             return relative_url
-
-    def get_mime_type(self):
-        if 'magic' in sys.modules:
-            mimetype = magic.from_file(self.path, mime=True).decode('utf-8')
-        else:
-            mimetype, encoding = mimetypes.guess_type(self.path)
-        if not mimetype:
-            mimetype = 'application/octet-stream'
-        return mimetype
-        
-    def get_children(self):
+    
+    @memoized
+    def mime_type(self):
+        if self.isfile:
+            return mime_type_cache.get(self.path)
+        return None
+    
+    @memoized
+    def children(self):
         child_dirs, child_files = [], []
-        for child in sorted(os.listdir(self.path), key=str.lower):
-            abspath = posixpath.join(self.path, child)
-            if os.path.isdir(abspath):
-                child_dirs.append(FileSystemNode(abspath, set_children=False))
-            if os.path.isfile(abspath):
-                child_files.append(FileSystemNode(abspath, set_children=False))
+        children = sorted(self.iter_children(), key=lambda c: c.name.lower())
+        for child in children:
+            if child.isdir:
+                child_dirs.append(child)
+            else:
+                child_files.append(child)
         
         return child_dirs + child_files
     
+    def iter_children(self):
+        """
+        Yields the child nodes, in no particular order
+        """
+        if self.isfile:
+            return
+        
+        # If the index is kept live by the watcher, no need to list the dir
+        entries = share_index.list_dir(self.path)
+        if entries is None:
+            entries = scan_dir(self.path)
+        
+        for entry in entries:
+            abspath = posixpath.join(self.path, entry.name)
+            yield FileSystemNode(abspath, entry=entry)
+    
 
 # Helpers
-def get_physical_path(path):
+def stat_entry(path, st):
     """
-    Converts the path exracted from the URL to a physical path (if path exists)
+    Builds the IndexEntry of a file or directory from its stat result. The
+    size of directories is left to be looked up in the index.
+    """
+    isdir = stat.S_ISDIR(st.st_mode)
+    size = None if isdir else st.st_size
+    return IndexEntry(posixpath.basename(path), isdir, size, st.st_mtime_ns)
+
+
+def scan_dir(path):
+    """
+    Yields the IndexEntry of the files and directories in path. Their type
+    comes from the directory listing itself: sizes and mtimes are left
+    unknown, so that they cost a stat call only if they are needed.
+    """
+    for dir_entry in scandir(path):
+        # Broken symbolic links are neither files nor directories
+        isdir = dir_entry.is_dir()
+        if isdir or dir_entry.is_file():
+            yield IndexEntry(dir_entry.name, isdir, None, None)
+
+
+def clean_path(path):
+    """
+    Converts a path extracted from a URL to a physical path below SHARE_ROOT,
+    whether it exists or not
     """
     
     # Clean up given path to only allow serving files below SHARE_ROOT
@@ -116,9 +224,96 @@ def get_physical_path(path):
             continue
         # Append segment to file path, posix-style
         filepath = posixpath.join(filepath, segment)
-    filepath = posixpath.normpath(posixpath.join(SHARE_ROOT, filepath))
-    
-    if os.path.isdir(filepath) or os.path.isfile(filepath):
-        return filepath
-    else:
+    return posixpath.normpath(posixpath.join(SHARE_ROOT, filepath))
+
+
+def get_dir_validator(path):
+    """
+    Returns what changes when entries are added to, removed from or renamed
+    in a directory, or when the directory itself is replaced
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
         return None
+    return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+
+class PathResolver:
+    """
+    Converts URL paths to physical paths, remembering the most recently
+    resolved ones. A remembered path costs a single stat call, of its parent
+    directory: it is trusted as long as this directory did not change.
+    
+    Symbolic links are never remembered, their target may change without
+    their directory.
+    """
+    
+    def __init__(self, max_entries=PATH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def resolve(self, path):
+        """
+        Returns the physical path of a URL path and whether it is a
+        directory, or (None, None) if there is no such file or directory
+        """
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None:
+                self._cache.move_to_end(path)
+        if cached is not None:
+            filepath, isdir, parent, validator = cached
+            if get_dir_validator(parent) == validator:
+                return filepath, isdir
+        
+        filepath = clean_path(path)
+        parent = filepath
+        if filepath != SHARE_ROOT:
+            parent = posixpath.dirname(filepath)
+        # Before the path itself: a change in between is caught next time
+        validator = get_dir_validator(parent)
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None, None
+        isdir = stat.S_ISDIR(st.st_mode)
+        if not isdir and not stat.S_ISREG(st.st_mode):
+            return None, None
+        
+        if validator is not None and (
+                parent == filepath or not os.path.islink(filepath)):
+            with self._lock:
+                self._cache[path] = (filepath, isdir, parent, validator)
+                self._cache.move_to_end(path)
+                if len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return filepath, isdir
+    
+    def get_node(self, path):
+        """
+        Returns the FileSystemNode of a URL path, or None if there is no
+        such file or directory
+        """
+        filepath, isdir = self.resolve(path)
+        if filepath is None:
+            return None
+        # Metadata are left to be read when needed
+        entry = IndexEntry(posixpath.basename(filepath), isdir, None, None)
+        return FileSystemNode(filepath, entry=entry)
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+path_resolver = PathResolver()
+
+
+def get_physical_path(path):
+    """
+    Converts the path exracted from the URL to a physical path (if path exists)
+    """
+    filepath, isdir = path_resolver.resolve(path)
+    return filepath
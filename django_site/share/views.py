@@ -1,78 +1,636 @@
-from django.core.servers.basehttp import FileWrapper
+from django.conf import settings as django_settings
 from django.core.urlresolvers import reverse
 from django.http import (
     HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
     HttpResponseRedirect,
     HttpResponsePermanentRedirect,
-    Http404
+    Http404,
+    JsonResponse
 )
 from django.shortcuts import render
-from django.utils.http import urlquote
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag, urlencode
 from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_http_methods
 
-from madmox_website import settings
-from share.utils import (
-    FileSystemNode,
-    get_physical_path
+import errno
+from functools import wraps
+import hashlib
+import os
+import posixpath
+
+from share import settings
+from share.archives import serve_archive
+from share.checksums import checksum_cache
+from share.downloads import send_file
+from share.index import (
+    CHANGES_LIMIT,
+    MAX_CHANGES_LIMIT,
+    SEARCH_LIMIT,
+    share_index
+)
+from share.links import LINK_AGE, make_link
+from share.listing import list_page, parse_query
+from share.members import get_archive_url, get_member_node, serve_member
+from share.metadata import get_deadline
+from share.serving import is_etag_matched, serve_file
+from share.streaming import stream_listing
+from share.templatetags.share_filters import print_size
+from share.thumbnails import (
+    get_thumbnail_url,
+    is_image,
+    pregenerate,
+    thumbnail_cache
+)
+from share.uploads import (
+    CONFLICT,
+    InvalidUpload,
+    UploadClosed,
+    UploadConflict,
+    upload_store
 )
+from share.settings import SHARE_ROOT
+from share.utils import FileSystemNode, path_resolver
 
 
-# Views
-@cache_control(no_cache=True, no_store=True, must_revalidate=True)
-def browse(request, path):
-    if request.user.has_perm('share.can_browse'):
-        # Convert URL path to physical path
-        filepath = get_physical_path(path)
-        
-        # Path does not exist: 404
-        if filepath is None:
-            raise Http404()
-        
-        node = FileSystemNode(filepath)
-        if node.isdir:
-            # Path is a directory: display child nodes
-            if (node.url != path):
-                url = reverse('share:browse', args=(node.url,))
-                return HttpResponsePermanentRedirect(url)
+# Decorators
+def can_browse_required(url_name):
+    """
+    Only lets users with the 'share.can_browse' permission through. Anonymous
+    users are redirected to the login page, others get the unauthorized page.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, path):
+            if request.user.has_perm('share.can_browse'):
+                return view(request, path)
+            elif not request.user.is_authenticated():
+                url = '{0}?next={1}'.format(
+                    reverse('accounts:login'),
+                    reverse(url_name, args=(path,))
+                )
+                return HttpResponseRedirect(url)
             else:
                 return render(
                     request,
                     'share/browse.html',
                     {
-                        'authorized': True,
-                        'current_directory': node
+                        'authorized': False,
+                        'current_directory': None
                     }
                 )
-        else:
-            if settings.RUNNING_DEVSERVER:
-                # In dev, let django upload the file itself
-                fsock = open(filepath, 'rb')
-                fwrapper = FileWrapper(fsock)
-                response = HttpResponse(fwrapper, content_type=node.mime_type)
-            else:
-                # Apache mod-xsendfile intercepts the X-SendFile header and
-                # processes the upload itself
-                response = HttpResponse(content_type=node.mime_type)
-                response['X-SendFile'] = urlquote(filepath)
-            response['Content-Disposition'] = (
-                'attachment; filename="{0}"'
-            ).format(node.name)
-            
-            # Dev: let the garbage collector close the file,
-            # otherwise the transfer gets corrupted
-            return response
-    elif not request.user.is_authenticated():
-        url = '{0}?next={1}'.format(
-            reverse('accounts:login'),
-            reverse('share:browse', args=(path,))
+        return wrapper
+    return decorator
+
+
+def no_store_unless_private(view):
+    """
+    Forbids any cache to store the responses of a view, but those it lets
+    the user keep in a private cache
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if 'private' not in response.get('Cache-Control', ''):
+            patch_cache_control(
+                response, no_cache=True, no_store=True, must_revalidate=True
+            )
+        return response
+    return wrapper
+
+
+def can_upload_required(view):
+    """
+    Only lets users with both the 'share.can_browse' and 'share.can_upload'
+    permissions through, others get a '403 Forbidden' response: the upload
+    API is not meant to be browsed.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.user.has_perms(('share.can_browse', 'share.can_upload')):
+            return view(request, *args, **kwargs)
+        return HttpResponseForbidden()
+    return wrapper
+
+
+# Helpers
+def get_upload_state(upload):
+    return {
+        'id': upload.id,
+        # Chunks are sent to <url>/<index>
+        'url': reverse('share:upload_detail', args=(upload.id,)),
+        'name': posixpath.basename(upload.path),
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunks': upload.chunks,
+        # Complete, but the name is taken: another one must be posted
+        'conflict': upload.state == CONFLICT,
+        # JSON keys are strings
+        'received': dict(
+            (str(index), checksum)
+            for index, checksum in upload.received.items()
         )
-        return HttpResponseRedirect(url)
-    else:
-        return render(
-            request,
-            'share/browse.html',
-            {
-                'authorized': False,
-                'current_directory': None
+    }
+
+
+def get_upload_result(path):
+    """Tells whether an upload is complete, with the URL of its file"""
+    if path is None:
+        return JsonResponse({'complete': False, 'url': None})
+    return JsonResponse({
+        'complete': True,
+        'url': reverse('share:browse', args=(FileSystemNode(path).url,))
+    })
+
+
+def get_listing_etag(request, path):
+    """
+    Returns the ETag of the listing of a directory by the user, from its
+    URL path, without reading the directory. None if it can't be validated:
+    path is not a directory URL, or no watcher keeps the share index up to
+    date (files could change without the index knowing).
+    """
+    filepath, isdir = path_resolver.resolve(path)
+    if not isdir:
+        return None
+    if filepath != SHARE_ROOT and (
+            path != posixpath.relpath(filepath, SHARE_ROOT) + '/'):
+        # Redirected to the directory URL
+        return None
+    generation = share_index.get_generation()
+    if generation is None:
+        return None
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    # Everything the page depends on: the entries below the directory, the
+    # view and its query, and what the user may do with them
+    validator = '\0'.join(str(part) for part in (
+        st.st_ino, st.st_mtime_ns, generation, request.get_full_path(),
+        request.user.pk, request.user.has_perm('share.can_upload'),
+        request.COOKIES.get(django_settings.CSRF_COOKIE_NAME, ''),
+        settings.SHARE_CHECKSUMS
+    ))
+    return quote_etag(
+        hashlib.sha1(validator.encode('utf-8', 'surrogateescape')).hexdigest()
+    )
+
+
+def cache_privately(response, etag):
+    """
+    Lets the user keep a listing in a private cache, revalidated with its
+    ETag if any
+    """
+    if etag is not None:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# Views
+@no_store_unless_private
+@can_browse_required('share:browse')
+def browse(request, path):
+    deadline = get_deadline()
+    # Unchanged listing: the directory is not even read
+    etag = get_listing_etag(request, path)
+    if etag is not None and is_etag_matched(request, etag):
+        return cache_privately(HttpResponseNotModified(), etag)
+
+    # Convert URL path to a node
+    node = path_resolver.get_node(path)
+    if node is None or (node.isfile and path.endswith('/')):
+        # An archive browsed as a directory, or one of its members
+        node = get_member_node(path) or node
+
+    # Path does not exist: 404
+    if node is None:
+        raise Http404()
+
+    if node.isdir:
+        # Path is a directory: display child nodes
+        if (node.url != path):
+            url = reverse('share:browse', args=(node.url,))
+            return HttpResponsePermanentRedirect(url)
+
+        try:
+            sort, order, cursor, limit = parse_query(request.GET)
+        except ValueError:
+            return HttpResponseBadRequest()
+
+        grid = request.GET.get('view') == 'grid'
+        if grid and not node.in_archive:
+            # Thumbnails are generated while the page loads
+            pregenerate(node.path)
+
+        context = {
+            'authorized': True,
+            'current_directory': node,
+            'grid': grid,
+            'checksums': settings.SHARE_CHECKSUMS,
+            'can_upload': not node.in_archive and (
+                request.user.has_perm('share.can_upload')
+            )
+        }
+        if request.GET.get('stream'):
+            # The whole directory, sent while it is scanned
+            return cache_privately(stream_listing(
+                request, 'share/browse.html', context, node, grid
+            ), etag)
+
+        # A single page is rendered, the next ones are loaded from the
+        # listing API (or followed as links without JavaScript)
+        children, next_cursor = list_page(
+            node, sort, order, cursor, limit, deadline
+        )
+        if any(child.size is None for child in children):
+            # Sizes still being computed must not be kept
+            etag = None
+        next_query = None
+        if next_cursor is not None:
+            next_query = {
+                'sort': sort,
+                'order': order,
+                'cursor': next_cursor,
+                'limit': limit
             }
+            if grid:
+                next_query['view'] = 'grid'
+            next_query = urlencode(next_query)
+        context['children'] = children
+        context['next_query'] = next_query
+        return cache_privately(
+            render(request, 'share/browse.html', context), etag
+        )
+    elif node.in_archive:
+        return serve_member(request, node)
+    else:
+        response = send_file(request, node.path, node.mime_type)
+        response['Content-Disposition'] = (
+            'attachment; filename="{0}"'
+        ).format(node.name)
+        return response
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@can_browse_required('share:archive')
+def archive(request, path):
+    """Downloads a whole directory as a ZIP archive"""
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if not node.isdir:
+        raise Http404()
+
+    return serve_archive(request, node)
+
+
+@no_store_unless_private
+@can_browse_required('share:list')
+def listing(request, path):
+    """
+    Lists a directory page by page, as JSON. The 'sort' ('name', 'size' or
+    'mtime'), 'order' ('asc' or 'desc') and 'limit' query parameters apply
+    to the first page, the 'next' cursor it returns gives the next one.
+    Sizes and mtimes still being computed are null.
+    """
+    deadline = get_deadline()
+    etag = get_listing_etag(request, path)
+    if etag is not None and is_etag_matched(request, etag):
+        return cache_privately(HttpResponseNotModified(), etag)
+    node = path_resolver.get_node(path)
+    if node is None or (node.isfile and path.endswith('/')):
+        node = get_member_node(path) or node
+    if node is None:
+        raise Http404()
+
+    if not node.isdir:
+        raise Http404()
+
+    try:
+        sort, order, cursor, limit = parse_query(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    children, next_cursor = list_page(
+        node, sort, order, cursor, limit, deadline
+    )
+    if any(child.size is None for child in children):
+        # Sizes still being computed must not be kept
+        etag = None
+    entries = []
+    for child in children:
+        entry = {
+            'name': child.name,
+            'url': reverse('share:browse', args=(child.url,)),
+            'isdir': child.isdir,
+            'size': child.size,
+            'display_size': print_size(child.size),
+            # Milliseconds, as JavaScript dates
+            'mtime': None if child.mtime is None else child.mtime // 10 ** 6
+        }
+        if request.GET.get('view') == 'grid':
+            entry['thumbnail'] = get_thumbnail_url(child)
+        archive_url = get_archive_url(child)
+        if archive_url is not None:
+            entry['archive_url'] = archive_url
+        entries.append(entry)
+    return cache_privately(JsonResponse({
+        'path': node.display_path,
+        'sort': sort,
+        'order': order,
+        'limit': limit,
+        'entries': entries,
+        'next': next_cursor
+    }), etag)
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@can_browse_required('share:search')
+def search(request, path):
+    """
+    Searches the share index for the files and directories below path whose
+    name contains the 'q' query parameter, or starts with it if 'prefix' is
+    set
+    """
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if not node.isdir:
+        raise Http404()
+
+    query = request.GET.get('q', '').strip()
+    prefix = bool(request.GET.get('prefix'))
+    results = []
+    if query:
+        # One more result tells whether some were left out
+        for relpath, entry in share_index.search(
+                query, node.path, prefix, SEARCH_LIMIT + 1):
+            results.append(FileSystemNode(
+                posixpath.join(share_index.root, relpath), entry=entry
+            ))
+
+    return render(
+        request,
+        'share/search.html',
+        {
+            'authorized': True,
+            'current_directory': node,
+            'query': query,
+            'prefix': prefix,
+            'results': results[:SEARCH_LIMIT],
+            'truncated': len(results) > SEARCH_LIMIT
+        }
+    )
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@can_browse_required('share:link')
+def link(request, path):
+    """
+    Makes a signed download link of a file, valid for the 'age' query
+    parameter (in seconds, one day by default), as JSON. Anyone holding the
+    link can download the file until it expires.
+    """
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if node.isdir:
+        raise Http404()
+
+    try:
+        age = int(request.GET.get('age', LINK_AGE))
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not 0 < age <= settings.SHARE_LINK_MAX_AGE:
+        return HttpResponseBadRequest()
+
+    url, expires = make_link(node.url, age)
+    return JsonResponse({
+        'url': request.build_absolute_uri(url),
+        'expires': expires
+    })
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@can_browse_required('share:changes')
+def changes(request, path):
+    """
+    Lists the files and directories below path added, modified or removed
+    since the 'token' query parameter, as JSON, for mirrors of the share.
+    The 'token' returned must be given next time. If 'reset' is true, the
+    token was missing or too old: the changes list all the current entries,
+    and the mirror must drop the others. If 'more' is true, more changes
+    are to be fetched right away with the new token.
+    """
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if not node.isdir:
+        raise Http404()
+
+    try:
+        limit = int(request.GET.get('limit', CHANGES_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not 0 < limit <= MAX_CHANGES_LIMIT:
+        return HttpResponseBadRequest()
+
+    page, token, reset, more = share_index.get_changes(
+        request.GET.get('token') or None, node.path, limit
+    )
+    entries = []
+    for relpath, entry in page:
+        if entry is None:
+            entries.append({'path': relpath, 'deleted': True})
+            continue
+        url = relpath + '/' if entry.isdir else relpath
+        entries.append({
+            'path': relpath,
+            'deleted': False,
+            'url': reverse('share:browse', args=(url,)),
+            'isdir': entry.isdir,
+            # Unknown for links to directories
+            'size': entry.size,
+            # Milliseconds, as in listings
+            'mtime': None if entry.mtime is None else entry.mtime // 10 ** 6
+        })
+    return JsonResponse({
+        'token': token,
+        'reset': reset,
+        'more': more,
+        'changes': entries
+    })
+
+
+@no_store_unless_private
+@can_browse_required('share:thumbnail')
+def thumbnail(request, path):
+    """
+    Serves the thumbnail of an image. Thumbnails are kept by browsers for a
+    year: their URL changes with the image (see get_thumbnail_url).
+    """
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if node.isdir or not is_image(node.mime_type):
+        raise Http404()
+
+    thumbnail_path = thumbnail_cache.get(node.path)
+    if thumbnail_path is None:
+        # Unreadable image
+        raise Http404()
+    response = serve_file(request, thumbnail_path, 'image/jpeg')
+    if response.status_code in (200, 206, 304):
+        patch_cache_control(response, private=True, max_age=365 * 24 * 3600)
+    return response
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@can_browse_required('share:checksums')
+def checksums(request, path):
+    """
+    Lists the SHA-256 checksums of the files of a directory (or of a single
+    file), in the format of sha256sum. Checksums being computed are left out
+    of a '202 Accepted' response: the client should come back later. Those of
+    files that could not be read are left out of a complete response.
+    """
+    if not settings.SHARE_CHECKSUMS:
+        raise Http404()
+
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if node.isdir:
+        known_checksums, pending = checksum_cache.get_dir(node.path)
+    else:
+        checksum = checksum_cache.get(node.path)
+        # Left out if it could not be computed (empty string)
+        known_checksums = {node.name: checksum} if checksum else {}
+        pending = 1 if checksum is None else 0
+
+    response = HttpResponse(
+        ''.join(
+            '{0}  {1}\n'.format(checksum, name)
+            for name, checksum in sorted(known_checksums.items())
+        ),
+        content_type='text/plain; charset=utf-8',
+        status=202 if pending else 200
+    )
+    if pending:
+        response['Retry-After'] = '10'
+    return response
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@require_http_methods(['POST'])
+@can_upload_required
+def upload(request, path):
+    """
+    Starts the upload of a file into a directory, or resumes it. The 'name'
+    and 'size' (in bytes) of the file are posted, the JSON response gives
+    the upload id, the chunk size and the checksums of the chunks already
+    received, by index.
+    """
+    node = path_resolver.get_node(path)
+    if node is None:
+        raise Http404()
+
+    if not node.isdir:
+        raise Http404()
+
+    try:
+        name = request.POST['name']
+        size = int(request.POST['size'])
+        upload = upload_store.start(request.user.pk, node.path, name, size)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest()
+    except UploadConflict:
+        return HttpResponse(status=409)
+    except OSError as e:
+        if e.errno not in (errno.ENOSPC, errno.EDQUOT):
+            raise
+        # Insufficient Storage
+        return HttpResponse(status=507)
+    return JsonResponse(get_upload_state(upload))
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@require_http_methods(['GET', 'POST', 'DELETE'])
+@can_upload_required
+def upload_detail(request, upload_id):
+    """
+    Gives the state of an upload (GET), or cancels it (DELETE). A complete
+    upload whose name was taken is moved into place under the posted 'name'
+    (POST), the JSON response is then the one of the last chunk.
+    """
+    upload = upload_store.get(upload_id, request.user.pk)
+    if upload is None:
+        raise Http404()
+
+    if request.method == 'DELETE':
+        upload_store.cancel(upload.id)
+        return HttpResponse(status=204)
+    elif request.method == 'POST':
+        try:
+            path = upload_store.rename(upload, request.POST['name'])
+        except (KeyError, InvalidUpload):
+            return HttpResponseBadRequest()
+        except UploadConflict:
+            return HttpResponse(status=409)
+        except UploadClosed:
+            raise Http404()
+        except OSError as e:
+            if e.errno not in (errno.ENOSPC, errno.EDQUOT):
+                raise
+            # Insufficient Storage
+            return HttpResponse(status=507)
+        return get_upload_result(path)
+    return JsonResponse(get_upload_state(upload))
+
+
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+@require_http_methods(['PUT'])
+@can_upload_required
+def upload_chunk(request, upload_id, index):
+    """
+    Receives a chunk of an upload, whose SHA-256 checksum is given by the
+    'X-Chunk-SHA256' header. Chunks can be sent in any order, and again if
+    their checksum did not match. The JSON response tells whether the upload
+    is complete, with the URL of the file if so.
+    """
+    upload = upload_store.get(upload_id, request.user.pk)
+    if upload is None:
+        raise Http404()
+
+    checksum = request.META.get('HTTP_X_CHUNK_SHA256')
+    if not checksum:
+        return HttpResponseBadRequest()
+    try:
+        path = upload_store.write_chunk(
+            upload, int(index), request.body, checksum
         )
+    except InvalidUpload:
+        return HttpResponseBadRequest()
+    except UploadConflict:
+        # The upload waits for another name
+        return HttpResponse(status=409)
+    except UploadClosed:
+        # Complete or cancelled, a chunk sent again for instance
+        raise Http404()
+    except OSError as e:
+        if e.errno not in (errno.ENOSPC, errno.EDQUOT):
+            raise
+        # Insufficient Storage
+        return HttpResponse(status=507)
+    return get_upload_result(path)
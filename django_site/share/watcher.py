@@ -0,0 +1,215 @@
+"""
+Filesystem watcher keeping the share index live.
+
+On Linux, inotify watches every directory below SHARE_ROOT and each event is
+applied incrementally to the index (see ShareIndex.apply_change). While the
+watcher runs, it sends heartbeats to the index so web processes serve
+listings and sizes straight from it.
+
+If inotify is not available, the watch limit is exhausted or the event queue
+overflows, the watcher falls back to rescanning the modified directories of
+the share instead. Files rewritten in place do not modify their directory:
+they are only found by full rescans, reading every directory of the share,
+run every SHARE_FULL_RESCAN_INTERVAL. Heartbeats go on during these rescans,
+however long they take.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import posixpath
+import select
+import struct
+import time
+
+from share.index import share_index, WATCHER_HEARTBEAT
+from share.settings import SHARE_FULL_RESCAN_INTERVAL, SHARE_RESCAN_INTERVAL
+
+
+logger = logging.getLogger(__name__)
+
+# inotify constants, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+    IN_DELETE | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class WatchLimitExceeded(Exception):
+    """Raised when fs.inotify.max_user_watches is reached"""
+    pass
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            self._raise_errno()
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise_errno(path)
+        return wd
+
+    def read_events(self, timeout):
+        """
+        Waits at most timeout seconds for events and returns them as a list
+        of (watch descriptor, mask, name) tuples
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+    def _raise_errno(self, path=None):
+        error = ctypes.get_errno()
+        if error == errno.ENOSPC:
+            raise WatchLimitExceeded(path)
+        raise OSError(error, os.strerror(error), path)
+
+
+class ShareWatcher:
+    """
+    Keeps an index up to date with inotify events, or with periodic rescans
+    when inotify can't be used
+    """
+
+    def __init__(self, index=share_index, rescan_interval=SHARE_RESCAN_INTERVAL,
+                 full_rescan_interval=SHARE_FULL_RESCAN_INTERVAL):
+        self.index = index
+        self.rescan_interval = rescan_interval
+        self.full_rescan_interval = full_rescan_interval
+        self.inotify = None
+        self.watches = {}
+
+    def run(self):
+        try:
+            self.inotify = Inotify()
+            # Watches are set before the initial scan so no change is missed
+            self.watch_tree(self.index.root)
+        except (OSError, WatchLimitExceeded) as e:
+            logger.warning(
+                'Cannot watch the share (%s), falling back to rescans', e
+            )
+            self.close()
+            self.poll()
+            return
+
+        try:
+            self.update()
+            self.index.heartbeat()
+            self.watch()
+        except WatchLimitExceeded:
+            logger.warning('Watch limit exhausted, falling back to rescans')
+            self.index.stop_heartbeat()
+            self.close()
+            self.poll()
+        finally:
+            self.index.stop_heartbeat()
+            self.close()
+
+    def watch(self):
+        """Applies inotify events to the index until interrupted"""
+        last_heartbeat = time.time()
+        while True:
+            changed_paths = set()
+            for wd, mask, name in self.inotify.read_events(WATCHER_HEARTBEAT):
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: start over
+                    logger.warning('inotify queue overflow, rescanning')
+                    changed_paths.clear()
+                    self.watch_tree(self.index.root)
+                    self.update(keep_alive=True)
+                    break
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                dirname = self.watches.get(wd)
+                if dirname is None or not name:
+                    continue
+                path = posixpath.join(dirname, name)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch_tree(path)
+                changed_paths.add(path)
+
+            # Successive events on a file are applied once
+            for path in sorted(changed_paths):
+                self.index.apply_change(path)
+
+            if time.time() - last_heartbeat >= WATCHER_HEARTBEAT / 2:
+                if self.is_full_update_due():
+                    # Catches the changes of lost events
+                    self.index.update(full=True, keep_alive=True)
+                self.index.heartbeat()
+                last_heartbeat = time.time()
+
+    def watch_tree(self, path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            try:
+                self.watches[self.inotify.add_watch(dirpath)] = dirpath
+            except FileNotFoundError:
+                # Removed in the meantime, the event will follow
+                pass
+
+    def poll(self):
+        """Rescans the share periodically, until interrupted"""
+        while True:
+            self.update()
+            time.sleep(self.rescan_interval)
+
+    def is_full_update_due(self):
+        last_update = self.index.get_full_update_time()
+        return (
+            last_update is None or
+            time.time() - last_update >= self.full_rescan_interval
+        )
+
+    def update(self, keep_alive=False):
+        """
+        Rescans the modified directories of the share, or all of them if the
+        last full rescan is too old. If keep_alive is True, heartbeats are
+        sent during the rescan (see ShareIndex.update).
+        """
+        self.index.update(
+            full=self.is_full_update_due(), keep_alive=keep_alive
+        )
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+        self.watches = {}